@@ -0,0 +1,79 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Microbenchmark of the binary format against the plain one
+
+Writes and reads back the rows of bench_plain_format in both formats, and
+prints the best time of a few runs for each direction.
+
+Usage: python benchmarks/bench_binary_format.py [ROWS] [REPEAT]
+
+"""
+
+import os
+import sys
+import timeit
+
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from tesql.disk.formats import binary
+from tesql.disk.formats import plain
+
+from bench_plain_format import make_rows
+
+
+def write_rows (format, rows):
+    fileobj = StringIO()
+    format.write_objects(rows, fileobj)
+
+    return fileobj.getvalue()
+
+
+def read_rows (format, data):
+    return list(format.read_objects(StringIO(data)))
+
+
+def main (argv):
+    count = len(argv) > 1 and int(argv[1]) or 10000
+    repeat = len(argv) > 2 and int(argv[2]) or 5
+
+    rows = make_rows(count)
+
+    print '%d rows, best of %d' % (count, repeat)
+    for format in (plain, binary):
+        data = write_rows(format, rows)
+
+        if read_rows(format, data) != rows:
+            raise AssertionError('Rows do not survive a write/read round trip')
+
+        write = min(timeit.repeat(lambda: write_rows(format, rows), number=1,
+                                  repeat=repeat))
+        read = min(timeit.repeat(lambda: read_rows(format, data), number=1,
+                                 repeat=repeat))
+
+        name = format.__name__.split('.')[-1]
+        print '%-6s write: %8.3f s  %10.0f rows/s  %8d bytes' % (
+                name, write, count / write, len(data))
+        print '%-6s read:  %8.3f s  %10.0f rows/s' % (name, read, count / read)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,229 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Microbenchmark of the plain format
+
+Writes and reads back a file of ROWS plain objects shaped like the rows of
+a small table, and prints the best time of a few runs for each direction.
+The same is timed for a copy of the format as it was before its handlers
+were shared: one instance of every object class per line inspected,
+patterns compiled on each access and values built through make_object.
+
+Usage: python benchmarks/bench_plain_format.py [ROWS] [REPEAT]
+
+"""
+
+import os
+import re
+import sys
+import timeit
+
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from tesql.disk.objects import make_object
+from tesql.disk.formats.plain import write_object
+from tesql.disk.formats.plain import read_objects
+from tesql.disk.formats.plain import objects
+from tesql.disk.formats.plain.reader import LineReader
+
+
+class BaselineStringObject (objects.StringObject):
+
+    @property
+    def match_re (self):
+        return re.compile(r'^([\w.-]+)([:=]) (.*)$')
+
+    def read (self, fileobj, match=None):
+        fileobj = LineReader.wrap(fileobj)
+
+        if not match:
+            line = fileobj.peek()
+            match = self.match_re.match(line)
+            if not match or not match.groups():
+                raise SyntaxError("'%s'" % line)
+            fileobj.readline()
+
+        name = match.group(1)
+        value = match.group(3)
+
+        cont_re = re.compile(r'^ (\.|.+)$')
+
+        match = cont_re.match(fileobj.peek())
+        while match and match.groups():
+            fileobj.readline()
+            value += match.group(1) == '.' and '\n' or \
+                     ('\n' + match.group(1))
+            match = cont_re.match(fileobj.peek())
+
+        return make_object(name, value)
+
+
+class BaselineDictionaryObject (objects.DictionaryObject):
+
+    @property
+    def match_re (self):
+        return re.compile(r'^\[([\w.-]+)\]$')
+
+    def write (self, dictionary, fileobj, prefix=''):
+        if dictionary.name:
+            fileobj.write('\n[%s]\n' % (prefix + dictionary.name))
+
+        fileobj.write('\n')
+
+        for obj in dictionary.itervalues():
+            baseline_write_object(obj, fileobj,
+                                  prefix=(prefix + dictionary.name + '.'))
+
+    def read (self, fileobj, match=None):
+        fileobj = LineReader.wrap(fileobj)
+
+        if not match:
+            while fileobj.peek() and not fileobj.peek().strip():
+                fileobj.readline()
+
+            match = self.match_re.match(fileobj.peek())
+            if match and match.groups():
+                fileobj.readline()
+
+        name = match and match.group(1) or ''
+        obj = make_object(name, {})
+
+        line = fileobj.peek()
+        while line:
+            if not line.strip():
+                fileobj.readline()
+                line = fileobj.peek()
+                continue
+
+            match = self.match_re.match(line)
+            if match and match.groups():
+                if match.group(1)[:len(name)] != name or \
+                   len(name) >= len(match.group(1)):
+                    break
+
+                fileobj.readline()
+                obj.append(match.group(1), self.read(fileobj, match))
+            else:
+                tobj = baseline_read_object(fileobj)
+                obj.append(tobj.name, tobj)
+
+            line = fileobj.peek()
+
+        return obj
+
+
+# By priority, as the format used to find them
+BASELINE_OBJECTS = [BaselineDictionaryObject, BaselineStringObject,
+                    objects.ListObject]
+
+
+def baseline_write_object (obj, fileobj, prefix=''):
+    for pobj in BASELINE_OBJECTS:
+        if isinstance(obj, pobj().match_type):
+            return pobj().write(obj, fileobj, prefix)
+
+
+def baseline_read_object (fileobj):
+    fileobj = LineReader.wrap(fileobj)
+
+    for line in fileobj:
+        if not line.strip():
+            continue
+
+        for pobj in BASELINE_OBJECTS:
+            match = pobj().match_re.match(line)
+            if match and match.groups():
+                return pobj().read(fileobj, match)
+
+
+def baseline_read_objects (fileobj):
+    fileobj = LineReader.wrap(fileobj)
+
+    obj = baseline_read_object(fileobj)
+    while obj:
+        yield obj
+        obj = baseline_read_object(fileobj)
+
+
+def make_rows (count):
+    rows = []
+    for i in xrange(count):
+        row = make_object('Person', {})
+        row.append('firstname', 'Homer %d' % i)
+        row.append('surname', 'Simpson')
+        row.append('age', str(i % 90))
+        row.append('notes', 'First line\n\nThird line of row %d' % i)
+        rows.append(row)
+
+    return rows
+
+
+def write_rows (rows, write_object=write_object):
+    fileobj = StringIO()
+    for row in rows:
+        write_object(row, fileobj)
+
+    return fileobj.getvalue()
+
+
+def read_rows (data, read_objects=read_objects):
+    return list(read_objects(StringIO(data)))
+
+
+def measure (rows, repeat, write_object, read_objects):
+    data = write_rows(rows, write_object)
+
+    if read_rows(data, read_objects) != rows:
+        raise AssertionError('Rows do not survive a write/read round trip')
+
+    write = min(timeit.repeat(lambda: write_rows(rows, write_object),
+                              number=1, repeat=repeat))
+    read = min(timeit.repeat(lambda: read_rows(data, read_objects),
+                             number=1, repeat=repeat))
+
+    return write, read
+
+
+def main (argv):
+    count = len(argv) > 1 and int(argv[1]) or 10000
+    repeat = len(argv) > 2 and int(argv[2]) or 5
+
+    rows = make_rows(count)
+
+    if write_rows(rows) != write_rows(rows, baseline_write_object):
+        raise AssertionError('The baseline writes different files')
+
+    before = measure(rows, repeat, baseline_write_object,
+                     baseline_read_objects)
+    after = measure(rows, repeat, write_object, read_objects)
+
+    print '%d rows, best of %d' % (count, repeat)
+    print '           write (s)   read (s)'
+    print 'baseline  %9.3f  %9.3f' % before
+    print 'current   %9.3f  %9.3f' % after
+    print 'speedup   %8.2fx  %8.2fx' % (before[0] / after[0],
+                                        before[1] / after[1])
+    print 'current rows/s: write %.0f, read %.0f' % (count / after[0],
+                                                     count / after[1])
+
+if __name__ == '__main__':
+    main(sys.argv)
+
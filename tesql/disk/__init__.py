@@ -22,8 +22,11 @@ This module contains the infrastructure needed for storing and loading
 data from a tesql database on disk.
 
 It has the following sub packages:
+cache      - read cache server shared by processes using the same databases
 formats    - actual file formats the data can be stored to
+journal    - write-ahead log making multi-row commits atomic
 objects    - collection of storable/loadable types
+sequence   - persistent sequences used for autoincrementing primary keys
 strategies - ways of mapping directories and files to tables and columns
 
 """
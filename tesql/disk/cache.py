@@ -0,0 +1,276 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Read cache shared by the processes working on the same databases.
+
+A CacheServer listens on a Unix socket and keeps the parsed contents of
+row files, as pickles, keyed by the file's location and stat stamp.  Each
+Session given its address consults it through a CacheClient before
+parsing a file, and hands it what it parsed otherwise.  A file rewritten
+gets a new stamp, so stale entries are never returned and simply age out
+of the server.
+
+The server can be run with: python -m tesql.disk.cache SOCKET [MEGABYTES]
+"""
+
+import cPickle
+import errno
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from SocketServer import StreamRequestHandler, ThreadingUnixStreamServer
+
+
+# Default memory budget of a CacheServer
+MAX_BYTES = 256 << 20
+
+# Seconds a CacheClient waits after failing to connect before trying again
+RETRY_DELAY = 1.0
+
+
+class ReadCache (object):
+    """Pickled payloads by key, dropping the least recently used past
+    max_bytes."""
+
+    def __init__ (self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__ (self):
+        return len(self._payloads)
+
+    def get (self, key):
+        with self._lock:
+            payload = self._payloads.pop(key, None)
+            if payload == None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._payloads[key] = payload
+            return payload
+
+    def put (self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+
+        with self._lock:
+            self.bytes -= len(self._payloads.pop(key, ''))
+            self._payloads[key] = payload
+            self.bytes += len(payload)
+
+            while self.bytes > self.max_bytes:
+                key, payload = self._payloads.popitem(last=False)
+                self.bytes -= len(payload)
+
+
+class CacheHandler (StreamRequestHandler):
+    """Serve the requests of one client connection:
+
+        GET key\\n             answered by 'size\\n' and the payload or '-\\n'
+        PUT size key\\n payload
+    """
+
+    def handle (self):
+        while True:
+            line = self.rfile.readline()
+            if not line.endswith('\n'):
+                break
+
+            command, args = line[:-1].split(' ', 1)
+            if command == 'GET':
+                payload = self.server.cache.get(args)
+                if payload == None:
+                    self.wfile.write('-\n')
+                else:
+                    self.wfile.write('%d\n%s' % (len(payload), payload))
+            elif command == 'PUT':
+                size, key = args.split(' ', 1)
+                payload = self.rfile.read(int(size))
+                if len(payload) != int(size):
+                    break
+                self.server.cache.put(key, payload)
+            else:
+                break
+
+
+class CacheServer (ThreadingUnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__ (self, address, max_bytes=MAX_BYTES):
+        """Listen on the Unix socket address, replacing a stale one but
+        never one a server still answers on, nor anything else.  Only the
+        owner of the socket may connect to it."""
+
+        if os.path.lexists(address):
+            if not stat.S_ISSOCK(os.lstat(address).st_mode):
+                raise EnvironmentError(errno.EEXIST,
+                                       "Not a socket, refusing to replace it",
+                                       address)
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(address)
+            except socket.error:
+                os.unlink(address)
+            else:
+                raise EnvironmentError(errno.EADDRINUSE,
+                                       "A cache server is listening there",
+                                       address)
+            finally:
+                sock.close()
+
+        ThreadingUnixStreamServer.__init__(self, address, CacheHandler)
+        self.cache = ReadCache(max_bytes)
+
+    def server_bind (self):
+        # Created owner only, there is no window where others may connect
+        umask = os.umask(0177)
+        try:
+            ThreadingUnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def server_close (self):
+        ThreadingUnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class CacheClient (object):
+    """Connection to a CacheServer, one per thread and process: a process
+    forked with a connection open makes its own instead of sharing it.  If
+    the server can not be reached, or its socket is not owned by this
+    user, the client behaves as an always empty cache, and only tries to
+    connect again after RETRY_DELAY seconds."""
+
+    def __init__ (self, address):
+        self.address = address
+        self._local = threading.local()
+        # Time before which connecting is not tried again
+        self._retry = 0
+
+    @staticmethod
+    def key (location, stamp):
+        if isinstance(location, unicode):
+            location = location.encode('utf-8')
+
+        return '%r %s' % (stamp, location)
+
+    def _connection (self):
+        conn = getattr(self._local, 'conn', None)
+        if conn != None and conn[0] != os.getpid():
+            # Inherited through fork, the parent keeps using it
+            self._disconnect()
+            conn = None
+
+        if conn == None:
+            if time.time() < self._retry:
+                raise socket.error(errno.ECONNREFUSED, "Waiting to retry")
+
+            try:
+                conn = self._connect()
+            except socket.error:
+                self._retry = time.time() + RETRY_DELAY
+                raise
+            self._local.conn = conn
+
+        return conn[1:]
+
+    def _connect (self):
+        try:
+            owner = os.stat(self.address).st_uid
+        except OSError, e:
+            raise socket.error(e.errno, e.strerror)
+        if owner != os.getuid():
+            raise socket.error(errno.EPERM, "Socket owned by uid %d" % owner)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.address)
+        except socket.error:
+            sock.close()
+            raise
+
+        return (os.getpid(), sock, sock.makefile('rb'))
+
+    def _disconnect (self):
+        conn = getattr(self._local, 'conn', None)
+        if conn != None:
+            conn[2].close()
+            conn[1].close()
+            self._local.conn = None
+
+    def get (self, location, stamp):
+        """Return the objects cached for location at stamp, or None."""
+
+        try:
+            sock, rfile = self._connection()
+            sock.sendall('GET %s\n' % self.key(location, stamp))
+
+            line = rfile.readline()
+            if line == '-\n':
+                return None
+            elif not line.endswith('\n'):
+                raise socket.error("Connection closed by the server")
+
+            payload = rfile.read(int(line))
+            return cPickle.loads(payload)
+        except (socket.error, ValueError):
+            self._disconnect()
+            return None
+
+    def put (self, location, stamp, objects):
+        """Cache the objects read from location at stamp."""
+
+        try:
+            sock, rfile = self._connection()
+            payload = cPickle.dumps(objects, cPickle.HIGHEST_PROTOCOL)
+            sock.sendall('PUT %d %s\n%s' % (len(payload),
+                                            self.key(location, stamp),
+                                            payload))
+        except socket.error:
+            self._disconnect()
+
+
+def serve (address, max_bytes=MAX_BYTES):
+    server = CacheServer(address, max_bytes)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+from tesql import __author__, __license__, __version__
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit("Usage: python -m tesql.disk.cache SOCKET [MEGABYTES]")
+
+    serve(sys.argv[1], len(sys.argv) == 3 and int(sys.argv[2]) << 20 or
+                       MAX_BYTES)
@@ -15,5 +15,45 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+"""
+File formats rows can be stored in
+
+plain  - human readable .conf files, the default
+binary - compact length-prefixed records for machine-only tables
+
+Formats are modules providing write_objects(), read_objects(), MAGIC and
+MODE.  They are registered by name, so entities can select theirs with
+@options(format='binary').
+"""
+
+# Name -> format module
+FORMATS = {}
+
+
+def register_format (name, format):
+    """Make format selectable by name."""
+    FORMATS[name] = format
+
+
+def get_format (format):
+    """Return the format registered as format, or format itself if it is
+    not a name."""
+
+    if not isinstance(format, basestring):
+        return format
+
+    if format not in FORMATS:
+        raise ValueError("Unknown format '%s', not one of %s" %
+                         (format, ', '.join(sorted(FORMATS))))
+
+    return FORMATS[format]
+
+
+import binary
+import plain
+
+register_format('binary', binary)
+register_format('plain', plain)
+
 
 from tesql import __author__, __license__, __version__
@@ -0,0 +1,178 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Binary format
+
+A smaller and faster alternative to the plain format for tables nobody
+edits by hand.  A file is MAGIC followed by its objects, each one encoded
+as:
+
+    head | [name size | name] | body size | body
+
+where every size is a varint (7 bits per byte, low bits first, the high
+bit set on all bytes but the last).  The head is a varint holding the tag
+of the object in its 2 low bits and, above them, 0 if its name follows or
+else 1 + the position of its name among those given so far in the file,
+so each name is only written once per file.  The body of a String is its
+UTF-8 bytes, and the body of a Dictionary or a List is the objects in it,
+its body size counting them instead of bytes.  Names are UTF-8.
+"""
+
+from tesql.disk.objects import Dictionary
+from tesql.disk.objects import List
+from tesql.disk.objects import String
+from tesql.disk.objects import make_object
+
+
+MAGIC = '\x00tsb\x02'
+
+# Files of this format must be opened in this mode
+MODE = 'rb'
+
+STRING, LIST, DICTIONARY = 0, 1, 2
+
+# Encodings of the one byte varints
+_BYTES = [chr(i) for i in xrange(0x80)]
+
+
+def _varint (value):
+    if value < 0x80:
+        return _BYTES[value]
+
+    chunks = []
+    while value >= 0x80:
+        chunks.append(chr(value & 0x7f | 0x80))
+        value >>= 7
+    chunks.append(chr(value))
+
+    return ''.join(chunks)
+
+
+def _read_varint (data, pos):
+    byte = ord(data[pos])
+    if byte < 0x80:
+        return byte, pos + 1
+
+    value = shift = 0
+    while byte >= 0x80:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        pos += 1
+        byte = ord(data[pos])
+
+    return value | byte << shift, pos + 1
+
+
+def _head (name, tag, names):
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+
+    ref = names.get(name)
+    if ref != None:
+        return _varint(ref << 2 | tag)
+
+    names[name] = len(names) + 1
+    return _BYTES[tag] + _varint(len(name)) + name
+
+
+def _encode (obj, chunks, names):
+    if isinstance(obj, Dictionary):
+        chunks.append(_head(obj.name, DICTIONARY, names) + _varint(len(obj)))
+        for item in obj.itervalues():
+            # Fields are mostly strings, these are encoded in place
+            if not isinstance(item, String):
+                _encode(item, chunks, names)
+                continue
+
+            ref = names.get(item.name)
+            value = item.encode('utf-8')
+            if ref != None and ref < 0x20 and len(value) < 0x80:
+                chunks.append(_BYTES[ref << 2] + _BYTES[len(value)] + value)
+            else:
+                chunks.append(_head(item.name, STRING, names) +
+                              _varint(len(value)) + value)
+    elif isinstance(obj, List):
+        chunks.append(_head(obj.name, LIST, names) + _varint(len(obj)))
+        for item in obj:
+            _encode(make_object('', item), chunks, names)
+    else:
+        value = obj.encode('utf-8')
+        chunks.append(_head(obj.name, STRING, names) + _varint(len(value)) +
+                      value)
+
+
+def _decode (data, pos, names):
+    head, pos = _read_varint(data, pos)
+    tag = head & 3
+    if head >> 2:
+        name = names[(head >> 2) - 1]
+    else:
+        size, pos = _read_varint(data, pos)
+        name = data[pos:pos + size]
+        if len(name) != size:
+            raise IndexError("Name past the end of data")
+        names.append(name)
+        pos += size
+
+    count, pos = _read_varint(data, pos)
+
+    if tag == STRING:
+        if pos + count > len(data):
+            raise IndexError("String past the end of data")
+        return String(name, data[pos:pos + count].decode('utf-8')), \
+               pos + count
+
+    items = []
+    for i in xrange(count):
+        item, pos = _decode(data, pos, names)
+        items.append(item)
+
+    if tag == LIST:
+        return List(name, items), pos
+    else:
+        return Dictionary.from_objects(name, items), pos
+
+
+def write_objects (objs, fileobj):
+    """Write a whole file holding objs."""
+
+    chunks = [MAGIC]
+    names = {}
+    for obj in objs:
+        _encode(obj, chunks, names)
+    fileobj.write(''.join(chunks))
+
+
+def read_objects (fileobj):
+    """Yield the objects of a whole file."""
+
+    data = fileobj.read()
+    if not data.startswith(MAGIC):
+        raise SyntaxError("Not a file in binary format")
+
+    pos = len(MAGIC)
+    names = []
+    while pos < len(data):
+        try:
+            obj, pos = _decode(data, pos, names)
+        except IndexError:
+            raise SyntaxError("Truncated object at byte %d" % pos)
+        yield obj
+
+
+from tesql import __author__, __license__, __version__
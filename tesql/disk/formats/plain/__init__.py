@@ -18,28 +18,66 @@
 import inspect
 
 
+# Plain files have no magic number and are read with universal newlines
+MAGIC = None
+MODE = 'rU'
+
+
 def write_object (obj, fileobj, prefix=''):
-    for pobj in PLAIN_OBJECTS:
-        if isinstance(obj, pobj().match_type):
-            return pobj().write(obj, fileobj, prefix)
+    if type(obj) not in WRITERS:
+        WRITERS[type(obj)] = None
+        for handler in HANDLERS:
+            if hasattr(handler, 'write') and \
+               isinstance(obj, handler.match_type):
+                WRITERS[type(obj)] = handler
+                break
+
+    if WRITERS[type(obj)]:
+        return WRITERS[type(obj)].write(obj, fileobj, prefix)
+
+
+def write_objects (objs, fileobj):
+    """Write a whole file holding objs."""
+
+    for obj in objs:
+        write_object(obj, fileobj)
 
 
 def read_object (fileobj, as_dictionary=False):
+    """Read the next object from fileobj.  The lookahead line is kept by the
+    LineReader, so pass one in (or use read_objects) to read several
+    objects from the same file."""
+
+    fileobj = LineReader.wrap(fileobj)
+
     if as_dictionary:
-        return objects.DictionaryObject().read(fileobj)
+        return DICTIONARY.read(fileobj)
 
     for line in fileobj:
         if not line.strip():
             continue
 
-        for pobj in PLAIN_OBJECTS:
-            match = pobj().match_re.match(line)
-            if match and match.groups():
-                return pobj().read(fileobj, match)
+        for handler in READERS.get(line[0]) or READERS[None]:
+            match = handler.match_re.match(line)
+            if match:
+                return handler.read(fileobj, match)
+
+
+def read_objects (fileobj):
+    """Yield the objects of fileobj in a single forward pass."""
+
+    fileobj = LineReader.wrap(fileobj)
+
+    obj = read_object(fileobj)
+    while obj:
+        yield obj
+        obj = read_object(fileobj)
 
 
 import objects
 
+from reader import LineReader
+
 from base import BasePlainObject
 
 PLAIN_OBJECTS = sorted([x[1] for x in
@@ -48,5 +86,19 @@ PLAIN_OBJECTS = sorted([x[1] for x in
                         hasattr(x[1], 'priority')],
                        lambda x, y: x().priority - y().priority, reverse=True)
 
+# One handler per object type, shared by every read and write
+HANDLERS = [x() for x in PLAIN_OBJECTS]
+DICTIONARY = [x for x in HANDLERS if isinstance(x, objects.DictionaryObject)][0]
+
+# Object type -> handler, filled in as types are first written
+WRITERS = {}
+
+# First character of a line -> handlers that may read it, by priority
+READERS = {None: []}
+for handler in HANDLERS:
+    if hasattr(handler, 'read'):
+        READERS.setdefault(handler.prefix, []).append(handler)
+del handler
+
 
 from tesql import __author__, __license__, __version__
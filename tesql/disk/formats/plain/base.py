@@ -17,7 +17,13 @@
 
 
 class BasePlainObject (object):
-    pass
+
+    @property
+    def prefix (self):
+        """First character of the lines that start this kind of object, or
+        None if they start with a name."""
+
+        return None
 
 
 from tesql import __author__, __license__, __version__
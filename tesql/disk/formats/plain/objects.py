@@ -15,10 +15,8 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
 import re
 
-from tesql.disk.objects import make_object
 from tesql.disk.objects import String
 from tesql.disk.objects import Dictionary
 
@@ -26,6 +24,12 @@ from tesql.disk.formats.plain import write_object
 from tesql.disk.formats.plain import read_object
 
 from base import BasePlainObject
+from reader import LineReader
+
+
+STRING_RE = re.compile(r'^([\w.-]+)([:=]) (.*)$')
+CONTINUATION_RE = re.compile(r'^ (\.|.+)$')
+SECTION_RE = re.compile(r'^\[([\w.-]+)\]$')
 
 
 class StringObject (BasePlainObject):
@@ -43,7 +47,7 @@ class StringObject (BasePlainObject):
 
     @property
     def match_re (self):
-        return re.compile(r'^([\w.-]+)([:=]) (.*)$')
+        return STRING_RE
 
     def write (self, string, fileobj, prefix=''):
         lines = string.split('\n')
@@ -55,28 +59,25 @@ class StringObject (BasePlainObject):
             fileobj.write((i and ' ' or '') + lines[i] + '\n')
 
     def read (self, fileobj, match=None):
+        fileobj = LineReader.wrap(fileobj)
+
         if not match:
-            line = fileobj.readline()
-            match = self.match_re.match(line)
-            if not match or not match.groups():
-                fileobj.seek(-len(line), os.SEEK_CUR)
+            line = fileobj.peek()
+            match = STRING_RE.match(line)
+            if not match:
                 raise SyntaxError("'%s'" % line)
+            fileobj.readline()
 
         name = match.group(1)
-        value = match.group(3)
+        value = [match.group(3)]
 
-        cont_re = re.compile(r'^ (\.|.+)$')
+        match = CONTINUATION_RE.match(fileobj.peek())
+        while match:
+            fileobj.readline()
+            value.append(match.group(1) != '.' and match.group(1) or '')
+            match = CONTINUATION_RE.match(fileobj.peek())
 
-        for line in fileobj:
-            match = cont_re.match(line)
-            if match and match.groups():
-                value += match.group(1) == '.' and '\n' or \
-                         ('\n' + match.group(1))
-            else:
-                fileobj.seek(-len(line), os.SEEK_CUR)
-                break
-
-        return make_object(name, value)
+        return String(name, '\n'.join(value))
 
 
 class ListObject (BasePlainObject):
@@ -116,7 +117,11 @@ class DictionaryObject (BasePlainObject):
 
     @property
     def match_re (self):
-        return re.compile(r'^\[([\w.-]+)\]$')
+        return SECTION_RE
+
+    @property
+    def prefix (self):
+        return '['
 
     def write (self, dictionary, fileobj, prefix=''):
         if dictionary.name:
@@ -128,35 +133,41 @@ class DictionaryObject (BasePlainObject):
             write_object(obj, fileobj, prefix=(prefix + dictionary.name + '.'))
 
     def read (self, fileobj, match=None):
+        fileobj = LineReader.wrap(fileobj)
+
         if not match:
-            for line in fileobj:
-                if line.strip():
-                    match = self.match_re.match(line)
-                    if not match or not match.groups():
-                        fileobj.seek(-len(line), os.SEEK_CUR)
-                    break
+            while fileobj.peek() and not fileobj.peek().strip():
+                fileobj.readline()
+
+            match = SECTION_RE.match(fileobj.peek())
+            if match:
+                fileobj.readline()
 
         name = match and match.group(1) or ''
-        obj = make_object(name, {})
+        obj = Dictionary(name, {})
 
-        for line in fileobj:
+        line = fileobj.peek()
+        while line:
             if not line.strip():
+                fileobj.readline()
+                line = fileobj.peek()
                 continue
 
-            match = self.match_re.match(line)
-            if match and match.groups():
+            match = line[0] == '[' and SECTION_RE.match(line)
+            if match:
                 if match.group(1)[:len(name)] != name or \
                    len(name) >= len(match.group(1)):
                     # A section, but not a sub-section
-                    fileobj.seek(-len(line), os.SEEK_CUR)
                     break
 
+                fileobj.readline()
                 obj.append(match.group(1), self.read(fileobj, match))
             else:
-                fileobj.seek(-len(line), os.SEEK_CUR)
                 tobj = read_object(fileobj)
                 obj.append(tobj.name, tobj)
 
+            line = fileobj.peek()
+
         return obj
 
 
@@ -0,0 +1,59 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class LineReader (object):
+    """Read the lines of a file object in a single forward pass, with one
+    line of lookahead.  Nothing is ever seeked, so pipes and mmaps can be
+    read as well as regular files."""
+
+    def __init__ (self, fileobj):
+        if hasattr(fileobj, 'next'):
+            self._lines = fileobj
+        else:
+            self._lines = iter(fileobj.readline, '')
+        self._next = None
+
+    @classmethod
+    def wrap (cls, fileobj):
+        return isinstance(fileobj, cls) and fileobj or cls(fileobj)
+
+    def peek (self):
+        """Return the next line without consuming it, or '' at the end."""
+
+        if self._next == None:
+            self._next = next(self._lines, '')
+
+        return self._next
+
+    def readline (self):
+        line = self.peek()
+        self._next = None
+        return line
+
+    def __iter__ (self):
+        return self
+
+    def next (self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+
+        return line
+
+
+from tesql import __author__, __license__, __version__
@@ -0,0 +1,157 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from zlib import crc32
+
+
+class Journal (object):
+    """Write-ahead log of the files written by commits.
+
+    Each commit appends one record holding the new contents of every file
+    it writes, and fsyncs the journal once.  Only then are the files
+    written in place, so after a crash replaying the complete records
+    redoes every commit entirely, and a torn last record is ignored.  Once
+    the written files are known to be on disk the journal is truncated
+    (a checkpoint).
+
+    A record is a 'BEGIN <count>' line, then for each file a
+    '<path length> <data length>' line followed by the path and the data,
+    and a 'COMMIT <crc32>' line checksumming everything after BEGIN.  Files
+    removed have '-' as data length and no data.
+    """
+
+    def __init__ (self, location):
+        self._location = location
+
+    @property
+    def location (self):
+        return self._location
+
+    @property
+    def size (self):
+        try:
+            return os.path.getsize(self._location)
+        except OSError:
+            return 0
+
+    def append (self, entries):
+        """Durably append a record of the (location, data) entries, where
+        data is None for the files to remove."""
+
+        body = []
+        for location, data in entries:
+            location = isinstance(location, unicode) and \
+                       location.encode('utf-8') or location
+            if data == None:
+                body.append('%d -\n%s' % (len(location), location))
+                continue
+
+            data = isinstance(data, unicode) and data.encode('utf-8') or data
+            body.append('%d %d\n%s%s' % (len(location), len(data), location,
+                                         data))
+
+        body = ''.join(body)
+        created = not os.path.exists(self._location)
+
+        if not os.path.isdir(os.path.dirname(self._location)):
+            os.makedirs(os.path.dirname(self._location))
+
+        fileobj = open(self._location, 'ab')
+        try:
+            fileobj.write('BEGIN %d\n%sCOMMIT %08x\n' % (len(entries), body,
+                                                    crc32(body) & 0xffffffff))
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        finally:
+            fileobj.close()
+
+        if created:
+            fd = os.open(os.path.dirname(self._location), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def replay (self):
+        """Iterate over the (location, data) entries of the complete records,
+        oldest first."""
+
+        if not os.path.isfile(self._location):
+            return
+
+        fileobj = open(self._location, 'rb')
+        try:
+            while True:
+                entries = self._read_record(fileobj)
+                if entries == None:
+                    break
+
+                for entry in entries:
+                    yield entry
+        finally:
+            fileobj.close()
+
+    @staticmethod
+    def _read_record (fileobj):
+        try:
+            head, count = fileobj.readline().split()
+            if head != 'BEGIN':
+                return None
+
+            body = []
+            entries = []
+            for i in xrange(int(count)):
+                line = fileobj.readline()
+                plen, dlen = line.split()
+                plen = int(plen)
+                location = fileobj.read(plen)
+                if dlen == '-':
+                    data = None
+                else:
+                    dlen = int(dlen)
+                    data = fileobj.read(dlen)
+                    if len(data) != dlen:
+                        return None
+                if len(location) != plen:
+                    return None
+
+                body.append(line + location + (data or ''))
+                entries.append((location.decode('utf-8'), data))
+
+            head, checksum = fileobj.readline().split()
+            if head != 'COMMIT' or \
+               int(checksum, 16) != crc32(''.join(body)) & 0xffffffff:
+                return None
+        except ValueError:
+            return None
+
+        return entries
+
+    def truncate (self):
+        """Forget every record, once the files they write are on disk."""
+
+        if os.path.isfile(self._location):
+            fileobj = open(self._location, 'wb')
+            try:
+                os.fsync(fileobj.fileno())
+            finally:
+                fileobj.close()
+
+
+from tesql import __author__, __license__, __version__
@@ -26,6 +26,18 @@ class Dictionary (BaseObject):
         super(Dictionary, self).__init__(name, value)
         self.set_value(value)
 
+    @classmethod
+    def from_objects (cls, name, objs):
+        """Return a Dictionary holding the already made objs, in order,
+        without wrapping them again as append() does."""
+
+        obj = cls(name, {})
+        obj._values = list(objs)
+        obj._keys = dict((x.name, i) for i, x in enumerate(obj._values))
+        obj._pos = len(obj._values) - 1
+
+        return obj
+
     def __len__ (self):
         return len(self._values)
 
@@ -0,0 +1,117 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+
+# Values the stored high-water mark is set ahead of the next value, so the
+# file is only written once per block of values handed out
+BLOCK = 100
+
+
+class Sequence (object):
+    """Persistent source of increasing integers, used to hand out the
+    primary keys of autoincrementing entities.
+
+    Values are handed out from memory, and the file only holds a value past
+    all those handed out so far, a block ahead of them.  sync() has to be
+    called before storing any row using a value from the sequence, so that
+    after a crash the sequence always continues past every value that may
+    have been used; up to a block of values is skipped then.
+    """
+
+    def __init__ (self, location, start=0):
+        self._location = location
+        self._next = start
+        self._stored = None
+
+    @classmethod
+    def load (cls, location, default=0):
+        """Return the sequence stored at location, or a new one starting at
+        default if there is none."""
+
+        if not os.path.isfile(location):
+            return cls(location, default)
+
+        fileobj = open(location, 'r')
+        try:
+            start = int(fileobj.read().strip())
+        finally:
+            fileobj.close()
+
+        sequence = cls(location, start)
+        sequence._stored = start
+
+        return sequence
+
+    @property
+    def location (self):
+        return self._location
+
+    def next (self):
+        value = self._next
+        self._next += 1
+        return value
+
+    def reserve (self, count):
+        """Hand out a block of count consecutive values at once."""
+
+        values = xrange(self._next, self._next + count)
+        self._next += count
+        return values
+
+    def observe (self, value):
+        """Make sure value is never handed out."""
+
+        if value >= self._next:
+            self._next = value + 1
+
+    def sync (self, durable=True):
+        """Store a high-water mark past the values handed out, unless the
+        stored one already is.  Unless durable is False it is fsynced, with
+        its directory."""
+
+        if self._stored != None and self._next <= self._stored:
+            return
+
+        directory = os.path.dirname(self._location)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        stored = self._next + BLOCK
+        tmp = self._location + '.tmp'
+        fileobj = open(tmp, 'w')
+        try:
+            fileobj.write('%d\n' % stored)
+            fileobj.flush()
+            if durable:
+                os.fsync(fileobj.fileno())
+        finally:
+            fileobj.close()
+        os.rename(tmp, self._location)
+
+        if durable:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        self._stored = stored
+
+
+from tesql import __author__, __license__, __version__
@@ -16,7 +16,38 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from independent import Independent
+from packed import Packed
 from related import Related
+from sharded import Sharded
+
+
+# Name -> strategy class
+STRATEGIES = {}
+
+
+def register_strategy (name, strategy):
+    """Make the strategy class selectable by name."""
+    STRATEGIES[name] = strategy
+
+
+def get_strategy (strategy):
+    """Return the strategy class registered as strategy, or strategy itself
+    if it is not a name."""
+
+    if not isinstance(strategy, basestring):
+        return strategy
+
+    if strategy not in STRATEGIES:
+        raise ValueError("Unknown strategy '%s', not one of %s" %
+                         (strategy, ', '.join(sorted(STRATEGIES))))
+
+    return STRATEGIES[strategy]
+
+
+register_strategy('independent', Independent)
+register_strategy('packed', Packed)
+register_strategy('related', Related)
+register_strategy('sharded', Sharded)
 
 
 from tesql import __author__, __license__, __version__
@@ -15,39 +15,345 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import errno
 import os
-from StringIO import StringIO
+
+from bisect import bisect_left
+from tempfile import NamedTemporaryFile
 
 import tesql
 
-# FIXME: Make flexible
-from tesql.disk.formats.plain import read_object
+from tesql.disk.formats import binary
+from tesql.disk.formats import plain
+
+
+# When written files are fsynced: never, each file as it is written (with
+# its directory), or all files written since the last sync_locations() call
+# at once, with a single fsync per directory
+SYNC_POLICIES = ('never', 'file', 'commit')
+
+# Temporary files are created private, written files get the usual mode
+UMASK = os.umask(0)
+os.umask(UMASK)
 
 
 class BaseDiskStrategy (object):
 
+    sync = 'never'
+    cache = None
+
+    def set_sync (self, policy):
+        if policy not in SYNC_POLICIES:
+            raise ValueError("'%s' not one of %s" % (policy,
+                                                     ', '.join(SYNC_POLICIES)))
+
+        self.sync = policy
+
+    def bind_format (self, entity, format):
+        """Store the rows of entity in format, a module like
+        tesql.disk.formats.plain.  Rows already stored in another format
+        are still read, and rewritten in this one when stored again."""
+
+        self._formats[entity.meta.name] = format
+
+    def get_format (self, entity):
+        return self._formats.get(entity.meta.name, plain)
+
+    def get_location_format (self, location):
+        """Return the format the rows at location are expected in."""
+
+        for name, format in self._formats.iteritems():
+            table = self.get_location(
+                    tesql.orm.Entity.get_entity_type_by_name(name))
+            if location == table or location.startswith(table + os.sep):
+                return format
+
+        return plain
+
+    @classmethod
+    def claims_location (cls, location):
+        """Return whether location only makes sense to this strategy, so
+        no other one should write it."""
+        return False
+
+    def set_cache (self, cache):
+        """Consult cache, a tesql.disk.cache.CacheClient, before parsing
+        a file and give it what was parsed otherwise."""
+
+        self.cache = cache
+
+    def open_location (self, location):
+        """Return a temporary file next to location to write its new
+        contents to.  It is put in place by close_location()."""
+
+        return NamedTemporaryFile('w', suffix='.tmp', delete=False,
+                                  prefix='.' + os.path.basename(location),
+                                  dir=os.path.dirname(location))
+
+    def close_location (self, fileobj, location, durable=True):
+        """Close the file returned by open_location() and atomically rename
+        it to location, so readers see either the old or the new contents.
+        Unless durable is False the file is fsynced as the policy says."""
+
+        try:
+            fileobj.flush()
+            if durable and self.sync == 'file':
+                os.fsync(fileobj.fileno())
+            fileobj.close()
+
+            os.chmod(fileobj.name, 0666 & ~UMASK)
+            os.rename(fileobj.name, location)
+        except:
+            self.discard_location(fileobj)
+            raise
+
+        if durable and self.sync == 'file':
+            self._fsync(os.path.dirname(location))
+        elif durable and self.sync == 'commit':
+            self._unsynced.add(location)
+
+    def write_location (self, location, data):
+        """Atomically replace the contents of location with data."""
+
+        stamp = self.get_stamp(os.path.dirname(location))
+        if not os.path.isdir(os.path.dirname(location)):
+            os.makedirs(os.path.dirname(location))
+
+        fileobj = self.open_location(location)
+        try:
+            fileobj.write(data)
+        except:
+            self.discard_location(fileobj)
+            raise
+        self.close_location(fileobj, location)
+
+        self._listed(location, stamp)
+
+    def dispose_location (self, instance):
+        """Return what deleting instance takes, like render_location(): the
+        location to rewrite, its contents and the instances they hold, or
+        the location to remove with None as contents."""
+
+        return self.get_location(instance), None, []
+
+    def remove_locations (self, locations):
+        """Unlink the files at locations, syncing each directory once."""
+
+        # Directory -> its stamp before the first unlink, names unlinked
+        removed = {}
+        for location in locations:
+            head, tail = os.path.split(location)
+            if head not in removed:
+                removed[head] = (self.get_stamp(head), set())
+
+            try:
+                os.unlink(location)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+            removed[head][1].add(tail)
+
+        for head, (stamp, tails) in removed.iteritems():
+            self._unlisted(head, tails, stamp)
+
+        if self.sync == 'file':
+            for location in set(os.path.dirname(x) for x in locations):
+                self._fsync(location)
+        elif self.sync == 'commit':
+            self._unsynced.update(locations)
+
+    def discard_location (self, fileobj):
+        """Close and remove the file returned by open_location()."""
+
+        fileobj.close()
+        if os.path.exists(fileobj.name):
+            os.unlink(fileobj.name)
+
+    def sync_locations (self):
+        """Fsync the files written since the last call, then each of their
+        directories once."""
+
+        unsynced, self._unsynced = self._unsynced, set()
+
+        for location in unsynced:
+            if os.path.isfile(location):
+                self._fsync(location)
+
+        for location in set(os.path.dirname(x) for x in unsynced):
+            self._fsync(location)
+
+    @staticmethod
+    def _fsync (location):
+        fd = os.open(location, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def get_index_location (self, entity, name):
+        """Return where the index of the field name of entity is kept, in
+        the database and not next to a location bound elsewhere, or None
+        for singletons, which are not worth indexing."""
+
+        if entity.meta.singleton:
+            return None
+
+        return os.path.join(self.base_location,
+                            '%s.%s.idx' % (entity.meta.name, name))
+
+    def get_sequence_location (self, entity):
+        if entity.meta.singleton:
+            return None
+
+        return os.path.join(self.base_location, '%s.seq' % entity.meta.name)
+
+    def get_location_stamp (self, entity):
+        return self.get_stamp(self.get_location(entity))
+
+    def get_stamp (self, location):
+        try:
+            return os.stat(location).st_mtime
+        except OSError:
+            return None
+
+    def get_file_stamp (self, location):
+        """Return a stamp of the file at location that changes whenever it
+        is rewritten, even within the same mtime tick, or None."""
+
+        try:
+            st = os.stat(location)
+        except OSError:
+            return None
+
+        return (st.st_mtime, st.st_ino, st.st_size)
+
+    def list_directory (self, location):
+        """Return the sorted paths of the '.conf' files in the directory
+        location.  The listing is cached until the directory's mtime
+        changes."""
+
+        stamp = self.get_stamp(location)
+
+        if location not in self._listings or \
+           self._listings[location][0] != stamp:
+            names = stamp != None and os.path.isdir(location) and \
+                    os.listdir(location) or []
+            names = sorted(x for x in names
+                           if x.endswith('.conf') and not x.startswith('.'))
+            self._listings[location] = (stamp, names)
+
+        return [os.path.join(location, x) for x in self._listings[location][1]]
+
+    def _listed (self, location, stamp):
+        """Add the file location to the cached listing of its directory if
+        the listing was current when the directory had the given stamp."""
+
+        head, tail = os.path.split(location)
+
+        if head in self._listings and self._listings[head][0] == stamp:
+            names = self._listings[head][1]
+            i = bisect_left(names, tail)
+            if i == len(names) or names[i] != tail:
+                names.insert(i, tail)
+            self._listings[head] = (self.get_stamp(head), names)
+
+    def _unlisted (self, head, tails, stamp):
+        """Remove the files named tails from the cached listing of their
+        directory head, in one pass, if the listing was current when the
+        directory had the given stamp."""
+
+        if head in self._listings and self._listings[head][0] == stamp:
+            names = [x for x in self._listings[head][1] if x not in tails]
+            self._listings[head] = (self.get_stamp(head), names)
+
     def load_location_as_dictionaries (self, location):
         if not os.path.isfile(location):
             raise IOError("File '%s' not found" % location)
 
-        # FIXME: Check why it does not work directly on fileobj
-        fileobj = open(location, 'rU')
-        striofile = StringIO(fileobj.read())
-        fileobj.close()
+        format = self.get_location_format(location)
+        fileobj = open(location, format.MODE)
+        try:
+            if not self.cache:
+                return self._read_objects(fileobj, format)
 
-        res = []
-        obj = read_object(striofile)
-        while obj:
-            res.append(obj)
-            obj = read_object(striofile)
+            # Rewritten files are renamed in place, so they get a new inode
+            st = os.fstat(fileobj.fileno())
+            stamp = (st.st_mtime, st.st_ino, st.st_size)
 
-        return res
+            objs = self.cache.get(location, stamp)
+            if objs == None:
+                objs = self._read_objects(fileobj, format)
+                self.cache.put(location, stamp, objs)
+
+            return objs
+        finally:
+            fileobj.close()
+
+    @staticmethod
+    def _read_objects (fileobj, format):
+        """Return the objects in fileobj, opened for format.  A file written
+        in the other format, before the entity changed format, is opened
+        again for that one."""
+
+        head = fileobj.read(len(binary.MAGIC))
+        fileobj.seek(0)
+
+        if (head == binary.MAGIC) == (format is binary):
+            return list(format.read_objects(fileobj))
+
+        format = format is binary and plain or binary
+        other = open(fileobj.name, format.MODE)
+        try:
+            return list(format.read_objects(other))
+        finally:
+            other.close()
 
     def load_location (self, entity, pk):
         location = self.get_location(entity, pk)
 
-        dicts = self.load_location_as_dictionaries(location)
+        return self._load_dictionaries(
+                self.load_location_as_dictionaries(location), pk)
+
+    def load_locations (self, entity, pks, pool=None):
+        """Load the rows of entity with the given primary keys in one pass.
+        Keys are checked against a single listing of the table and the
+        files are read through pool.map, when a pool is given.  Rows are
+        handed to the Session in the order of pks, and keys with no stored
+        row are skipped.  Return the list of instances loaded."""
+
+        table = self.get_location(entity)
+        listed = None
+
+        items = []
+        seen = set()
+        for pk in pks:
+            location = self.get_location(entity, pk)
+            if os.path.dirname(location) == table:
+                if listed == None:
+                    listed = set(self.list_directory(table))
+                if location not in listed:
+                    continue
+            elif not os.path.isfile(location):
+                continue
+
+            if location not in seen:
+                items.append((location, pk))
+                seen.add(location)
+
+        paths = [location for location, pk in items]
+        if pool and len(paths) > 1:
+            dicts = pool.map(self.load_location_as_dictionaries, paths)
+        else:
+            dicts = map(self.load_location_as_dictionaries, paths)
+
+        res = []
+        for (location, pk), objs in zip(items, dicts):
+            loaded = self._load_dictionaries(objs, pk)
+            res.extend(isinstance(loaded, list) and loaded or [loaded])
+
+        return res
 
+    def _load_dictionaries (self, dicts, pk):
         res = []
         for obj in dicts:
             objentity = tesql.orm.Entity.get_entity_type_by_name(obj.name)
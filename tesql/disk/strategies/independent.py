@@ -17,14 +17,10 @@
 
 import os
 
-from glob import iglob
 from StringIO import StringIO
 
 import tesql
 
-# FIXME: Make flexible
-from tesql.disk.formats.plain import write_object
-
 from base import BaseDiskStrategy
 
 
@@ -32,6 +28,9 @@ class Independent (BaseDiskStrategy):
 
     def __init__ (self):
         self._locations = {}
+        self._listings = {}
+        self._unsynced = set()
+        self._formats = {}
 
         self.bind(os.path.join(os.getcwdu(), '.tesqldb'))
 
@@ -99,7 +98,7 @@ class Independent (BaseDiskStrategy):
         location = self.get_location(entity, pk)
 
         if isinstance(entity, type) and pk == None:
-            return iglob(os.path.join(location, '*.conf'))
+            return self.list_directory(location)
         else:
             return os.path.isfile(location) and location or None
 
@@ -113,12 +112,19 @@ class Independent (BaseDiskStrategy):
         head, tail = os.path.split(location)
         return entity.entity_pk.unmarshal(tail[:-5])
 
-    def store_location (self, instance):
-        location = self.make_location(instance)
+    def render_location (self, instance):
+        """Return the location instance is stored at, the contents to store
+        there and the instances these contents hold."""
+
+        fileobj = StringIO()
+        self.get_format(type(instance)).write_objects(
+                [instance.entity_as_dictionary], fileobj)
 
-        fileobj = open(location, 'w')
-        write_object(instance.entity_as_dictionary, fileobj)
-        fileobj.close()
+        return self.get_location(instance), fileobj.getvalue(), [instance]
+
+    def store_location (self, instance):
+        location, data, instances = self.render_location(instance)
+        self.write_location(location, data)
 
 
 from tesql import __author__, __license__, __version__
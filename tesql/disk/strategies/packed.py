@@ -0,0 +1,435 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+
+from StringIO import StringIO
+
+import tesql
+
+from tesql.disk.formats import binary
+from tesql.disk.formats import plain
+
+from independent import Independent
+
+
+# Compaction is only worth it past this many bytes of replaced records
+COMPACT_SIZE = 1 << 20
+
+# Bytes of records appended past the saved offsets, besides half of those
+# they cover, left for the next open to scan instead of saving them again
+OFFSETS_SLACK = 1 << 20
+
+
+class PackedTable (object):
+    """Append-only data file holding the records of one table, and the
+    offsets of the live one of each row.
+
+    Every record is a header line, 'length name' or '- name' for a removed
+    row, followed by that many bytes of plain format.  The offsets are
+    saved next to the data file with the data size they cover; what was
+    appended past it, or all of it if they are missing, is recovered by
+    scanning the data file."""
+
+    def __init__ (self, location):
+        self.location = location
+        self.offsets_location = location[:-5] + '.offsets'
+        # Row name -> (offset, length) of its record
+        self.offsets = {}
+        self.ident = None
+        self.size = 0
+        self.garbage = 0
+        # Data size covered by the saved offsets
+        self.saved = 0
+        self.dirty = False
+        self._reader = None
+        self._writer = None
+        # Process the files were opened by
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def close (self):
+        for fileobj in (self._reader, self._writer):
+            if fileobj:
+                fileobj.close()
+        self._reader = self._writer = None
+
+    def _reopen_after_fork (self):
+        # Inherited files share their offset with the parent and the other
+        # children, so seeking them races
+        if self._pid != os.getpid():
+            self.close()
+            self._pid = os.getpid()
+
+    def refresh (self):
+        """Catch up with the data file as written by anyone."""
+
+        with self._lock:
+            self._reopen_after_fork()
+            self._refresh()
+
+    def _refresh (self):
+        try:
+            st = os.stat(self.location)
+        except OSError:
+            st = None
+
+        if st == None or st.st_ino != self.ident or st.st_size < self.size:
+            self.close()
+            self.offsets, self.ident, self.size, self.garbage = {}, None, 0, 0
+            self.saved = 0
+            if st == None:
+                return
+
+            self.ident = st.st_ino
+            self._load_offsets(st.st_size)
+
+        if st.st_size != self.size:
+            self._scan()
+
+    def _load_offsets (self, end):
+        if not os.path.isfile(self.offsets_location):
+            return
+
+        fileobj = open(self.offsets_location, 'rb')
+        try:
+            ident, size, garbage = map(int, fileobj.readline().split())
+            if ident != self.ident or size > end:
+                return
+
+            offsets = {}
+            for line in fileobj:
+                offset, length, name = line[:-1].split(' ', 2)
+                offsets[name.decode('utf-8')] = (int(offset), int(length))
+        except ValueError:
+            return
+        finally:
+            fileobj.close()
+
+        self.offsets, self.size, self.garbage = offsets, size, garbage
+        self.saved = size
+
+    def _scan (self):
+        fileobj = open(self.location, 'rb')
+        try:
+            end = os.fstat(fileobj.fileno()).st_size
+            fileobj.seek(self.size)
+
+            while True:
+                line = fileobj.readline()
+                if not line.endswith('\n'):
+                    break
+
+                length, name = line[:-1].split(' ', 1)
+                name = name.decode('utf-8')
+                if name in self.offsets:
+                    self.garbage += self.offsets.pop(name)[1]
+
+                if length == '-':
+                    self.garbage += len(line)
+                else:
+                    offset = fileobj.tell()
+                    if offset + int(length) > end:
+                        break
+                    self.offsets[name] = (offset, int(length))
+                    fileobj.seek(int(length), 1)
+
+                self.size = fileobj.tell()
+        finally:
+            fileobj.close()
+
+        self.dirty = True
+
+    def read (self, name):
+        with self._lock:
+            offset, length = self.offsets[name]
+
+            self._reopen_after_fork()
+            if self._reader == None:
+                self._reader = open(self.location, 'rb')
+            self._reader.seek(offset)
+            return self._reader.read(length)
+
+    def append (self, entries):
+        """Append the (name, data) entries in one write, a data of None
+        removing the row.  Bytes past the last complete record, left by a
+        crash, are overwritten."""
+
+        with self._lock:
+            self._reopen_after_fork()
+            if self._writer == None:
+                if not os.path.exists(self.location):
+                    open(self.location, 'ab').close()
+                self._writer = open(self.location, 'r+b')
+                self.ident = os.fstat(self._writer.fileno()).st_ino
+
+        chunks = []
+        offset = self.size
+        for name, data in entries:
+            if name in self.offsets:
+                self.garbage += self.offsets.pop(name)[1]
+
+            if data == None:
+                chunk = '- %s\n' % name.encode('utf-8')
+                self.garbage += len(chunk)
+            else:
+                chunk = '%d %s\n' % (len(data), name.encode('utf-8'))
+                self.offsets[name] = (offset + len(chunk), len(data))
+                chunk += data
+
+            chunks.append(chunk)
+            offset += len(chunk)
+
+        with self._lock:
+            self._writer.seek(self.size)
+            self._writer.write(''.join(chunks))
+            self._writer.truncate()
+            self._writer.flush()
+
+        self.size = offset
+        self.dirty = True
+
+    def fileno (self):
+        return self._writer.fileno()
+
+    @property
+    def unsaved (self):
+        """Whether the offsets should be saved: they never were, or too
+        much was appended past them for the next open to scan it all."""
+
+        return self.dirty and (not self.saved or self.size - self.saved >
+                               max(OFFSETS_SLACK, self.saved // 2))
+
+
+class Packed (Independent):
+    """Strategy keeping all the rows of a table in one append-only data
+    file, <table>.pack, with the offset of each row in <table>.offsets.
+    Rows are located at <table>.pack/<pk>.conf as if it were a directory.
+    A point load reads one record at its offset, and a changed row appends
+    a new record; the ones replaced are reclaimed by compact(), which runs
+    on sync_locations() once they make up half of a large file."""
+
+    def __init__ (self):
+        self._tables = {}
+        super(Packed, self).__init__()
+
+    def bind (self, location):
+        super(Packed, self).bind(location)
+
+        for table in self._tables.values():
+            table.close()
+        self._tables = {}
+
+    def get_location (self, entity, pk=None):
+        location = super(Packed, self).get_location(entity, pk)
+
+        if isinstance(entity, tesql.orm.Entity):
+            pk = entity.pk
+
+        if entity.meta.singleton or (entity.meta.name, pk) in self._locations:
+            return location
+        elif pk == None:
+            return location + '.pack'
+        else:
+            head, tail = os.path.split(location)
+            return os.path.join(head + '.pack', tail)
+
+    def make_location (self, entity, pk=None):
+        location = self.get_location(entity)
+
+        if entity.meta.singleton or not location.endswith('.pack'):
+            return super(Packed, self).make_location(entity, pk)
+
+        if not os.path.isdir(os.path.dirname(location)):
+            os.makedirs(os.path.dirname(location))
+
+        return self.get_location(entity, pk)
+
+    @staticmethod
+    def is_packed (location):
+        return os.path.dirname(location).endswith('.pack')
+
+    @classmethod
+    def claims_location (cls, location):
+        return cls.is_packed(location)
+
+    def _table (self, location):
+        if location not in self._tables:
+            self._tables[location] = PackedTable(location)
+
+        table = self._tables[location]
+        table.refresh()
+        return table
+
+    def get_stamp (self, location):
+        if not location.endswith('.pack'):
+            return super(Packed, self).get_stamp(location)
+
+        try:
+            st = os.stat(location)
+        except OSError:
+            return None
+
+        return (st.st_mtime, st.st_ino, st.st_size)
+
+    def get_file_stamp (self, location):
+        if not self.is_packed(location):
+            return super(Packed, self).get_file_stamp(location)
+
+        # A row is rewritten by appending a new record, elsewhere
+        head, tail = os.path.split(location)
+        table = self._table(head)
+        if tail[:-5] not in table.offsets:
+            return None
+
+        return (table.ident,) + table.offsets[tail[:-5]]
+
+    def list_directory (self, location):
+        if not location.endswith('.pack'):
+            return super(Packed, self).list_directory(location)
+
+        return [os.path.join(location, x + '.conf')
+                for x in sorted(self._table(location).offsets)]
+
+    def list_location (self, entity, pk=None):
+        location = self.get_location(entity, pk)
+
+        if self.is_packed(location):
+            head, tail = os.path.split(location)
+            return tail[:-5] in self._table(head).offsets and location or None
+
+        return super(Packed, self).list_location(entity, pk)
+
+    def load_location_as_dictionaries (self, location):
+        if not self.is_packed(location):
+            return super(Packed, self).load_location_as_dictionaries(location)
+
+        head, tail = os.path.split(location)
+        table = self._table(head)
+        if tail[:-5] not in table.offsets:
+            raise IOError("File '%s' not found" % location)
+
+        if not self.cache:
+            return self._read_record(table.read(tail[:-5]))
+
+        stamp = (table.ident,) + table.offsets[tail[:-5]]
+        objs = self.cache.get(location, stamp)
+        if objs == None:
+            objs = self._read_record(table.read(tail[:-5]))
+            self.cache.put(location, stamp, objs)
+
+        return objs
+
+    @staticmethod
+    def _read_record (data):
+        format = data.startswith(binary.MAGIC) and binary or plain
+        return list(format.read_objects(StringIO(data)))
+
+    def _append (self, head, entries):
+        if not os.path.isdir(os.path.dirname(head)):
+            os.makedirs(os.path.dirname(head))
+
+        table = self._table(head)
+        table.append(entries)
+
+        if self.sync == 'file':
+            os.fsync(table.fileno())
+        elif self.sync == 'commit':
+            self._unsynced.add(head)
+
+    def write_location (self, location, data):
+        if not self.is_packed(location):
+            return super(Packed, self).write_location(location, data)
+
+        head, tail = os.path.split(location)
+        self._append(head, [(tail[:-5], data)])
+
+    def remove_locations (self, locations):
+        tables = {}
+        for location in locations:
+            if self.is_packed(location):
+                head, tail = os.path.split(location)
+                tables.setdefault(head, []).append((tail[:-5], None))
+
+        for head, entries in tables.iteritems():
+            self._append(head, entries)
+
+        super(Packed, self).remove_locations(
+                [x for x in locations if not self.is_packed(x)])
+
+    def sync_locations (self):
+        """Fsync the data written since the last call, compacting the tables
+        that need it.  Offsets are saved when missing, and otherwise only
+        once the records appended past them outgrow what an open should
+        scan, so commits only append."""
+
+        super(Packed, self).sync_locations()
+
+        for table in self._tables.values():
+            if table.garbage > COMPACT_SIZE and \
+               table.garbage * 2 > table.size:
+                self._compact(table)
+            elif table.unsaved and os.path.exists(table.location):
+                self._save_offsets(table)
+
+    def compact (self, entity):
+        """Rewrite the data file of entity with only its live records."""
+
+        self._compact(self._table(self.get_location(entity)))
+
+    def _compact (self, table):
+        if not os.path.exists(table.location):
+            return
+
+        fileobj = self.open_location(table.location)
+        try:
+            offsets = {}
+            for name in sorted(table.offsets):
+                data = table.read(name)
+                fileobj.write('%d %s\n' % (len(data), name.encode('utf-8')))
+                offsets[name] = (fileobj.tell(), len(data))
+                fileobj.write(data)
+            size = fileobj.tell()
+        except:
+            self.discard_location(fileobj)
+            raise
+        self.close_location(fileobj, table.location)
+
+        table.close()
+        table.offsets, table.size, table.garbage = offsets, size, 0
+        table.ident = os.stat(table.location).st_ino
+        self._save_offsets(table)
+
+    def _save_offsets (self, table):
+        fileobj = self.open_location(table.offsets_location)
+        try:
+            fileobj.write('%d %d %d\n' % (table.ident, table.size,
+                                          table.garbage))
+            for name, (offset, length) in sorted(table.offsets.iteritems()):
+                fileobj.write('%d %d %s\n' % (offset, length,
+                                              name.encode('utf-8')))
+        except:
+            self.discard_location(fileobj)
+            raise
+        self.close_location(fileobj, table.offsets_location, durable=False)
+
+        table.saved = table.size
+        table.dirty = False
+
+
+from tesql import __author__, __license__, __version__
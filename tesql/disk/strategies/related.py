@@ -17,20 +17,21 @@
 
 import os
 
-from glob import iglob
 from StringIO import StringIO
 
 import tesql
 
-# FIXME: Make flexible
-from tesql.disk.formats.plain import write_object
-
 from base import BaseDiskStrategy
 
 class Related (BaseDiskStrategy):
 
     def __init__ (self):
         self._locations = {}
+        self._listings = {}
+        self._unsynced = set()
+        self._formats = {}
+        # File -> (file stamp, names of the entities with a section in it)
+        self._manifests = {}
 
         self.bind(os.path.join(os.getcwdu(), '.tesqldb'))
 
@@ -104,28 +105,50 @@ class Related (BaseDiskStrategy):
         location = self.get_location(entity, pk)
 
         if isinstance(entity, type) and pk == None:
-            res = iglob(os.path.join(location, '*.conf'))
+            res = self.list_directory(location)
 
             if res and entity.entity_has_foreign_key:
-                nres = []
-                for path in res:
-                    dicts = self.load_location_as_dictionaries(path)
-                    # FIXME: add dicts to session
-                    if any(x.name == entity.meta.name for x in dicts):
-                        nres.append(path)
-
-                res = nres
+                res = [x for x in res
+                       if entity.meta.name in self.list_sections(x)]
         else:
             res = os.path.isfile(location) and location or None
 
             if res and entity.entity_has_foreign_key:
-                dicts = self.load_location_as_dictionaries(location)
-                # FIXME: add dicts to session
-                res = any(x.name == entity.meta.name for x in dicts) and \
-                    res or None
+                res = entity.meta.name in self.list_sections(location) and \
+                      res or None
 
         return res
 
+    def list_sections (self, location):
+        """Return the names of the entities with a row in the file location.
+        Files are only parsed when they changed since last asked, and the
+        rows read are added to the Session unless already in it."""
+
+        stamp = self.get_file_stamp(location)
+
+        if location not in self._manifests or \
+           self._manifests[location][0] != stamp:
+            dicts = self.load_location_as_dictionaries(location)
+            self._manifests[location] = (stamp,
+                                         frozenset(x.name for x in dicts))
+            self._add_dictionaries(location, dicts)
+
+        return self._manifests[location][1]
+
+    def _add_dictionaries (self, location, dicts):
+        session = tesql.orm.Session.default
+        tail = os.path.basename(location)
+
+        for obj in dicts:
+            try:
+                entity = tesql.orm.Entity.get_entity_type_by_name(obj.name)
+            except KeyError:
+                continue
+
+            if not session.is_cached(entity,
+                                     self.list_primary_key(entity, location)):
+                self._load_dictionaries([obj], tail[:-5])
+
     def list_primary_key (self, entity, location):
         base = entity.meta.name in self._locations and \
                self._locations[entity.meta.name] or self.base_location
@@ -136,34 +159,56 @@ class Related (BaseDiskStrategy):
         head, tail = os.path.split(location)
         return entity.entity_pk.unmarshal(tail[:-5])
 
-    def store_location (self, instance):
+    def render_location (self, instance):
+        """Return the location instance is stored at, the contents to store
+        there and the instances these contents hold: instance (or the one
+        it is a foreign key of) and those depending on it."""
+
         if instance.entity_has_foreign_key:
             pk = instance.entity_pk_value
             entity = instance.entity_foreign_key_entity
             instance = tesql.orm.Session.default.get(entity, pk)
-            return self.store_location(instance)
+            return self.render_location(instance)
+
+        session = tesql.orm.Session.default
+        location = self.get_location(instance)
+        pk = instance.entity_pk_value
+        instances = [instance]
+
+        for entity in type(instance).entity_dependents:
+            if session.is_deleted(entity, pk):
+                continue
 
-        location = self.make_location(instance)
+            # Rows not in the Session can only come from the file itself
+            if not session.is_cached(entity, pk) and \
+               (not os.path.isfile(location) or
+                entity.meta.name not in self.list_sections(location)):
+                continue
 
-        fileobj = open(location, 'w')
+            instances.append(session.get(entity, pk))
 
-        write_object(instance.entity_as_dictionary, fileobj)
-        tesql.orm.Session.default.modify(instance, changed=False)
+        # The whole file takes the format of the entity the others depend on
+        fileobj = StringIO()
+        self.get_format(type(instance)).write_objects(
+                [x.entity_as_dictionary for x in instances], fileobj)
 
-        for entity in tesql.orm.Entity.entities.itervalues():
-            if entity.entity_has_foreign_key:
-                fk = entity
-                while fk.entity_has_foreign_key:
-                    fk = fk.entity_foreign_key_entity
-                if fk == type(instance):
-                    if tesql.orm.Session.default.has(entity,
-                                                     instance.entity_pk_value):
-                        inst = tesql.orm.Session.default.get(entity,
-                                                             instance.entity_pk_value)
+        return location, fileobj.getvalue(), instances
+
+    def dispose_location (self, instance):
+        # Rows depending on another are dropped by rewriting its file,
+        # unless it goes away as well
+        if instance.entity_has_foreign_key and tesql.orm.Session.default.has(
+                instance.entity_foreign_key_entity, instance.entity_pk_value):
+            return self.render_location(instance)
+
+        return super(Related, self).dispose_location(instance)
+
+    def store_location (self, instance):
+        location, data, instances = self.render_location(instance)
+        self.write_location(location, data)
 
-                        write_object(inst.entity_as_dictionary, fileobj)
-                        tesql.orm.Session.default.modify(inst, changed=False)
-        fileobj.close()
+        for inst in instances:
+            tesql.orm.Session.default.modify(inst, changed=False)
 
 
 from tesql import __author__, __license__, __version__
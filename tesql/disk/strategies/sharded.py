@@ -0,0 +1,171 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import string
+import sys
+
+from hashlib import md5
+
+import tesql
+
+from independent import Independent
+
+
+# Levels of shard directories and hex digits naming each of them
+DEPTH = 1
+WIDTH = 2
+
+
+def shard (name, depth=DEPTH, width=WIDTH):
+    """Return the shard directories of the row file named name + '.conf'."""
+
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+
+    digest = md5(name).hexdigest()
+    return [digest[i * width:(i + 1) * width] for i in xrange(depth)]
+
+
+def is_shard (name, width=WIDTH):
+    return len(name) == width and all(x in string.hexdigits for x in name)
+
+
+def migrate_directory (location, depth=DEPTH, width=WIDTH):
+    """Move the row files found directly in the table directory location
+    into their shard directories, returning how many were moved.  Each
+    file is renamed, so it is never missing nor duplicated."""
+
+    count = 0
+    for name in sorted(os.listdir(location)):
+        path = os.path.join(location, name)
+        if not name.endswith('.conf') or name.startswith('.') or \
+           not os.path.isfile(path):
+            continue
+
+        head = os.path.join(location, *shard(name[:-5], depth, width))
+        if not os.path.isdir(head):
+            os.makedirs(head)
+        os.rename(path, os.path.join(head, name))
+        count += 1
+
+    return count
+
+
+class Sharded (Independent):
+    """Independent strategy spreading the rows of each table over hashed
+    prefix subdirectories, <table>/<md5(pk)[:2]>/<pk>.conf, so no single
+    directory grows past a few thousand files.  Subclasses can change the
+    number of levels (depth) and their hex digits (width).
+
+    Every row written or removed touches the table directory, so its stamp
+    alone tells whether any shard changed."""
+
+    depth = DEPTH
+    width = WIDTH
+
+    def get_location (self, entity, pk=None):
+        location = super(Sharded, self).get_location(entity, pk)
+
+        if isinstance(entity, tesql.orm.Entity):
+            pk = entity.pk
+
+        if pk == None or entity.meta.singleton or \
+           (entity.meta.name, pk) in self._locations:
+            return location
+
+        head, tail = os.path.split(location)
+        return os.path.join(head, *shard(tail[:-5], self.depth, self.width) +
+                                   [tail])
+
+    def get_table (self, location):
+        """Return the table directory holding the row file location in its
+        shards, or None if it is not in one."""
+
+        head = os.path.dirname(location)
+        for level in xrange(self.depth):
+            if not is_shard(os.path.basename(head), self.width):
+                return None
+            head = os.path.dirname(head)
+
+        return head
+
+    def touch_tables (self, locations):
+        """Update the stamp of the table directories of the row files at
+        locations."""
+
+        for table in set(self.get_table(x) for x in locations):
+            if table != None:
+                os.utime(table, None)
+
+    def write_location (self, location, data):
+        super(Sharded, self).write_location(location, data)
+        self.touch_tables([location])
+
+    def remove_locations (self, locations):
+        super(Sharded, self).remove_locations(locations)
+        self.touch_tables(locations)
+
+    def list_shards (self, location):
+        """Return the sorted paths of the deepest shard directories of the
+        table directory location."""
+
+        shards = [location]
+        for level in xrange(self.depth):
+            shards = [os.path.join(x, name) for x in shards
+                      if os.path.isdir(x)
+                      for name in sorted(os.listdir(x))
+                      if is_shard(name, self.width)]
+
+        return shards
+
+    def list_location (self, entity, pk=None):
+        location = self.get_location(entity, pk)
+
+        if isinstance(entity, type) and pk == None and \
+           not entity.meta.singleton:
+            return [x for head in self.list_shards(location)
+                    for x in self.list_directory(head)]
+        else:
+            return super(Sharded, self).list_location(entity, pk)
+
+    def migrate (self, entity):
+        """Move the rows of entity stored by the Independent strategy into
+        their shards, returning how many were moved."""
+
+        location = self.get_location(entity)
+        if entity.meta.singleton or not os.path.isdir(location):
+            return 0
+
+        count = migrate_directory(location, self.depth, self.width)
+        os.utime(location, None)
+        if self.sync != 'never':
+            for head in [location] + self.list_shards(location):
+                self._fsync(head)
+
+        return count
+
+
+from tesql import __author__, __license__, __version__
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python -m tesql.disk.strategies.sharded TABLE...")
+
+    for location in sys.argv[1:]:
+        print '%s: %d rows moved' % (location, migrate_directory(location))
@@ -30,6 +30,10 @@ options: the general purpose decorator, with it you can set several options
 
 location: to set the storage location for an entity.
 
+strategy: to set how the rows of an entity are laid out on disk.
+
+file_format: to set the file format the rows of an entity are written in.
+
 Examples:
 
 Using an entity as a configuration storage via location decorator:
@@ -56,12 +60,20 @@ Using an entity as a configuration storage via options decorator:
 ...
 >>> Settings = options(location='/etc/foo.conf')(Settings)  # python < 2.6
 
+Keeping a machine written table in the binary format:
+
+>>> @options(format='binary')  # python >= 2.6
+... class Sample (Entity):
+...     value = Field(String)
+...
+>>> Sample = options(format='binary')(Sample)  # python < 2.6
+
 """
 
 from tesql.orm import Session
 
 
-def options (strategy=None, location=None):
+def options (strategy=None, location=None, format=None):
     """This decorator sets different options of an entity depending on which
     keyword arguments are passed to it. For the exact description of how
     the different keyword arguments affect the entity see the descriptions
@@ -69,10 +81,15 @@ def options (strategy=None, location=None):
     """
 
     def options_decorator (cls):
-        # FIXME: Add support for changing strategies
+        if strategy:
+            Session.default.bind_strategy(cls, strategy)
+
         if location:
             Session.default.bind_entity(cls, location)
 
+        if format:
+            Session.default.bind_format(cls, format)
+
         return cls
 
     return options_decorator
@@ -98,5 +115,20 @@ def location (path):
     """
     return options(location=path)
 
+def strategy (name):
+    """This decorator sets the strategy used to lay out the rows of the
+    entity on disk: a class of tesql.disk.strategies or the name it is
+    registered with (independent, related, sharded or packed).
+    """
+    return options(strategy=name)
+
+def file_format (name):
+    """This decorator sets the format the rows of the entity are written
+    in: a module of tesql.disk.formats or the name it is registered with
+    (plain or binary).  Rows already stored in another format can still be
+    read.
+    """
+    return options(format=name)
+
 
 from tesql import __author__, __license__, __version__
@@ -15,6 +15,7 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import sys
 
 from tesql.disk.objects import make_object
 from tesql.disk.objects import BaseObject
@@ -29,6 +30,8 @@ from tesql.query import Query
 class EntityMeta (type):
 
     entities = {}
+    # Name of each entity -> names of those with a foreign key chain to it
+    dependents = {}
 
     def __init__ (cls, name, bases, ns):
         super(EntityMeta, cls).__init__(name, bases, ns)
@@ -54,6 +57,8 @@ class EntityMeta (type):
         for entity in cls.entities.itervalues():
             entity._constraint_fields()
 
+        cls._map_dependents()
+
     def _register_field (cls, name, field):
         # FIXME: Set docstring to 'doc' argument of field
         #        plus text representation of the restrictions.
@@ -75,6 +80,25 @@ class EntityMeta (type):
             if cls._fields[field.name].is_constrained:
                 field.constrain(cls)
 
+    def _map_dependents (cls):
+        dependents = {}
+
+        for entity in cls.entities.itervalues():
+            root = entity
+            try:
+                while root.entity_has_foreign_key:
+                    root = root.entity_foreign_key_entity
+            except AttributeError:
+                # Foreign key to an entity not defined yet
+                continue
+
+            if root is not entity:
+                dependents.setdefault(root.meta.name,
+                                      set()).add(entity.meta.name)
+
+        cls.dependents.clear()
+        cls.dependents.update(dependents)
+
     def _register_entity (cls):
         cls._entity_name = cls.__name__
         cls.entities[cls.__name__] = cls
@@ -160,6 +184,13 @@ class EntityMeta (type):
     def entity_foreign_key_entity (cls):
         return cls.entity_pk.foreign_key_entity
 
+    @property
+    def entity_dependents (cls):
+        """Entities whose foreign key leads to this one, sorted by name."""
+        return [cls.entities[x] for x in
+                sorted(cls.dependents.get(cls.meta.name, ()))
+                if x in cls.entities]
+
 class Entity (object):
 
     __metaclass__ = EntityMeta
@@ -262,9 +293,34 @@ class Entity (object):
         name = name == 'pk' and self.meta.pk.name or name
         return self._fields[name].get_data(instance=self)
 
+    def field_get_keys (self, name):
+        """Return the primary keys referenced by the field name without
+        loading the referenced instances."""
+
+        return self._fields[name].get_keys()
+
     def field_set (self, name, value, check=True):
+        Session.default.preserve(self)
         self._fields[name].set_data(value, check=check, instance=self)
         self.meta.touch()
 
+    def entity_snapshot (self):
+        """Return a copy of the data of every field, for entity_restore()."""
+
+        return dict((name, data.__getstate__()) for name, data in
+                    self._fields.iteritems())
+
+    def entity_restore (self, snapshot):
+        for name, state in snapshot.iteritems():
+            self._fields[name].__setstate__(state)
+
+    def entity_size (self):
+        """Return the approximate memory used by this instance, in bytes.
+        Referenced instances are not followed."""
+
+        return sys.getsizeof(self) + sys.getsizeof(self._fields) + \
+               sum(sys.getsizeof(data) + sys.getsizeof(data._data)
+                   for data in self._fields.itervalues())
+
 
 from tesql import __author__, __license__, __version__
@@ -17,6 +17,8 @@
 
 import inspect
 
+import tesql
+
 from tesql.types import OneToOne
 from tesql.types.base import BaseType
 from tesql.types.constraints import list_constraints
@@ -64,6 +66,7 @@ class Field (object):
             kwargs.pop('unique', None)
 
         self._virtual = kwargs.pop('virtual', False)
+        self._indexed = kwargs.pop('index', False)
         self._autoincrement = kwargs.pop('autoincrement', False)
         self._default = kwargs.pop('default', None)
 
@@ -113,6 +116,14 @@ class Field (object):
     def is_singleton (self):
         return self._singleton
 
+    @property
+    def is_indexed (self):
+        return self._indexed or self.is_unique
+
+    @property
+    def is_unique (self):
+        return bool(self._kwargs.get('unique', False))
+
     @property
     def is_autoincrementing (self):
         return self._autoincrement
@@ -152,9 +163,24 @@ class Field (object):
     def field_name (self):
         return self._field_name
 
+    @property
+    def entity (self):
+        return self._entity
+
     def set_name (self, entity, name):
         self._name = self._name or name
         self._field_name = name
+        self._entity = entity
+
+    def index_lookup (self, entity, operator, value):
+        """Return the primary keys of entity that may satisfy 'field
+        operator value' according to the field's index, or None if the
+        field is not indexed."""
+
+        if not self.is_indexed:
+            return None
+
+        return tesql.orm.Session.default.lookup(entity, self, operator, value)
 
 
 from tesql import __author__, __license__, __version__
@@ -15,14 +15,38 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from tesql.disk.cache import CacheClient
+from tesql.disk.formats import get_format
+from tesql.disk.journal import Journal
+from tesql.disk.sequence import Sequence
 from tesql.disk.strategies import Independent
+from tesql.disk.strategies import STRATEGIES
+from tesql.disk.strategies import get_strategy
 from tesql.query import Query
+from tesql.query import Index
+
+
+# Journal size past which a commit checkpoints it
+JOURNAL_LIMIT = 4 << 20
+
+# Outdated lines an index file may hold beyond its live ones before it is
+# rewritten instead of appended to
+INDEX_SLACK = 1024
+
 
 class CachedInstance (object):
 
-    def __init__ (self, entity, changed=False):
+    def __init__ (self, entity, changed=False, image=None):
         self.entity = entity
         self.changed = changed
+        # Snapshot of entity before its changes, None if it is new
+        self.image = image
+        self.deleted = False
 
 
 class SessionCache (dict):
@@ -34,8 +58,8 @@ class SessionCache (dict):
         else:
             return (entity.meta.name, entity.entity_pk_value)
 
-    def append (self, entity, changed=False):
-        self[self.etokey(entity)] = CachedInstance(entity, changed)
+    def append (self, entity, changed=False, image=None):
+        self[self.etokey(entity)] = CachedInstance(entity, changed, image)
 
     def remove (self, entity):
         del self[self.etokey(entity)]
@@ -47,6 +71,112 @@ class SessionCache (dict):
         return self[self.etokey(entity)].changed
 
 
+class IdentityMap (SessionCache):
+    """SessionCache holding at most max_rows instances, or about max_bytes
+    of them.  Past that the least recently used ones are evicted, except
+    those for which pinned(key) is true.  These are set aside as they are
+    found, and only return to the LRU order through unpin(key).  Each key
+    evicted is passed to evicted(key)."""
+
+    def __init__ (self, max_rows=None, max_bytes=None, pinned=None,
+                  evicted=None):
+        super(IdentityMap, self).__init__()
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.pinned = pinned
+        self.evicted = evicted
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Keys from least to most recently used, with their sizes
+        self._recent = OrderedDict()
+        # Keys found pinned while evicting, with their sizes
+        self._pinned = {}
+
+    def __setitem__ (self, key, cached):
+        super(IdentityMap, self).__setitem__(key, cached)
+
+        size = self.max_bytes and cached.entity.entity_size() or 0
+        if key in self._pinned:
+            self.bytes += size - self._pinned[key]
+            self._pinned[key] = size
+        else:
+            self.bytes += size - self._recent.pop(key, 0)
+            self._recent[key] = size
+
+        self._evict(key)
+
+    def __delitem__ (self, key):
+        super(IdentityMap, self).__delitem__(key)
+
+        if key in self._pinned:
+            self.bytes -= self._pinned.pop(key)
+        else:
+            self.bytes -= self._recent.pop(key)
+
+    def clear (self):
+        super(IdentityMap, self).clear()
+        self._recent.clear()
+        self._pinned.clear()
+        self.bytes = 0
+
+    def unpin (self, key):
+        """Put key back in the LRU order, as the most recently used, once
+        pinned(key) is no longer true."""
+
+        if key in self._pinned and not (self.pinned and self.pinned(key)):
+            self._recent[key] = self._pinned.pop(key)
+            self._evict(key)
+
+    def lookup (self, key):
+        """Return the CachedInstance of key and mark it as recently used,
+        or None if it is not cached."""
+
+        if key not in self:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if key in self._recent:
+            self._recent[key] = self._recent.pop(key)
+        return self[key]
+
+    def _full (self):
+        return (self.max_rows != None and len(self) > self.max_rows) or \
+               (self.max_bytes != None and self.bytes > self.max_bytes)
+
+    def _evict (self, keep):
+        while self._full() and self._recent:
+            key = next(iter(self._recent))
+            if key == keep:
+                # Only the key just used is left
+                break
+
+            if self.pinned and self.pinned(key):
+                self._pinned[key] = self._recent.pop(key)
+            else:
+                del self[key]
+                self.evictions += 1
+                if self.evicted:
+                    self.evicted(key)
+
+    @property
+    def stats (self):
+        return {'rows': len(self), 'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class StoredKeys (set):
+    """Primary keys of an entity found on disk when its location had the
+    given stamp."""
+
+    def __init__ (self, keys=(), stamp=None, location=None):
+        super(StoredKeys, self).__init__(keys)
+        self.stamp = stamp
+        self.location = location
+
+
 class SessionStack (object):
 
     def __init__ (self):
@@ -73,9 +203,14 @@ class SessionStack (object):
     def peek (self):
         return self._stack[-1]
 
-    def push (self):
-        if not self._stack or self.peek():
+    def names (self):
+        return [level.name for level in self._stack]
+
+    def push (self, name=None):
+        # Anonymous levels are only pushed on top of non empty ones
+        if name != None or not self._stack or self.peek():
             self._stack.append(SessionCache())
+            self.peek().name = name
 
     def pop (self):
         if self._stack:
@@ -90,14 +225,27 @@ class SessionStack (object):
 
         return False
 
-    def append (self, instance):
-        self.peek().append(instance, changed=True)
+    def append (self, instance, image=None):
+        self.peek().append(instance, changed=True, image=image)
 
     def remove (self, instance):
         for level in reversed(self._stack):
             if level.contains(instance):
                 level.remove(instance)
 
+    def primary_keys (self, entity):
+        name = entity.meta.name
+        return set(pk for level in self._stack for e, pk in level
+                   if e == name)
+
+    def deleted (self, key):
+        return key in self and self.get(key).deleted
+
+    def deleted_keys (self, entity):
+        name = entity.meta.name
+        return set(pk for pk in self.primary_keys(entity)
+                   if self.deleted((name, pk)))
+
 class SessionMeta (type):
 
     def __init__ (cls, name, bases, ns):
@@ -117,22 +265,145 @@ class Session (object):
 
     __metaclass__ = SessionMeta
 
-    def __init__ (self, strategy=Independent):
-        """Construct a new Session."""
-        self._cache = SessionCache()
+    def __init__ (self, strategy=Independent, threads=None, sync='never',
+                  journal=False, cache_rows=None, cache_bytes=None,
+                  read_cache=None):
+        """Construct a new Session.
+
+        strategy is a class of tesql.disk.strategies or its registered name.
+        With threads, rows loaded in batches (get_many, Query.all(), sort
+        and filter scans) are read and parsed on a pool of that many
+        threads.  sync says when written rows are fsynced: 'never', as each
+        'file' is written or once per 'commit'.  With journal, every flush
+        is first appended to a write-ahead journal with a single fsync,
+        making it all-or-nothing, and sync is ignored: written rows are
+        fsynced when the journal is checkpointed.  cache_rows and
+        cache_bytes bound the identity map: past either one the least
+        recently used unchanged instances are dropped from the Session and
+        read again from disk when next needed.  read_cache is the address
+        of a tesql.disk.cache server sharing parsed rows between processes;
+        files are looked up there before being parsed."""
         self._stack = SessionStack()
-        self._strategy = strategy()
-
+        self._cache = IdentityMap(cache_rows, cache_bytes,
+                                  pinned=self._stack.__contains__,
+                                  evicted=self._forget_values)
+        self._sync = journal and 'commit' or sync
+        self._read_cache = read_cache and CacheClient(read_cache) or None
+        # Strategy class -> its instance, and entity name -> the instance
+        # storing it when it is not the default one
+        self._instances = {}
+        self._strategies = {}
+        self._bindings = {}
+        self._strategy = self._instance(get_strategy(strategy))
+        self._indexes = {}
+        self._dirty_indexes = {}
+        self._keys = {}
+        # Entity name -> primary keys of the instances added to this Session
+        # and maybe not stored yet
+        self._unstored_keys = {}
+        self._values = {}
+        # Keys of the rows this Session removed from disk
+        self._removed = set()
+        self._sequences = {}
+        self._threads = threads
+        self._pool = None
+        self._journaled = journal
+        self._journal = None
+
+        self._open_journal()
         self.begin()
 
     def be_default (self):
         type(self).make_default(self)
 
     def bind (self, location):
-        self._strategy.bind(location)
+        for strategy in self._instances.itervalues():
+            strategy.bind(location)
+        self._indexes = {}
+        self._keys = {}
+        self._removed = set()
+        self._sequences = {}
+        self._open_journal()
+
+    def _open_journal (self):
+        if not self._journaled:
+            return
+
+        self._journal = Journal(os.path.join(self._strategy.base_location,
+                                             '.journal'))
+
+        # Redo the commits a crash may have left half written.  The
+        # entities may not be defined yet, so locations only some strategy
+        # understands are handed to it and the rest to the default one.
+        for location, data in self._journal.replay():
+            strategy = self._strategy
+            for cls in STRATEGIES.itervalues():
+                if cls.claims_location(location):
+                    strategy = self._instance(cls)
+
+            if data == None:
+                strategy.remove_locations([location])
+            else:
+                strategy.write_location(location, data)
+        self.checkpoint()
+
+    def checkpoint (self):
+        """Fsync the rows written by journaled commits and empty the
+        journal."""
+
+        if self._journal:
+            self.sync_locations()
+            self._journal.truncate()
+
+    def sync_locations (self):
+        for strategy in self._instances.values():
+            strategy.sync_locations()
+
+    def _instance (self, cls):
+        if cls not in self._instances:
+            strategy = cls()
+            strategy.set_sync(self._sync)
+            if self._read_cache:
+                strategy.set_cache(self._read_cache)
+            if self._instances:
+                strategy.bind(self._strategy.base_location)
+            self._instances[cls] = strategy
+
+        return self._instances[cls]
+
+    def strategy (self, entity):
+        """Return the strategy instance storing the rows of entity."""
+        return self._strategies.get(entity.meta.name, self._strategy)
 
     def bind_entity (self, entity, location):
-        self._strategy.bind_entity(entity, location)
+        self._bindings.setdefault(entity.meta.name, {})['location'] = location
+        self.strategy(entity).bind_entity(entity, location)
+
+    def bind_format (self, entity, format):
+        """Store the rows of entity in format, a module of
+        tesql.disk.formats or the name it is registered with."""
+
+        format = get_format(format)
+        self._bindings.setdefault(entity.meta.name, {})['format'] = format
+        self.strategy(entity).bind_format(entity, format)
+
+    def bind_strategy (self, entity, strategy):
+        """Store the rows of entity with strategy, a class of
+        tesql.disk.strategies or the name it is registered with, instead
+        of the default strategy of this Session.  The location and format
+        already bound to entity carry over."""
+
+        strategy = self._instance(get_strategy(strategy))
+        if strategy is self._strategy:
+            self._strategies.pop(entity.meta.name, None)
+        else:
+            self._strategies[entity.meta.name] = strategy
+
+        bindings = self._bindings.get(entity.meta.name, {})
+        if 'location' in bindings:
+            strategy.bind_entity(entity, bindings['location'])
+        if 'format' in bindings:
+            strategy.bind_format(entity, bindings['format'])
 
     def add (self, instance, changed=False):
         """Place an object in the Session."""
@@ -140,58 +411,516 @@ class Session (object):
             self._stack.append(instance)
 
         self._cache.append(instance)
+        self._unstored_keys.setdefault(instance.meta.name, set()).add(
+                instance.entity_pk_value)
+        self._remember_values(instance)
+
+        if instance.meta.name in self._sequences and \
+           isinstance(instance.entity_pk_value, (int, long)):
+            self._sequences[instance.meta.name].observe(
+                    instance.entity_pk_value)
 
     def modify (self, instance, changed=True):
-        if changed and not self._stack.contains(instance):
-            location = self._strategy.get_location(instance)
-            self._stack.append(instance, location)
-        elif not changed and self._stack.contains(instance):
-            self._stack.remove(instance)
+        if changed:
+            if not self._stack.contains(instance):
+                self._stack.append(instance)
+            self._remember_values(instance)
+        else:
+            if self._stack.contains(instance):
+                self._stack.remove(instance)
+                self._cache.unpin(SessionCache.etokey(instance))
+            self._stored(instance)
 
     def has (self, entity, pk):
         key = SessionCache.etokey(entity, pk)
 
+        if key in self._stack:
+            return not self._stack.get(key).deleted
+
         if key in self._cache:
             return True
 
-        if self._strategy.list_location(entity, pk):
+        strategy = self.strategy(entity)
+        location = strategy.get_location(entity)
+        if os.path.dirname(strategy.get_location(entity, pk)) != location:
+            return bool(strategy.list_location(entity, pk))
+
+        return pk in self._stored_keys(entity)
+
+    def has_value (self, entity, field, value):
+        """Return whether any row of entity, in this Session or on disk, has
+        value in the given field."""
+
+        values = self._values.get((entity.meta.name, field.name))
+        if values and values.lookup('__eq__', value):
             return True
 
+        for pk in self._index(entity, field).lookup('__eq__', value):
+            # The value of the instances in this Session overrides disk
+            if (not values or pk not in values) and \
+               not self._stack.deleted((entity.meta.name, pk)):
+                return True
+
         return False
 
+    def _stored_keys (self, entity):
+        strategy = self.strategy(entity)
+        stamp = strategy.get_location_stamp(entity)
+        keys = self._keys.get(entity.meta.name)
+
+        if keys is None or keys.stamp != stamp:
+            keys = StoredKeys((strategy.list_primary_key(entity, x) for x
+                               in strategy.list_location(entity) or ()),
+                              stamp, strategy.get_location(entity))
+            self._keys[entity.meta.name] = keys
+
+        return keys
+
+    def _remember_values (self, instance):
+        for field in instance.meta.fields:
+            if field.is_unique:
+                key = (instance.meta.name, field.name)
+                if key not in self._values:
+                    self._values[key] = Index()
+                self._values[key].add(instance.entity_pk_value,
+                                      instance.field_get(field.name))
+
+    def _forget_values (self, key):
+        # Only clean rows are evicted, the indexes answer for their values
+        name, pk = key
+        for (e, field), values in self._values.iteritems():
+            if e == name and pk in values:
+                values.remove(pk)
+
+    def _stored (self, instance):
+        name, pk = instance.meta.name, instance.entity_pk_value
+
+        if name in self._keys:
+            self._keys[name].add(pk)
+        if name in self._unstored_keys:
+            self._unstored_keys[name].discard(pk)
+        self._removed.discard((name, pk))
+
+        for field in instance.meta.fields:
+            key = (name, field.name)
+            if key in self._indexes and self._indexes[key].add(pk,
+                                                instance.field_get(field.name)):
+                self._dirty_indexes[key] = (type(instance), field)
+
+    def _unstored (self, instance):
+        name, pk = instance.meta.name, instance.entity_pk_value
+
+        if name in self._keys:
+            self._keys[name].discard(pk)
+        self._removed.add((name, pk))
+
+        for field in instance.meta.fields:
+            key = (name, field.name)
+            if key in self._indexes and pk in self._indexes[key]:
+                self._indexes[key].remove(pk)
+                self._dirty_indexes[key] = (type(instance), field)
+
+    def _restamp (self, location, before, after):
+        for struct in self._indexes.values() + self._keys.values():
+            if struct.location == location and struct.stamp == before:
+                struct.stamp = after
+
     def get (self, entity, pk):
         key = SessionCache.etokey(entity, pk)
         if key in self._stack:
+            if self._stack.get(key).deleted:
+                raise KeyError("%s %r was deleted" % key)
             return self._stack.get(key).entity
 
-        if key not in self._cache:
+        cached = self._cache.lookup(key)
+        if cached == None:
             self.load(entity, pk)
+            cached = self._cache[key]
+
+        return cached.entity
+
+    def get_many (self, entity, pks, skip_missing=False):
+        """Return the instances of entity with the given primary keys, in
+        order.  The keys not yet in this Session are loaded in one batch,
+        reading their files in parallel if the Session has threads.  With
+        skip_missing, keys of deleted instances or with no stored row are
+        left out instead of raising."""
+
+        pks = list(pks)
+
+        missing = []
+        seen = set()
+        for pk in pks:
+            key = SessionCache.etokey(entity, pk)
+            if pk not in seen and key not in self._stack and \
+               self._cache.lookup(key) == None:
+                missing.append(pk)
+            seen.add(pk)
+        missing_keys = set(missing)
+
+        # Kept aside in case the rest of a large batch evicts them
+        loaded = {}
+        if missing:
+            strategy = self.strategy(entity)
+            for instance in strategy.load_locations(entity, missing,
+                                                    self._load_pool()):
+                loaded[SessionCache.etokey(instance)] = instance
+
+        res = []
+        for pk in pks:
+            key = SessionCache.etokey(entity, pk)
+            if skip_missing and (self.is_deleted(entity, pk) or
+                                 pk in missing_keys and key not in loaded):
+                continue
+            elif key in self._stack:
+                res.append(self.get(entity, pk))
+            elif key in self._cache:
+                res.append(self._cache[key].entity)
+            elif key in loaded:
+                res.append(loaded[key])
+            else:
+                res.append(self.get(entity, pk))
+
+        return res
+
+    def is_cached (self, entity, pk):
+        """Return whether the instance of entity with primary key pk is
+        already in this Session."""
+
+        key = SessionCache.etokey(entity, pk)
+        return key in self._stack or key in self._cache
 
-        return self._cache.get(key).entity
+    def is_deleted (self, entity, pk):
+        """Return whether the instance of entity with primary key pk was
+        deleted in this Session, whether its row is already removed from
+        disk or not."""
+
+        key = SessionCache.etokey(entity, pk)
+        if key in self._stack:
+            return self._stack.get(key).deleted
+
+        return key in self._removed
+
+    @property
+    def cache_stats (self):
+        """Dictionary with the number of instances in the identity map, their
+        approximate size in bytes (only measured with cache_bytes) and the
+        hits, misses and evictions counted so far."""
+        return self._cache.stats
+
+    @property
+    def threads (self):
+        """Number of threads loading rows in parallel, None if disabled."""
+        return self._threads
+
+    def _load_pool (self):
+        if self._pool == None and self._threads > 1:
+            self._pool = ThreadPool(self._threads)
+
+        return self._pool
 
     def list_primary_keys (self, entity):
-        res = []
-        for location in self._strategy.list_location(entity):
-            res.append(self._strategy.list_primary_key(entity, location))
+        name = entity.meta.name
+        keys = self._stored_keys(entity)
+        deleted = self._stack.deleted_keys(entity)
+
+        # Instances expunged or deleted since they were added are dropped
+        unstored = self._unstored_keys.get(name, set())
+        unstored.difference_update([pk for pk in unstored if pk in keys or
+                                    (name, pk) not in self._cache])
 
-        for pk in (pk for e, pk in self._cache if e == entity.meta.name):
-            if pk not in res:
-                res.append(pk)
+        res = sorted(keys - deleted)
+        res.extend(sorted(unstored))
 
         return res
 
-    def load (self, entity, pk):
-        self._strategy.load_location(entity, pk)
+    def lookup (self, entity, field, operator, value):
+        """Return the set of primary keys of entity whose field may satisfy
+        'field operator value' using the field's index, or None if the index
+        can not answer it.  Instances changed in this Session are always
+        included, as the index only reflects what is stored on disk, and
+        those deleted never are."""
 
-    def store (self, instance):
-        self._strategy.store_location(instance)
+        if not field.is_indexed or field.entity is not entity:
+            return None
+
+        res = self._index(entity, field).lookup(operator, value)
+        self._save_indexes()
+
+        if res is not None:
+            res.update(self._stack.primary_keys(entity))
+            res.difference_update(self._stack.deleted_keys(entity))
+
+        return res
+
+    def _index (self, entity, field):
+        key = (entity.meta.name, field.name)
+        stamp = self.strategy(entity).get_location_stamp(entity)
+
+        if key not in self._indexes:
+            self._indexes[key] = self._load_index(entity, field)
+
+        if self._indexes[key].stamp != stamp:
+            self._refresh_index(entity, field, self._indexes[key])
+            self._indexes[key].stamp = stamp
+
+        return self._indexes[key]
+
+    def _load_index (self, entity, field):
+        strategy = self.strategy(entity)
+        index = Index(None, strategy.get_location(entity))
 
-        if self._stack.contains(instance):
+        location = strategy.get_index_location(entity, field.name)
+        if location != None and os.path.isfile(location):
+            fileobj = open(location, 'r')
+            try:
+                if not index.load(fileobj, entity.entity_pk.unmarshal,
+                                  field.unmarshal):
+                    index = Index(None, strategy.get_location(entity))
+            finally:
+                fileobj.close()
+
+        return index
+
+    def _refresh_index (self, entity, field, index):
+        """Bring index up to date with the files of entity.  Only the files
+        whose stamp differs from the one their row was indexed with are
+        read, which also catches files rewritten in place."""
+
+        strategy = self.strategy(entity)
+
+        if field.default != None:
+            default = field.default
+        else:
+            default = field.field.get_data()
+
+        listed = set()
+        for location in strategy.list_location(entity) or ():
+            pk = strategy.list_primary_key(entity, location)
+            stamp = strategy.get_file_stamp(location)
+            listed.add(pk)
+
+            if pk in index:
+                if index.get_stamp(pk) == stamp:
+                    continue
+                index.remove(pk)
+
+            for obj in strategy.load_location_as_dictionaries(location):
+                if obj.name != entity.meta.name:
+                    continue
+
+                if field.name in obj:
+                    index.add(pk, field.unmarshal(obj[field.name]), stamp)
+                elif field.is_primary_key:
+                    index.add(pk, pk, stamp)
+                else:
+                    index.add(pk, default, stamp)
+
+        gone = [pk for pk in index if pk not in listed]
+        for pk in gone:
+            index.remove(pk)
+
+        if gone or index.changed:
+            self._dirty_indexes[entity.meta.name, field.name] = (entity, field)
+
+    def _stamp_indexes (self, instances, strategy, location):
+        """Record the stamp of location, the file the instances were just
+        written to, in the indexes of their entities."""
+
+        stamp = None
+        for instance in instances:
+            name, pk = instance.meta.name, instance.entity_pk_value
+            for field in instance.meta.fields:
+                key = (name, field.name)
+                if key in self._indexes and pk in self._indexes[key]:
+                    if stamp == None:
+                        stamp = strategy.get_file_stamp(location)
+                    self._indexes[key].add(pk, self._indexes[key].get(pk),
+                                           stamp)
+                    self._dirty_indexes[key] = (type(instance), field)
+
+    def _save_indexes (self):
+        """Write out the indexes changed.  Only the rows changed since the
+        last time are appended to an index file, which is rewritten once
+        most of its lines are outdated."""
+
+        for key, (entity, field) in self._dirty_indexes.items():
+            del self._dirty_indexes[key]
+
+            if key not in self._indexes:
+                continue
+            index = self._indexes[key]
+
+            def marshal (value):
+                data = field.field
+                data.set_data(value, check=False)
+                return data.marshal()
+
+            def marshal_pk (pk):
+                return unicode(pk).encode('utf-8')
+
+            strategy = self.strategy(entity)
+            location = strategy.get_index_location(entity, field.name)
+            if location == None or \
+               not os.path.isdir(os.path.dirname(location)):
+                continue
+
+            # Indexes are rebuilt when lost, they need not be durable nor
+            # even written, as on a database only readable by this process
+            try:
+                if index.lines != None and os.path.isfile(location) and \
+                   index.lines <= 2 * len(index) + INDEX_SLACK:
+                    fileobj = open(location, 'a')
+                    try:
+                        index.append(fileobj, marshal_pk, marshal)
+                    finally:
+                        fileobj.close()
+                else:
+                    fileobj = strategy.open_location(location)
+                    try:
+                        index.dump(fileobj, marshal_pk, marshal)
+                    except:
+                        strategy.discard_location(fileobj)
+                        raise
+                    strategy.close_location(fileobj, location, durable=False)
+            except EnvironmentError:
+                # Whatever made it to the file is rewritten next time
+                index.lines = None
+
+    def _sequence (self, entity):
+        if entity.meta.name not in self._sequences:
+            location = self.strategy(entity).get_sequence_location(entity)
+            if location != None and os.path.isfile(location):
+                self._sequences[entity.meta.name] = Sequence.load(location)
+            else:
+                self._sequences[entity.meta.name] = Sequence(location,
+                        max([-1] + self.list_primary_keys(entity)) + 1)
+
+        return self._sequences[entity.meta.name]
+
+    def next_primary_key (self, entity):
+        """Return the next free primary key of an autoincrementing entity."""
+
+        sequence = self._sequence(entity)
+
+        pk = sequence.next()
+        while self.has(entity, pk):
+            pk = sequence.next()
+
+        return pk
+
+    def reserve_primary_keys (self, entity, count):
+        """Reserve count consecutive primary keys of an autoincrementing
+        entity at once, for bulk inserts."""
+
+        return self._sequence(entity).reserve(count)
+
+    def _sync_sequences (self):
+        for sequence in self._sequences.itervalues():
+            sequence.sync(durable=self._sync != 'never')
+
+    def load (self, entity, pk):
+        self.strategy(entity).load_location(entity, pk)
+
+    def _write (self, instances, deleted=()):
+        """Store instances and remove the deleted ones from disk.  Files are
+        rendered first, so one shared by several of them is written once,
+        and with a journal they all go to it as one record before being
+        written in place.  Removed files are unlinked in one batch."""
+
+        entries = {}
+        order = []
+
+        def entry (location, strategy):
+            if location not in entries:
+                entries[location] = [None, [], [], strategy]
+                order.append(location)
+            return entries[location]
+
+        for instance in instances:
+            strategy = self.strategy(type(instance))
+            location, data, written = strategy.render_location(instance)
+            if location not in entries:
+                entry(location, strategy)[:2] = [data, written]
+
+        for instance in deleted:
+            strategy = self.strategy(type(instance))
+            location, data, written = strategy.dispose_location(instance)
+            if data == None:
+                entry(location, strategy)[0] = None
+            elif location not in entries:
+                entry(location, strategy)[:2] = [data, written]
+            entries[location][2].append(instance)
+
+        if not order:
+            return
+
+        if self._journal:
+            self._journal.append([(location, entries[location][0])
+                                  for location in order])
+
+        instances = [x for location in order for x in entries[location][1]]
+        deleted = [x for location in order for x in entries[location][2]]
+
+        # Indexes are updated in place, so they must be current beforehand
+        for entity in set(type(x) for x in instances + deleted):
+            for field in entity.meta.fields:
+                if field.is_indexed:
+                    self._index(entity, field)
+
+        stamps = dict((entity, self.strategy(entity).get_location_stamp(entity))
+                      for entity in set(type(x) for x in instances + deleted))
+
+        removed = {}
+        for location in order:
+            data, written, gone, strategy = entries[location]
+            if data == None:
+                removed.setdefault(strategy, []).append(location)
+            else:
+                strategy.write_location(location, data)
+        for strategy, locations in removed.iteritems():
+            strategy.remove_locations(locations)
+
+        for entity, before in stamps.iteritems():
+            strategy = self.strategy(entity)
+            self._restamp(strategy.get_location(entity), before,
+                          strategy.get_location_stamp(entity))
+
+        for instance in instances:
+            self.modify(instance, changed=False)
+
+        for location in order:
+            data, written, gone, strategy = entries[location]
+            if data != None and written:
+                self._stamp_indexes(written, strategy, location)
+
+        for instance in deleted:
+            self._unstored(instance)
             self._stack.remove(instance)
 
-    def begin (self):
+        if self._journal and self._journal.size > JOURNAL_LIMIT:
+            self.checkpoint()
+
+    def store (self, instance):
+        self._sync_sequences()
+        self._write([instance])
+        self._save_indexes()
+
+    def begin (self, name=None):
         """Begin a transaction on this Session."""
-        self._stack.push()
+        self._stack.push(name)
+
+    def savepoint (self, name):
+        """Begin a nested transaction that rollback(name) undoes."""
+        self.begin(name)
+
+    def preserve (self, instance):
+        """Keep a before-image of instance in the current transaction, unless
+        it already has one there.  Called before each change of instance,
+        so only the instances actually changed are copied."""
+
+        if not self._stack.peek().contains(instance):
+            self._stack.append(instance, image=instance.entity_snapshot())
 
     def close (self):
         """Close this Session."""
@@ -200,14 +929,26 @@ class Session (object):
     def commit (self):
         """Flush pending changes and commit the current transaction."""
         self.flush()
+        if not self._journal:
+            self.sync_locations()
 
         self._stack.pop()
         if self._stack.depth == 0:
             self.begin()
 
     def delete (self, instance):
-        """Mark an instance as deleted."""
-        pass
+        """Mark an instance as deleted.  It leaves the identity map at once,
+        and its row is removed from disk by the next flush."""
+
+        self.preserve(instance)
+        self._stack.peek()[SessionCache.etokey(instance)].deleted = True
+
+        if self._cache.contains(instance):
+            self._cache.remove(instance)
+        for (name, field), values in self._values.iteritems():
+            if name == instance.meta.name and \
+               instance.entity_pk_value in values:
+                values.remove(instance.entity_pk_value)
 
     def expunge (self, instance=None):
         """Remove the instance from this Session."""
@@ -216,21 +957,37 @@ class Session (object):
                 self._stack.remove(instance)
             if self._cache.contains(instance):
                 self._cache.remove(instance)
+            for (name, field), values in self._values.iteritems():
+                if name == instance.meta.name and \
+                   instance.entity_pk_value in values:
+                    values.remove(instance.entity_pk_value)
         else:
             while self._stack.depth >= 1:
                 for key in self._stack.peek().keys():
                     del self._stack.peek()[key]
                 self._stack.pop()
 
-            for key in self._cache.keys():
-                del self._cache[key]
+            self._cache.clear()
+
+            self._indexes = {}
+            self._dirty_indexes = {}
+            self._keys = {}
+            self._unstored_keys = {}
+            self._values = {}
+            self._removed = set()
+            self._sequences = {}
 
             self.begin()
 
     def flush (self):
         """Flush all the object changes to the database."""
-        for instance in self._stack.peek().values():
-            self.store(instance.entity)
+        self._sync_sequences()
+
+        level = self._stack.peek().values()
+        self._write([x.entity for x in level if not x.deleted],
+                    [x.entity for x in level if x.deleted])
+
+        self._save_indexes()
 
     def query (self, *args, **kw):
         """Return a new Query object corresponding to this Session."""
@@ -240,9 +997,37 @@ class Session (object):
         """Refresh the attributes on the given instance."""
         pass
 
-    def rollback (self):
-        """Rollback the current transaction in progress."""
-        pass
+    def rollback (self, savepoint=None):
+        """Rollback the current transaction in progress, or every transaction
+        down to the named savepoint.  The instances changed are restored
+        from their before-images and the ones created are expunged, without
+        reading anything from disk."""
+
+        if savepoint != None and savepoint not in self._stack.names():
+            raise KeyError(savepoint)
+
+        while self._stack.depth:
+            level = self._stack.peek()
+            for cached in level.values():
+                if cached.image == None:
+                    self.expunge(cached.entity)
+                else:
+                    cached.entity.entity_restore(cached.image)
+                    if not self._cache.contains(cached.entity):
+                        self._cache.append(cached.entity)
+                    self._remember_values(cached.entity)
+
+            keys = level.keys()
+            level.clear()
+            self._stack.pop()
+            for key in keys:
+                self._cache.unpin(key)
+
+            if savepoint == None or level.name == savepoint:
+                break
+
+        if self._stack.depth == 0:
+            self.begin()
 
 
 from tesql import __author__, __license__, __version__
@@ -16,7 +16,8 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from query import Query
-from filters import Filter
+from filters import Filter, Condition, Relation, And, Or, Not
+from index import Index
 
 
 from tesql import __author__, __license__, __version__
@@ -15,23 +15,230 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+"""
+Filters used to restrict the rows returned by a query
+
+Filters are built by the exported methods of the field types (like
+Person.firstname == 'Homer' or Person.account.has(...)) and combined with
+the &, | and ~ operators into an expression tree.  Every node of the tree
+can be called with an instance to tell whether it passes the filter, and
+exposes what it's made of (field, operator, value, sub-filters) so that
+the query machinery can answer parts of it from indexes.
+
+The children of And and Or nodes are evaluated in order of increasing
+cost, so cheap comparisons short-circuit expensive relation lookups.
+"""
+
+import __builtin__
+import operator
+
+
+OPERATORS = {
+    '__eq__': operator.eq,
+    '__ne__': operator.ne,
+    '__lt__': operator.lt,
+    '__le__': operator.le,
+    '__gt__': operator.gt,
+    '__ge__': operator.ge,
+    'startswith': lambda data, value: data.startswith(value),
+    'endswith': lambda data, value: data.endswith(value),
+    'contains': lambda data, value: value in data,
+    'includes': lambda data, value: __builtin__.all(x in data for x in value),
+}
+
+QUANTIFIERS = {
+    'has': lambda func, data: func(data),
+    'any': lambda func, data: __builtin__.any(func(x) for x in data),
+    'all': lambda func, data: __builtin__.all(func(x) for x in data),
+}
+
 
 class Filter (object):
+    """A filter given by an arbitrary function of the instance.
+
+    This is also the base class of all the nodes of a filter tree.
+    """
 
-    def __init__ (self, func):
+    cost = 5
+    _lookup = None
+
+    def __init__ (self, func, lookup=None):
         self._filter = func
+        self._lookup = lookup
 
     def __call__ (self, instance):
         return self._filter(instance)
 
     def __and__ (self, other):
-        return Filter(lambda x: self._filter(x) and other._filter(x))
+        return And(self, other)
 
     def __or__ (self, other):
-        return Filter(lambda x: self._filter(x) or other._filter(x))
+        return Or(self, other)
 
     def __invert__ (self):
-        return Filter(lambda x: not self._filter(x))
+        return Not(self)
+
+    def lookup (self, entity):
+        """Return the set of primary keys of entity that may satisfy this
+        filter according to the indexes, or None if all rows may."""
+
+        if self._lookup:
+            return self._lookup(entity)
+
+        return None
+
+
+class Condition (Filter):
+    """'field operator value', like Person.age > 10."""
+
+    def __init__ (self, field, operator, value):
+        if operator not in OPERATORS:
+            raise ValueError("Unknown filter operator '%s'" % operator)
+
+        self.field = field
+        self.operator = operator
+        self.value = value
+
+    def __call__ (self, instance):
+        return OPERATORS[self.operator](instance.field_get(self.field.name),
+                                        self.value)
+
+    def __repr__ (self):
+        return '<Condition %s %s %r>' % (self.field.name, self.operator,
+                                         self.value)
+
+    @property
+    def cost (self):
+        return self.operator == '__eq__' and 1 or 2
+
+    def lookup (self, entity):
+        return self.field.index_lookup(entity, self.operator, self.value)
+
+
+class Relation (Filter):
+    """A filter applied to the instance(s) referenced by a field, either to
+    the single one (has) or to any/all of them."""
+
+    def __init__ (self, field, quantifier, filter):
+        if quantifier not in QUANTIFIERS:
+            raise ValueError("Unknown filter quantifier '%s'" % quantifier)
+
+        self.field = field
+        self.quantifier = quantifier
+        self.filter = filter
+
+    def __call__ (self, instance):
+        return QUANTIFIERS[self.quantifier](self.filter,
+                                            instance.field_get(self.field.name))
+
+    def __repr__ (self):
+        return '<Relation %s %s %r>' % (self.field.name, self.quantifier,
+                                        self.filter)
+
+    @property
+    def cost (self):
+        return 10 + self.filter.cost
+
+
+class And (Filter):
+
+    def __init__ (self, *filters):
+        children = []
+        for func in filters:
+            if isinstance(func, And):
+                children.extend(func.filters)
+            else:
+                children.append(func)
+
+        self.filters = tuple(sorted(children, key=lambda x: x.cost))
+
+    def __call__ (self, instance):
+        return __builtin__.all(func(instance) for func in self.filters)
+
+    def __repr__ (self):
+        return '<And %r>' % (self.filters,)
+
+    @property
+    def cost (self):
+        return sum(func.cost for func in self.filters)
+
+    def lookup (self, entity):
+        res = None
+        for func in self.filters:
+            keys = func.lookup(entity)
+            if keys is None:
+                continue
+            elif res is None:
+                res = keys
+            else:
+                res = res & keys
+
+        return res
+
+
+class Or (Filter):
+
+    def __init__ (self, *filters):
+        children = []
+        for func in filters:
+            if isinstance(func, Or):
+                children.extend(func.filters)
+            else:
+                children.append(func)
+
+        self.filters = tuple(sorted(children, key=lambda x: x.cost))
+
+    def __call__ (self, instance):
+        return __builtin__.any(func(instance) for func in self.filters)
+
+    def __repr__ (self):
+        return '<Or %r>' % (self.filters,)
+
+    @property
+    def cost (self):
+        return sum(func.cost for func in self.filters)
+
+    def lookup (self, entity):
+        res = set()
+        for func in self.filters:
+            keys = func.lookup(entity)
+            if keys is None:
+                return None
+            res = res | keys
+
+        return res
+
+
+class Not (Filter):
+
+    def __init__ (self, filter):
+        self.filter = filter
+
+    def __call__ (self, instance):
+        return not self.filter(instance)
+
+    def __repr__ (self):
+        return '<Not %r>' % (self.filter,)
+
+    def __invert__ (self):
+        return self.filter
+
+    @property
+    def cost (self):
+        return self.filter.cost
+
+    def lookup (self, entity):
+        return None
+
+
+def combine (filters):
+    """Return a single filter requiring all of the given ones."""
+
+    filters = tuple(filters)
+    if len(filters) == 1:
+        return filters[0]
+
+    return And(*filters)
 
 
 from tesql import __author__, __license__, __version__
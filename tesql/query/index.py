@@ -0,0 +1,209 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from bisect import bisect_left, bisect_right
+
+
+# First line of an index file, files without it are rebuilt
+HEADER = 'tesql index 2\n'
+
+
+def _marshal_stamp (stamp):
+    if stamp == None:
+        return '-'
+    return ' '.join(repr(x).rstrip('L') for x in stamp)
+
+def _unmarshal_stamp (data):
+    if data == '-':
+        return None
+    return tuple(_unmarshal_number(x) for x in data.split(' '))
+
+def _unmarshal_number (data):
+    if '.' in data or 'e' in data or 'n' in data:
+        return float(data)
+    return int(data)
+
+
+class Index (object):
+    """Mapping from the values of an entity field to the primary keys of
+    the rows holding them, and the stamp of the file each value was read
+    from.
+
+    Equality is answered from a hash table, while ranges and prefixes are
+    answered from a sorted list of the distinct values (rebuilt lazily
+    after the index changes).
+    """
+
+    def __init__ (self, stamp=None, location=None):
+        self._values = {}
+        self._keys = {}
+        self._stamps = {}
+        self._sorted = None
+        # Keys changed since the index was last written out
+        self._changed = set()
+        # Lines in the index file, None when it was never written
+        self.lines = None
+        self.stamp = stamp
+        self.location = location
+
+    def __len__ (self):
+        return len(self._values)
+
+    def __contains__ (self, pk):
+        return pk in self._values
+
+    def __iter__ (self):
+        return iter(self._values)
+
+    def get (self, pk):
+        return self._values[pk]
+
+    def get_stamp (self, pk):
+        return self._stamps.get(pk)
+
+    @property
+    def changed (self):
+        return bool(self._changed)
+
+    def add (self, pk, value, stamp=None):
+        """Set the value of pk, and the stamp of its file unless None,
+        returning whether the index changed."""
+
+        restamped = stamp != None and self._stamps.get(pk) != stamp
+        if restamped:
+            self._stamps[pk] = stamp
+            self._changed.add(pk)
+
+        if pk in self._values:
+            if self._values[pk] == value:
+                return restamped
+            self._remove_value(pk)
+
+        self._values[pk] = value
+        if value not in self._keys:
+            self._keys[value] = set()
+            self._sorted = None
+        self._keys[value].add(pk)
+        self._changed.add(pk)
+
+        return True
+
+    def remove (self, pk):
+        self._stamps.pop(pk, None)
+        self._changed.discard(pk)
+        self._remove_value(pk)
+
+    def _remove_value (self, pk):
+        value = self._values.pop(pk)
+        self._keys[value].discard(pk)
+        if not self._keys[value]:
+            del self._keys[value]
+            self._sorted = None
+
+    def _sorted_values (self):
+        if self._sorted is None:
+            self._sorted = sorted(self._keys)
+        return self._sorted
+
+    def _collect (self, values):
+        res = set()
+        for value in values:
+            res.update(self._keys[value])
+        return res
+
+    def lookup (self, operator, value):
+        """Return the set of primary keys whose value satisfies operator,
+        or None if the operator can not be answered by the index."""
+
+        if operator == '__eq__':
+            return set(self._keys.get(value, ()))
+
+        values = self._sorted_values()
+
+        if operator == '__lt__':
+            return self._collect(values[:bisect_left(values, value)])
+        elif operator == '__le__':
+            return self._collect(values[:bisect_right(values, value)])
+        elif operator == '__gt__':
+            return self._collect(values[bisect_right(values, value):])
+        elif operator == '__ge__':
+            return self._collect(values[bisect_left(values, value):])
+        elif operator == 'startswith':
+            res = set()
+            for i in xrange(bisect_left(values, value), len(values)):
+                if not values[i].startswith(value):
+                    break
+                res.update(self._keys[values[i]])
+            return res
+
+        return None
+
+    def _write (self, fileobj, pks, marshal_pk, marshal_value):
+        for pk in pks:
+            fileobj.write('%s\t%s\t%s\n' % (
+                    marshal_pk(pk).encode('string_escape'),
+                    marshal_value(self._values[pk]).encode('string_escape'),
+                    _marshal_stamp(self._stamps.get(pk))))
+
+    def dump (self, fileobj, marshal_pk, marshal_value):
+        """Write the whole index to fileobj."""
+
+        fileobj.write(HEADER)
+        self._write(fileobj, self._values, marshal_pk, marshal_value)
+
+        self.lines = len(self._values)
+        self._changed = set()
+
+    def append (self, fileobj, marshal_pk, marshal_value):
+        """Write the keys changed since the index was last written to
+        fileobj, open for appending to the index file.  Keys removed need
+        no record, the file they were read from is gone or changed."""
+
+        pks = [x for x in self._changed if x in self._values]
+        self._write(fileobj, pks, marshal_pk, marshal_value)
+
+        self.lines += len(pks)
+        self._changed = set()
+
+    def load (self, fileobj, unmarshal_pk, unmarshal_value):
+        """Read an index written by dump and append, later lines of a key
+        replacing earlier ones.  Return False if fileobj holds no index."""
+
+        if fileobj.readline() != HEADER:
+            return False
+
+        lines = 0
+        for line in fileobj:
+            fields = line.rstrip('\n').split('\t')
+            # A line torn by a crash is dropped, its row gets read again
+            if len(fields) != 3 or not line.endswith('\n'):
+                continue
+
+            try:
+                self.add(unmarshal_pk(fields[0].decode('string_escape')),
+                         unmarshal_value(fields[1].decode('string_escape')),
+                         _unmarshal_stamp(fields[2]))
+            except ValueError:
+                continue
+            lines += 1
+
+        self.lines = lines
+        self._changed = set()
+
+        return True
+
+from tesql import __author__, __license__, __version__
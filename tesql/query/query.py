@@ -15,8 +15,26 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from functools import cmp_to_key
+from heapq import nlargest, nsmallest
+from itertools import islice
+from multiprocessing import Pool, cpu_count, current_process
+
 import tesql
 
+from filters import Filter, combine
+
+
+# Rows read ahead by scans, per thread of a Session loading in parallel
+READ_AHEAD = 16
+
+# Chunks each worker process of a parallel filter scan gets on average
+CHUNKS_PER_PROCESS = 4
+
+# Filter and rows of the parallel scan being started, inherited by its
+# worker processes when they are forked
+_scanning = None
+
 
 class Query (object):
 
@@ -42,14 +60,22 @@ class Query (object):
         return self._parent
 
     def all (self):
-        return list(tesql.orm.Session.default.get(e, pk) for e, pk in self)
+        return fetch(self)
 
     def range (self, start=None, stop=None, step=None):
-        return self.all()[start:stop:step]
+        return SlicingQuery(self.entity, parent=self, start=start, stop=stop,
+                            step=step).all()
+
+    def limit (self, count):
+        return SlicingQuery(self.entity, parent=self, stop=count)
+
+    def offset (self, count):
+        return SlicingQuery(self.entity, parent=self, start=count)
 
     def one (self):
         try:
-            return (tesql.orm.Session.default.get(e, pk) for e, pk in self).next()
+            return (tesql.orm.Session.default.get(e, pk) for e, pk in
+                    self._top(1)).next()
         except StopIteration:
             return None
 
@@ -65,36 +91,276 @@ class Query (object):
     def sort_by (self, *functions):
         return SortingQuery(self.entity, parent=self, sorters=functions)
 
+    def prefetch (self, *fields):
+        return PrefetchingQuery(self.entity, parent=self, fields=fields)
+
+    def _top (self, count):
+        """Iterate over (at least) the first count rows of the query, or
+        over all of them if count is None."""
+
+        return iter(self)
+
+    def _restrict (self, keys):
+        """Iterate over the rows of the query whose primary key is in keys,
+        which must all exist.  Without a parent only those are listed."""
+
+        if self.parent:
+            return ((e, pk) for e, pk in self if pk in keys)
+
+        return ((self.entity, pk) for pk in sorted(keys))
+
+
+def fetch (rows):
+    """Return the instances of the (entity, pk) rows, loading the ones not
+    yet in the Session in one batch per entity."""
+
+    rows = list(rows)
+
+    pks = {}
+    for e, pk in rows:
+        pks.setdefault(e, []).append(pk)
+
+    found = {}
+    for e, keys in pks.iteritems():
+        found.update(((e, pk), instance) for pk, instance in
+                     zip(keys, tesql.orm.Session.default.get_many(e, keys)))
+
+    return [found[row] for row in rows]
+
+
+def load (rows):
+    """Iterate over the instances of the (entity, pk) rows.  If the Session
+    loads in parallel, rows are read ahead in batches, otherwise they are
+    loaded one at a time as they are reached."""
+
+    if not tesql.orm.Session.default.threads:
+        return (tesql.orm.Session.default.get(e, pk) for e, pk in rows)
+
+    return _load_ahead(iter(rows),
+                       tesql.orm.Session.default.threads * READ_AHEAD)
+
+
+def _load_ahead (rows, size):
+    batch = list(islice(rows, size))
+    while batch:
+        for instance in fetch(batch):
+            yield instance
+        batch = list(islice(rows, size))
+
+
+class PrefetchingQuery (Query):
+    """Rows of the parent query, whose instances and the instances they
+    reference through the given fields are loaded in batches by all()."""
+
+    def __init__ (self, entity, parent=None, fields=tuple()):
+        super(PrefetchingQuery, self).__init__(entity, parent=parent)
+
+        self._fields = fields
+
+    def all (self):
+        res = super(PrefetchingQuery, self).all()
+
+        for field in self._fields:
+            keys = []
+            for instance in res:
+                keys.extend(instance.field_get_keys(field.name))
+            tesql.orm.Session.default.get_many(field.target(), keys)
+
+        return res
+
+    def _top (self, count):
+        return self.parent._top(count)
+
+
+def _match (bounds):
+    filter, rows = _scanning
+    return [i for i in xrange(*bounds)
+            if filter(tesql.orm.Session.default.get(*rows[i]))]
+
+
+def _scan (filter, rows, processes):
+    """Iterate over the positions of the rows passing filter, loading and
+    checking them in chunks on processes forked worker processes."""
+
+    global _scanning
+
+    size = len(rows) // (processes * CHUNKS_PER_PROCESS) + 1
+    chunks = [(i, min(i + size, len(rows))) for i in
+              xrange(0, len(rows), size)]
+
+    _scanning = (filter, rows)
+    try:
+        pool = Pool(min(processes, len(chunks)))
+    finally:
+        _scanning = None
+
+    try:
+        for res in pool.imap(_match, chunks):
+            for i in res:
+                yield i
+    finally:
+        pool.terminate()
+
+
 class FilteringQuery (Query):
 
     def __init__ (self, entity, parent=None, filters=tuple()):
         super(FilteringQuery, self).__init__(entity, parent=parent)
 
-        self._filters = filters
+        self._filter = combine(isinstance(func, Filter) and func or
+                               Filter(func) for func in filters)
+        self._processes = None
 
     def __iter__ (self):
-        iterable = self.parent and self.parent or ((self.entity, pk) for \
-                   pk in tesql.orm.Session.default.list_primary_keys(self.entity))
-        for e, pk in iterable:
-            if all(func(tesql.orm.Session.default.get(e, pk))
-                    for func in self._filters):
-                yield (e, pk)
+        candidates = self.lookup()
+        if candidates is not None:
+            iterable = self.parent and self.parent._restrict(candidates) or \
+                       ((self.entity, pk) for pk in sorted(candidates))
+        else:
+            iterable = self.parent and self.parent or ((self.entity, pk) for \
+                       pk in tesql.orm.Session.default.list_primary_keys(
+                           self.entity))
+
+        # Worker processes are daemons, and these can not have children
+        if self._processes > 1 and not current_process().daemon:
+            rows = list(iterable)
+            if rows:
+                for i in _scan(self._filter, rows, self._processes):
+                    yield rows[i]
+            return
+
+        for instance in load(iterable):
+            if self._filter(instance):
+                yield (type(instance), instance.entity_pk_value)
+
+    def parallel (self, processes=None):
+        """Return this query evaluating its filter on processes worker
+        processes (one per CPU by default).  Each worker loads and checks a
+        chunk of the rows and only the matching primary keys come back, so
+        the rows failing the filter are never loaded in this Session.  The
+        workers are forked, so filters need not be picklable."""
+
+        query = FilteringQuery(self.entity, parent=self.parent,
+                               filters=(self._filter,))
+        query._processes = processes or cpu_count()
+        return query
+
+    @property
+    def filter (self):
+        return self._filter
+
+    def lookup (self):
+        """Return the primary keys that may pass the filter according to
+        the indexes, or None if every row has to be checked."""
+
+        return self._filter.lookup(self.entity)
+
+
+class Reversed (object):
+    """Wrapper inverting the order of a sort key."""
+
+    __slots__ = ('value',)
+
+    def __init__ (self, value):
+        self.value = value
+
+    def __eq__ (self, other):
+        return self.value == other.value
+
+    def __ne__ (self, other):
+        return self.value != other.value
+
+    def __lt__ (self, other):
+        return other.value < self.value
+
+    def __gt__ (self, other):
+        return other.value > self.value
 
 
 class SortingQuery (Query):
+    """Rows of the parent query sorted by the given sorters.
+
+    The sorters (Field.ascending, Field.descending or any cmp function) are
+    turned into a single composite key, and when only the first rows are
+    needed (one(), limit() or range() with a stop) they are selected with
+    a heap instead of sorting all of them.
+    """
 
     def __init__ (self, entity, parent=None, sorters=tuple()):
         super(SortingQuery, self).__init__(entity, parent=parent)
 
         self._sorters = sorters
+        self._key, self._reverse = self._make_key(sorters)
+
+    @staticmethod
+    def _make_key (sorters):
+        keys = []
+        for sorter in sorters:
+            order = getattr(getattr(sorter, 'im_func', None), '_sort_order',
+                            None)
+            if order:
+                keys.append((order, lambda x, name=sorter.im_self.name:
+                                        x.field_get(name)))
+            else:
+                keys.append((1, cmp_to_key(sorter)))
+
+        if len(set(order for order, key in keys)) <= 1:
+            funcs = [key for order, key in keys]
+            reverse = bool(keys) and keys[0][0] < 0
+            if len(funcs) == 1:
+                return funcs[0], reverse
+            return (lambda x: tuple(func(x) for func in funcs)), reverse
+
+        return (lambda x: tuple(order < 0 and Reversed(key(x)) or key(x)
+                                for order, key in keys)), False
 
     def __iter__ (self):
+        return self._top(None)
+
+    def _top (self, count):
         iterable = self.parent and self.parent or ((self.entity, pk) for \
                    pk in tesql.orm.Session.default.list_primary_keys(self.entity))
-        iterable = (tesql.orm.Session.default.get(e, pk) for e, pk in iterable)
-        for sorter in reversed(self._sorters):
-            iterable = sorted(iterable, sorter)
-        iterable = ((type(x), x.pk) for x in iterable)
+        iterable = load(iterable)
+
+        if count is None:
+            iterable = sorted(iterable, key=self._key, reverse=self._reverse)
+        elif self._reverse:
+            iterable = nlargest(count, iterable, key=self._key)
+        else:
+            iterable = nsmallest(count, iterable, key=self._key)
+
+        return ((type(x), x.entity_pk_value) for x in iterable)
+
+
+class SlicingQuery (Query):
+    """Rows start to stop (every step) of the parent query.
+
+    Rows are pulled lazily from the parent, so reading stops after stop
+    rows and the rows skipped by step are never loaded unless the parent
+    needs them (to filter or sort).  Negative bounds need the whole list
+    of primary keys, but still only load the selected rows.
+    """
+
+    def __init__ (self, entity, parent=None, start=None, stop=None,
+                  step=None):
+        super(SlicingQuery, self).__init__(entity, parent=parent)
+
+        self._start = start
+        self._stop = stop
+        self._step = step
+
+    def __iter__ (self):
+        iterable = self.parent and self.parent or ((self.entity, pk) for \
+                   pk in tesql.orm.Session.default.list_primary_keys(self.entity))
+
+        if any(x != None and x < 0 for x in
+               (self._start, self._stop, self._step)):
+            iterable = list(iterable)[self._start:self._stop:self._step]
+        else:
+            if self.parent and self._stop != None:
+                iterable = self.parent._top(self._stop)
+            iterable = islice(iterable, self._start, self._stop, self._step)
+
         for e, pk in iterable:
             yield (e, pk)
 
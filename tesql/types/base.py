@@ -20,7 +20,7 @@ from copy import deepcopy
 import tesql
 
 from tesql.disk.objects import BaseObject
-from tesql.query import Filter
+from tesql.query import Condition
 
 
 def exportedmethod (func, name=None, prefix='field_'):
@@ -31,6 +31,17 @@ def exportedmethod (func, name=None, prefix='field_'):
     func.func_name = name
     return staticmethod(func)
 
+def sortorder (order):
+    """Mark a cmp like exported method as sorting by the field's value in
+    ascending (order > 0) or descending (order < 0) order, so that queries
+    can sort by key instead of calling it."""
+
+    def decorator (func):
+        func._sort_order = order
+        return func
+
+    return decorator
+
 class BaseType (object):
 
     def __init__ (self):
@@ -56,11 +67,11 @@ class BaseType (object):
 
     @exportedmethod
     def field___eq__ (self, other):
-        return Filter(lambda x: x.field_get(self.name) == other)
+        return Condition(self, '__eq__', other)
 
     @exportedmethod
     def field___ne__ (self, other):
-        return Filter(lambda x: x.field_get(self.name) != other)
+        return Condition(self, '__ne__', other)
 
     def add_constraint (self, constraint):
         if 'item' in constraint.scope:
@@ -110,11 +121,13 @@ class BaseSortable (BaseType):
         super(BaseSortable, self).__init__(*args, **kw)
 
     @exportedmethod
+    @sortorder(1)
     def ascending (self, x, y):
         #return lambda x, y: cmp(x.field_get(self.name), y.field_get(self.name))
         return cmp(x.field_get(self.name), y.field_get(self.name))
 
     @exportedmethod
+    @sortorder(-1)
     def descending (self, x, y):
         #return lambda x, y: -cmp(x.field_get(self.name), y.field_get(self.name))
         return -cmp(x.field_get(self.name), y.field_get(self.name))
@@ -149,6 +162,10 @@ class BaseReference (BaseType):
     def field_bind_to_inverse (self, target):
         self._field.bind_to_inverse(target)
 
+    @exportedmethod
+    def field_target (self):
+        return self._bound_entity
+
     def bind_to_entity (self, target):
         self._entity = target
 
@@ -133,8 +133,9 @@ class ConstraintUnique (ConstraintByFunction):
         if value not in [False, True]:
             raise ValueError("'%s' not a boolean" % value)
 
-        super(ConstraintUnique, self).__init__(lambda x: entity.get_by(
-                getattr(entity, field_name) == x) == None, entity=entity,
+        super(ConstraintUnique, self).__init__(lambda x: not \
+                tesql.orm.Session.default.has_value(entity,
+                getattr(entity, field_name), x), entity=entity,
                                                     field_name=field_name)
 
         self._scope = value and ('item',) or ()
@@ -15,7 +15,9 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from tesql.query import Filter
+import tesql
+
+from tesql.query import Condition
 
 from base import BaseSortable, exportedmethod
 
@@ -29,19 +31,19 @@ class Integer (BaseSortable):
 
     @exportedmethod
     def __lt__ (self, other):
-        return Filter(lambda x: x.field_get(self.name) < other)
+        return Condition(self, '__lt__', other)
 
     @exportedmethod
     def __le__ (self, other):
-        return Filter(lambda x: x.field_get(self.name) <= other)
+        return Condition(self, '__le__', other)
 
     @exportedmethod
     def __ge__ (self, other):
-        return Filter(lambda x: x.field_get(self.name) >= other)
+        return Condition(self, '__ge__', other)
 
     @exportedmethod
     def __gt__ (self, other):
-        return Filter(lambda x: x.field_get(self.name) > other)
+        return Condition(self, '__gt__', other)
 
     def unmarshal (self, value):
         return int(value.decode(self._incoding))
@@ -53,8 +55,7 @@ class Indexer (Integer):
         super(Indexer, self).__init__(*args, **kw)
 
     def set_next (self, entity):
-        res = entity.query.sort_by(entity.meta.pk.descending).one()
-        self.set_data(res and res.pk + 1 or 0)
+        self.set_data(tesql.orm.Session.default.next_primary_key(entity))
 
 
 from tesql import __author__, __license__, __version__
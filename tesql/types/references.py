@@ -15,11 +15,9 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import __builtin__
-
 import tesql
 
-from tesql.query import Filter
+from tesql.query import Condition, Relation, And
 
 from base import BaseReference
 from base import exportedmethod
@@ -34,17 +32,23 @@ class ReferenceOne (BaseReference):
 
     @exportedmethod
     def has (self, constraint, *constraints):
-        for extra in constraints:
-            constraint = constraint & extra
-
-        return Filter(lambda x: constraint(x.field_get(self.name)))
+        return Relation(self, 'has', And(constraint, *constraints))
 
     def get_data (self, instance=None):
         if super(ReferenceOne, self).get_data() == None:
             return None
 
-        return tesql.orm.Session.default.get(self._entity,
-                super(ReferenceOne, self).get_data())
+        # None as well once the instance referenced is deleted
+        instances = tesql.orm.Session.default.get_many(self._entity,
+                [super(ReferenceOne, self).get_data()], skip_missing=True)
+        return instances and instances[0] or None
+
+    def get_keys (self):
+        pk = super(ReferenceOne, self).get_data()
+        if pk == None or tesql.orm.Session.default.is_deleted(self._entity,
+                                                              pk):
+            return []
+        return [pk]
 
     def set_data (self, value, check=True, instance=None):
         if not isinstance(value, tesql.orm.Entity):
@@ -65,12 +69,43 @@ class ReferenceMany (BaseReference):
 
         self.set_data([], check=False)
 
+    def _live (self):
+        """Drop the keys of the instances deleted since they were added,
+        and return the remaining ones."""
+
+        session = tesql.orm.Session.default
+
+        if any(session.is_deleted(self._entity, x) for x in self._data):
+            self._data = [x for x in self._data
+                          if not session.is_deleted(self._entity, x)]
+
+        return self._data
+
+    def _load (self):
+        """Return all the instances referenced, loaded at once, dropping the
+        keys of those deleted or gone from disk since they were added."""
+
+        instances = tesql.orm.Session.default.get_many(self._entity,
+                self._data, skip_missing=True)
+
+        if len(instances) != len(self._data):
+            self._data = [x.pk for x in instances]
+
+        return instances
+
     def __len__ (self):
-        return len(self._data)
+        return len(self._live())
 
     def __getitem__ (self, pos):
         # FIXME: Add support for slices
-        return tesql.orm.Session.default.get(self._entity, self._data[pos])
+        pk = self._data[pos]
+        if not tesql.orm.Session.default.is_cached(self._entity, pk) or \
+           tesql.orm.Session.default.is_deleted(self._entity, pk):
+            # Others are likely to be wanted too, load them all at once
+            self._load()
+            pk = self._data[pos]
+
+        return tesql.orm.Session.default.get(self._entity, pk)
 
     def __setitem__ (self, pos, instance):
         self._data.__setitem__(pos, self.validate(instance.pk))
@@ -79,11 +114,11 @@ class ReferenceMany (BaseReference):
         self._data.__delitem__(pos)
 
     def __iter__ (self):
-        for pk in self._data:
-            yield tesql.orm.Session.default.get(self._entity, pk)
+        for instance in self._load():
+            yield instance
 
     def __contains__ (self, instance):
-        return self._data.__contains__(instance.pk)
+        return self._live().__contains__(instance.pk)
 
     def __eq__ (self, other):
         if len(self) != len(other):
@@ -121,28 +156,22 @@ class ReferenceMany (BaseReference):
 
     @exportedmethod
     def any (self, constraint, *constraints):
-        for extra in constraints:
-            constraint = constraint & extra
-
-        return Filter(lambda x: __builtin__.any(constraint(inst) for inst in \
-                                    x.field_get(self.name)))
+        return Relation(self, 'any', And(constraint, *constraints))
 
     @exportedmethod
     def all (self, constraint, *constraints):
-        for extra in constraints:
-            constraint = constraint & extra
-
-        return Filter(lambda x: __builtin__.all(constraint(inst) for inst in \
-                                    x.field_get(self.name)))
+        return Relation(self, 'all', And(constraint, *constraints))
 
     @exportedmethod
     def contains (self, instance, *instances):
-        return Filter(lambda x: __builtin__.all(inst in x.field_get(self.name) \
-                                for inst in (instance,) + instances))
+        return Condition(self, 'includes', (instance,) + instances)
 
     def get_data (self, instance=None):
         return self
 
+    def get_keys (self):
+        return list(self._live())
+
     def set_data (self, instances, check=True, instance=None):
         self._data = []
         for instance in instances:
@@ -152,7 +181,8 @@ class ReferenceMany (BaseReference):
         return None
 
     def marshal (self):
-        return ', '.join(unicode(x).encode(self._outcoding) for x in self._data)
+        return ', '.join(unicode(x).encode(self._outcoding)
+                         for x in self._live())
 
     def unmarshal (self, value):
         return [self._entity.entity_pk.unmarshal(x) for x in value.split(', ')]
@@ -220,10 +250,7 @@ class QueryOne (BaseReference):
 
     @exportedmethod
     def has (self, constraint, *constraints):
-        for extra in constraints:
-            constraint = constraint & extra
-
-        return Filter(lambda x: constraint(x.field_get(self.name)))
+        return Relation(self, 'has', And(constraint, *constraints))
 
     def validate_data (self, instance=None):
         return None
@@ -294,24 +321,15 @@ class QueryMany (BaseReference):
 
     @exportedmethod
     def any (self, constraint, *constraints):
-        for extra in constraints:
-            constraint = constraint & extra
-
-        return Filter(lambda x: __builtin__.any(constraint(inst) for inst in \
-                                    x.field_get(self.name)))
+        return Relation(self, 'any', And(constraint, *constraints))
 
     @exportedmethod
     def all (self, constraint, *constraints):
-        for extra in constraints:
-            constraint = constraint & extra
-
-        return Filter(lambda x: __builtin__.all(constraint(inst) for inst in \
-                                    x.field_get(self.name)))
+        return Relation(self, 'all', And(constraint, *constraints))
 
     @exportedmethod
     def contains (self, instance, *instances):
-        return Filter(lambda x: __builtin__.all(inst in x.field_get(self.name) \
-                                for inst in (instance,) + instances))
+        return Condition(self, 'includes', (instance,) + instances)
 
     def validate_data (self, instance=None):
         self._instance = instance
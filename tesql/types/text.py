@@ -15,7 +15,7 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from tesql.query import Filter
+from tesql.query import Condition
 
 from base import BaseSortable, exportedmethod
 
@@ -30,15 +30,15 @@ class String (BaseSortable):
 
     @exportedmethod
     def startswith (self, prefix):
-        return Filter(lambda x: x.field_get(self.name).startswith(prefix))
+        return Condition(self, 'startswith', prefix)
 
     @exportedmethod
     def contains (self, other):
-        return Filter(lambda x: other in x.field_get(self.name))
+        return Condition(self, 'contains', other)
 
     @exportedmethod
     def endswith (self, suffix):
-        return Filter(lambda x: x.field_get(self.name).endswith(suffix))
+        return Condition(self, 'endswith', suffix)
 
 
 from tesql import __author__, __license__, __version__
@@ -0,0 +1,157 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from StringIO import StringIO
+
+from tesql.disk import objects
+from tesql.disk.objects import make_object
+
+from tesql.disk.formats import binary
+from tesql.disk.formats import plain
+
+from tesql.disk.strategies import Packed
+from tesql.disk.strategies import Related
+
+from tesql.orm import *
+from tesql.types import *
+
+
+class TestBinaryInit (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+        Session().be_default()
+
+    def test_round_trip (self):
+        obj = make_object('Person', {})
+        obj.append('firstname', u'Zo\xeb')
+        obj.append('notes', 'First line\n\nThird line\n')
+        obj.append('empty', '')
+        obj.append('tags', ['a', 'b'])
+        obj.append('address', {'city': 'Springfield'})
+
+        fileobj = StringIO()
+        binary.write_objects([obj, make_object('Other', {})], fileobj)
+        data = fileobj.getvalue()
+
+        self.assertTrue(data.startswith(binary.MAGIC))
+
+        res = list(binary.read_objects(StringIO(data)))
+        self.assertEqual(res, [obj, make_object('Other', {})])
+        self.assertTrue(isinstance(res[0], objects.Dictionary))
+        self.assertTrue(isinstance(res[0]['firstname'], objects.String))
+        self.assertTrue(isinstance(res[0]['tags'], objects.List))
+        self.assertEqual(res[0]['firstname'], u'Zo\xeb')
+        self.assertEqual(res[0]['address']['city'], 'Springfield')
+
+    def test_varints_names (self):
+        # Past one byte sizes and name references
+        objs = []
+        for i in xrange(3):
+            obj = make_object('Row', {})
+            for j in xrange(40):
+                obj.append('field%d' % j, 'x' * (j * 10))
+            objs.append(obj)
+
+        fileobj = StringIO()
+        binary.write_objects(objs, fileobj)
+        self.assertEqual(list(binary.read_objects(
+                              StringIO(fileobj.getvalue()))), objs)
+
+        # Names are written once per file
+        self.assertEqual(fileobj.getvalue().count('field39'), 1)
+
+        text = StringIO()
+        plain.write_objects(objs, text)
+        self.assertTrue(len(fileobj.getvalue()) < len(text.getvalue()))
+
+    def test_truncated (self):
+        fileobj = StringIO()
+        binary.write_objects([make_object('Person', {'firstname': 'Homer'})],
+                             fileobj)
+
+        self.assertRaises(SyntaxError, list, binary.read_objects(
+                StringIO(fileobj.getvalue()[:-8])))
+        self.assertRaises(SyntaxError, list, binary.read_objects(
+                StringIO('\n[Person]\n')))
+
+    def test_session_format (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        Person(pk=1, firstname='Homer')
+        Session.default.commit()
+
+        Session.default.bind_format(Person, binary)
+        Person(pk=2, firstname='Bart')
+        Session.default.commit()
+        Session.default.expunge()
+
+        location = os.path.join(self.path, 'Person')
+        self.assertFalse(open(os.path.join(location, '1.conf'),
+                              'rb').read().startswith(binary.MAGIC))
+        self.assertTrue(open(os.path.join(location, '2.conf'),
+                             'rb').read().startswith(binary.MAGIC))
+
+        # Both are read, whatever the format of the entity
+        self.assertEqual([x.firstname for x in Person.query.all()],
+                         ['Homer', 'Bart'])
+
+        Session.default.bind_format(Person, plain)
+        Session.default.expunge()
+        self.assertEqual([x.firstname for x in Person.query.all()],
+                         ['Homer', 'Bart'])
+
+    def test_packed_related_format (self):
+        for strategy in (Packed, Related):
+            Session(strategy=strategy).be_default()
+            Session.default.bind(self.path)
+
+            class Person (Entity):
+                pk = Field(Integer, primary_key=True)
+                firstname = Field(String)
+
+            Session.default.bind_format(Person, binary)
+            Person(pk=1, firstname='Homer')
+            Session.default.commit()
+            Session.default.expunge()
+
+            self.assertEqual(Person.get(1).firstname, 'Homer')
+
+            self.tearDown()
@@ -17,7 +17,15 @@
 
 from unittest import TestCase
 
+from StringIO import StringIO
+
+from tesql.disk.objects import make_object
+from tesql.disk.objects import String
+from tesql.disk.objects import Dictionary
+
 from tesql.disk.formats.plain import PLAIN_OBJECTS
+from tesql.disk.formats.plain import DICTIONARY, READERS, WRITERS
+from tesql.disk.formats.plain import write_object
 
 from tesql.disk.formats.plain.objects import StringObject
 from tesql.disk.formats.plain.objects import ListObject
@@ -30,3 +38,14 @@ class TestPlainInit (TestCase):
         self.assertEqual(len(PLAIN_OBJECTS), 3)
         self.assertEqual(PLAIN_OBJECTS, [DictionaryObject, StringObject,
                                          ListObject])
+
+    def test_dispatch_tables (self):
+        self.assertEqual(READERS['['], [DICTIONARY])
+        self.assertEqual([type(x) for x in READERS[None]], [StringObject])
+
+        obj = make_object('Section', {})
+        obj.append('Key', 'Value')
+        write_object(obj, StringIO())
+
+        self.assertTrue(WRITERS[Dictionary] is DICTIONARY)
+        self.assertTrue(isinstance(WRITERS[String], StringObject))
@@ -0,0 +1,60 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+from StringIO import StringIO
+
+from tesql.disk.objects import make_object
+
+from tesql.disk.formats.plain import write_object
+from tesql.disk.formats.plain import read_objects
+from tesql.disk.formats.plain.reader import LineReader
+
+
+class TestLineReader (TestCase):
+
+    def test_peek_readline (self):
+        reader = LineReader(StringIO('a\nb\n'))
+
+        self.assertEqual(reader.peek(), 'a\n')
+        self.assertEqual(reader.peek(), 'a\n')
+        self.assertEqual(reader.readline(), 'a\n')
+        self.assertEqual(list(reader), ['b\n'])
+        self.assertEqual(reader.peek(), '')
+        self.assertTrue(LineReader.wrap(reader) is reader)
+
+    def test_read_objects_from_pipe (self):
+        objs = [make_object('Person', {}), make_object('Account', {})]
+        objs[0].append('firstname', 'Homer')
+        objs[0].append('note', 'Multi\n\nline')
+        objs[1].append('login', 'homer')
+
+        fileobj = StringIO()
+        for obj in objs:
+            write_object(obj, fileobj)
+
+        rfd, wfd = os.pipe()
+        os.write(wfd, fileobj.getvalue())
+        os.close(wfd)
+
+        pipe = os.fdopen(rfd, 'r')
+        try:
+            self.assertEqual(list(read_objects(pipe)), objs)
+        finally:
+            pipe.close()
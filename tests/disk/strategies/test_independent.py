@@ -20,6 +20,7 @@ import os
 from unittest import TestCase
 
 from tesql.disk.strategies import Independent
+from tesql.disk.strategies.base import UMASK
 
 from tesql.orm import *
 from tesql.types import *
@@ -247,6 +248,102 @@ class TestIndependent (TestCase):
                          [os.path.join(self.path, 'Person', '1.conf'),
                           os.path.join(self.path, 'Person', '2.conf')])
 
+    def test_list_entity_cached_listing (self):
+        s = Independent()
+        s.bind(self.path)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        location = os.path.join(self.path, 'Person')
+
+        self.assertEqual(list(s.list_location(Person)), [])
+
+        s.store_location(Person(pk=2, firstname='Bart'))
+        s.store_location(Person(pk=1, firstname='Homer'))
+
+        self.assertEqual(s._listings[location][0], os.stat(location).st_mtime)
+        self.assertEqual(list(s.list_location(Person)),
+                         [os.path.join(location, '1.conf'),
+                          os.path.join(location, '2.conf')])
+
+        # Files written by someone else are seen once the mtime changes
+        fileobj = open(os.path.join(location, '3.conf'), 'w')
+        fileobj.write('firstname = Lisa\n')
+        fileobj.close()
+        stamp = os.stat(location).st_mtime + 1
+        os.utime(location, (stamp, stamp))
+
+        self.assertEqual(list(s.list_location(Person)),
+                         [os.path.join(location, '1.conf'),
+                          os.path.join(location, '2.conf'),
+                          os.path.join(location, '3.conf')])
+
+    def test_store_atomic (self):
+        s = Independent()
+        s.bind(self.path)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        p1 = Person(pk=1, firstname='Homer')
+        s.store_location(p1)
+
+        location = os.path.join(self.path, 'Person', '1.conf')
+        self.assertEqual(os.listdir(os.path.dirname(location)), ['1.conf'])
+        self.assertEqual(os.stat(location).st_mode & 0777,
+                         0666 & ~UMASK)
+
+        class Full (object):
+
+            def __init__ (self, fileobj):
+                self.fileobj = fileobj
+                self.name = fileobj.name
+
+            def write (self, data):
+                self.fileobj.write(data[:13])
+                raise IOError('No space left on device')
+
+            def close (self):
+                self.fileobj.close()
+
+        s.open_location = lambda location: Full(
+                Independent.open_location(s, location))
+
+        p1.firstname = 'Marge'
+        self.assertRaises(IOError, s.store_location, p1)
+
+        self.assertEqual(os.listdir(os.path.dirname(location)), ['1.conf'])
+        self.assertEqual(open(location, 'rU').read(),
+                         '\n[Person]\n\npk: 1\nfirstname: Homer\n')
+
+    def test_store_sync_policies (self):
+        s = Independent()
+        s.bind(self.path)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        self.assertEqual(s.sync, 'never')
+        self.assertRaises(ValueError, s.set_sync, 'always')
+
+        s.set_sync('file')
+        s.store_location(Person(pk=1, firstname='Homer'))
+        self.assertEqual(s._unsynced, set())
+
+        s.set_sync('commit')
+        s.store_location(Person(pk=2, firstname='Bart'))
+        s.store_location(Person(pk=3, firstname='Lisa'))
+        self.assertEqual(s._unsynced,
+                         set(os.path.join(self.path, 'Person', '%d.conf' % i)
+                             for i in (2, 3)))
+
+        s.sync_locations()
+        self.assertEqual(s._unsynced, set())
+
     def test_store_entity_with_virtual_fields_default_store_location (self):
         s = Independent()
         s.bind(self.path)
@@ -0,0 +1,185 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.disk.strategies import Packed
+
+from tesql.orm import *
+from tesql.query import Query
+from tesql.types import *
+
+
+class TestPacked (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session(strategy=Packed).be_default()
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+        Session().be_default()
+
+    def _reopen (self):
+        Session(strategy=Packed).be_default()
+        Session.default.bind(self.path)
+
+    def _people (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        for i, name in enumerate(['Homer', 'Bart', 'Lisa', 'Maggie']):
+            Person(pk=i, firstname=name)
+        Session.default.commit()
+        Session.default.expunge()
+
+        return Person
+
+    def test_get_location (self):
+        s = Packed()
+        s.bind(self.path)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+
+        self.assertEqual(s.get_location(Person), self.path + '/Person.pack')
+        self.assertEqual(s.get_location(Person, 1),
+                         self.path + '/Person.pack/1.conf')
+        self.assertEqual(s.list_primary_key(Person,
+                                            s.get_location(Person, 1)), 1)
+
+    def test_store_load (self):
+        Person = self._people()
+
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['Person.firstname.idx', 'Person.offsets',
+                          'Person.pack'])
+        self.assertEqual(Session.default.list_primary_keys(Person), range(4))
+        self.assertEqual(Person.get(2).firstname, 'Lisa')
+        self.assertEqual(Person.get(4), None)
+
+        self._reopen()
+        self.assertEqual([x.firstname for x in Person.query.all()],
+                         ['Homer', 'Bart', 'Lisa', 'Maggie'])
+        self.assertEqual(Person.get_by(Person.firstname == 'Bart').pk, 1)
+
+    def test_update_delete (self):
+        Person = self._people()
+        size = os.path.getsize(os.path.join(self.path, 'Person.pack'))
+
+        Person.get(1).firstname = 'El Barto'
+        Session.default.delete(Person.get(3))
+        Session.default.commit()
+
+        self.assertTrue(os.path.getsize(os.path.join(self.path,
+                                                     'Person.pack')) > size)
+
+        # Without offsets the data file is scanned
+        os.unlink(os.path.join(self.path, 'Person.offsets'))
+        self._reopen()
+
+        self.assertEqual(Session.default.list_primary_keys(Person), range(3))
+        self.assertEqual(Person.get(1).firstname, 'El Barto')
+        self.assertFalse(Session.default.has(Person, 3))
+
+        Session.default._strategy.compact(Person)
+        self._reopen()
+
+        self.assertEqual([x.firstname for x in Person.query.all()],
+                         ['Homer', 'El Barto', 'Lisa'])
+        self.assertTrue(os.path.getsize(os.path.join(self.path,
+                                                     'Person.pack')) < size)
+
+    def test_offsets_saved_lazily (self):
+        Person = self._people()
+        location = os.path.join(self.path, 'Person.offsets')
+        saved = open(location, 'rb').read()
+
+        # Commits only append to the data file
+        for i in range(4, 20):
+            Person(pk=i, firstname='Person %d' % i)
+            Session.default.commit()
+        self.assertEqual(open(location, 'rb').read(), saved)
+
+        # The tail past the saved offsets is scanned on open
+        self._reopen()
+        self.assertEqual(Session.default.list_primary_keys(Person), range(20))
+        self.assertEqual(Person.get(19).firstname, 'Person 19')
+
+        # Compaction saves them
+        Session.default._strategy.compact(Person)
+        self.assertNotEqual(open(location, 'rb').read(), saved)
+
+    def test_torn_tail (self):
+        Person = self._people()
+
+        fileobj = open(os.path.join(self.path, 'Person.pack'), 'ab')
+        fileobj.write('99 4\n[Person]\n')
+        fileobj.close()
+
+        self._reopen()
+        self.assertEqual(Session.default.list_primary_keys(Person), range(4))
+
+        Person(pk=4, firstname='Abe')
+        Session.default.commit()
+        self._reopen()
+
+        self.assertEqual([x.firstname for x in Person.query.all()],
+                         ['Homer', 'Bart', 'Lisa', 'Maggie', 'Abe'])
+
+    def test_fork (self):
+        Person = self._people()
+        self.assertEqual(Person.get(0).firstname, 'Homer')
+        Session.default.expunge()
+
+        strategy = Session.default._strategy
+        table = strategy._table(strategy.get_location(Person))
+        os.lseek(table._reader.fileno(), 0, os.SEEK_SET)
+
+        # A child seeking the inherited data file would move this offset
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            try:
+                table.read(u'3')
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(os.lseek(table._reader.fileno(), 0, os.SEEK_CUR), 0)
+
+    def test_parallel (self):
+        Person = self._people()
+
+        q = Query(Person).filter_by(Person.firstname != 'Bart').parallel(3)
+        self.assertEqual(list(q), [(Person, 0), (Person, 2), (Person, 3)])
@@ -440,3 +440,95 @@ class TestIndependent (TestCase):
         self.assertEqual(np2[0].surname, 'Simpson')
         self.assertEqual(np2[1].homedir, '/home/bsimpson')
         self.assertEqual(np2[1].person, np2[0])
+
+    def test_list_sections_manifest (self):
+        s = Session.default._strategy
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        class Account (Entity):
+            homedir = Field(String)
+            person = Field(OneToOne, entity=Person, primary_key=True)
+
+        p1 = Person(pk=1, firstname='Homer')
+        p2 = Person(pk=2, firstname='Bart')
+        Account(homedir='/home/hsimpson', person=p1)
+        Session.default.commit()
+        Session.default.expunge()
+
+        parsed = []
+        def load_location_as_dictionaries (location):
+            parsed.append(location)
+            return Related.load_location_as_dictionaries(s, location)
+        s.load_location_as_dictionaries = load_location_as_dictionaries
+
+        self.assertEqual(s.list_location(Account),
+                         [os.path.join(self.path, 'Person', '1.conf')])
+        self.assertEqual(len(parsed), 2)
+
+        # The rows parsed went to the Session
+        self.assertTrue(Session.default.is_cached(Account, 1))
+        self.assertTrue(Session.default.is_cached(Person, 2))
+        self.assertEqual(Account.get(1).homedir, '/home/hsimpson')
+
+        self.assertEqual(s.list_location(Account),
+                         [os.path.join(self.path, 'Person', '1.conf')])
+        self.assertEqual(s.list_location(Account, 2), None)
+        self.assertEqual(len(parsed), 2)
+
+        Account(homedir='/home/bsimpson', person=Person.get(2))
+        Session.default.commit()
+
+        self.assertEqual(Session.default.list_primary_keys(Account), [1, 2])
+        self.assertEqual(len(parsed), 2)
+
+        # Only the file rewritten is parsed again
+        self.assertEqual(s.list_location(Account),
+                         [os.path.join(self.path, 'Person', '1.conf'),
+                          os.path.join(self.path, 'Person', '2.conf')])
+        self.assertEqual(parsed[2:],
+                         [os.path.join(self.path, 'Person', '2.conf')])
+
+    def test_render_location_dependents (self):
+        s = Session.default._strategy
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        class Account (Entity):
+            homedir = Field(String)
+            person = Field(OneToOne, entity=Person, primary_key=True)
+
+        class Quota (Entity):
+            blocks = Field(Integer)
+            account = Field(OneToOne, entity=Account, primary_key=True)
+
+        class Unrelated (Entity):
+            pk = Field(Integer, primary_key=True)
+
+        self.assertEqual(Person.entity_dependents, [Account, Quota])
+        self.assertEqual(Account.entity_dependents, [])
+        self.assertEqual(Unrelated.entity_dependents, [])
+
+        p1 = Person(pk=1, firstname='Homer')
+        a1 = Account(homedir='/home/hsimpson', person=p1)
+        Quota(blocks=10, account=a1)
+        Person(pk=2, firstname='Bart')
+        Session.default.commit()
+        Session.default.expunge()
+
+        def has (entity, pk):
+            self.fail('%s looked up on disk' % entity.meta.name)
+        Session.default.has = has
+
+        # Clean rows are taken from the file being rewritten
+        location, data, instances = s.render_location(Person.get(1))
+        self.assertEqual(location, os.path.join(self.path, 'Person', '1.conf'))
+        self.assertEqual([type(x) for x in instances], [Person, Account, Quota])
+        self.assertEqual(instances[2].blocks, 10)
+
+        location, data, instances = s.render_location(Person.get(2))
+        self.assertEqual([type(x) for x in instances], [Person])
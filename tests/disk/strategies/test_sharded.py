@@ -0,0 +1,145 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.disk.strategies import Independent
+from tesql.disk.strategies import Sharded
+from tesql.disk.strategies.sharded import shard
+
+from tesql.orm import *
+from tesql.types import *
+
+
+class TestSharded (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session(strategy=Sharded).be_default()
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+        Session().be_default()
+
+    def test_get_location (self):
+        s = Sharded()
+        s.bind(self.path)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        self.assertEqual(shard(u'42'), ['a1'])
+        self.assertEqual(s.get_location(Person), self.path + '/Person')
+        self.assertEqual(s.get_location(Person, 42),
+                         self.path + '/Person/a1/42.conf')
+        self.assertEqual(s.list_primary_key(Person,
+                                            s.get_location(Person, 42)), 42)
+
+    def test_store_list_load (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        names = ['Homer', 'Bart', 'Lisa', 'Maggie', 'Marge']
+        for i, name in enumerate(names):
+            Person(pk=i, firstname=name)
+        Session.default.commit()
+        Session.default.expunge()
+
+        table = os.path.join(self.path, 'Person')
+        self.assertEqual(sorted(os.listdir(table)),
+                         sorted(set(shard(unicode(i))[0] for i in range(5))))
+        self.assertEqual(Session.default.list_primary_keys(Person), range(5))
+        self.assertEqual([x.firstname for x in Person.query.all()], names)
+        self.assertTrue(Session.default.has(Person, 3))
+        self.assertFalse(Session.default.has(Person, 5))
+
+        self.assertEqual(Person.get_by(Person.firstname == 'Lisa').pk, 2)
+
+        # The table stamp follows the shards
+        Person(pk=5, firstname='Abe')
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(Session.default.list_primary_keys(Person), range(6))
+        self.assertEqual(Person.get_by(Person.firstname == 'Abe').pk, 5)
+
+    def test_table_stamp (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        for i, name in enumerate(['Homer', 'Bart', 'Lisa']):
+            Person(pk=i, firstname=name)
+        Session.default.commit()
+
+        session = Session.default
+        self.assertEqual(Person.get_by(Person.firstname == 'Bart').pk, 1)
+
+        # Rows added and removed in the shards by another Session
+        other = Session(strategy=Sharded)
+        other.bind(self.path)
+        other.be_default()
+        Person(pk=3, firstname='Maggie')
+        other.delete(other.get(Person, 2))
+        other.commit()
+
+        session.be_default()
+        self.assertEqual(session.list_primary_keys(Person), [0, 1, 3])
+        self.assertEqual(Person.get_by(Person.firstname == 'Maggie').pk, 3)
+
+    def test_migrate (self):
+        Session(strategy=Independent).be_default()
+        Session.default.bind(self.path)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        for i, name in enumerate(['Homer', 'Bart', 'Lisa']):
+            Person(pk=i, firstname=name)
+        Session.default.commit()
+
+        s = Sharded()
+        s.bind(self.path)
+        self.assertEqual(s.migrate(Person), 3)
+        self.assertEqual(s.migrate(Person), 0)
+
+        Session(strategy=Sharded).be_default()
+        Session.default.bind(self.path)
+
+        self.assertEqual([x.firstname for x in Person.query.all()],
+                         ['Homer', 'Bart', 'Lisa'])
+        self.assertTrue(os.path.isfile(Session.default._strategy.get_location(
+                                                               Person, 1)))
@@ -0,0 +1,187 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import stat
+import threading
+import time
+
+from unittest import TestCase
+
+from tesql.disk.cache import CacheClient, CacheServer, ReadCache
+
+from tesql.orm import *
+from tesql.types import *
+
+from tesql.query import Query
+
+
+class TestCache (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        self.address = '/tmp/test.tesqlcache'
+        self.server = CacheServer(self.address)
+        threading.Thread(target=self.server.serve_forever,
+                         kwargs={'poll_interval': 0.01}).start()
+
+        Session(read_cache=self.address).be_default()
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+        Session().be_default()
+
+    def test_read_cache (self):
+        cache = ReadCache(max_bytes=10)
+        cache.put('a', '12345')
+        cache.put('b', '12345')
+        self.assertEqual(cache.get('a'), '12345')
+
+        cache.put('c', '1')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), '12345')
+        self.assertEqual(cache.get('c'), '1')
+        self.assertEqual(cache.bytes, 6)
+
+        cache.put('d', '12345678901')
+        self.assertEqual(cache.get('d'), None)
+        self.assertEqual((cache.hits, cache.misses), (3, 2))
+
+    def test_client (self):
+        client = CacheClient(self.address)
+        self.assertEqual(client.get('/a.conf', 1), None)
+
+        client.put('/a.conf', 1, [u'one', {'two': 2}])
+        self.assertEqual(client.get('/a.conf', 1), [u'one', {'two': 2}])
+        self.assertEqual(client.get('/a.conf', 2), None)
+        self.assertEqual(client.get('/b.conf', 1), None)
+
+    def test_server_socket (self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.address).st_mode), 0600)
+
+        # A live server is never replaced, nor is what is not a socket
+        self.assertRaises(EnvironmentError, CacheServer, self.address)
+        self.assertTrue(CacheClient(self.address).get('/a.conf', 1) == None)
+
+        open(self.address + '.file', 'w').close()
+        try:
+            self.assertRaises(EnvironmentError, CacheServer,
+                              self.address + '.file')
+            self.assertTrue(os.path.isfile(self.address + '.file'))
+        finally:
+            os.unlink(self.address + '.file')
+
+    def test_client_no_server (self):
+        client = CacheClient('/tmp/test.tesqlcache.missing')
+
+        client.put('/a.conf', 1, ['one'])
+        self.assertEqual(client.get('/a.conf', 1), None)
+
+    def test_client_retry (self):
+        address = self.address + '.later'
+        client = CacheClient(address)
+        self.assertEqual(client.get('/a.conf', 1), None)
+
+        server = CacheServer(address)
+        threading.Thread(target=server.serve_forever,
+                         kwargs={'poll_interval': 0.01}).start()
+        try:
+            # Connecting is not tried again right away
+            client.put('/a.conf', 1, ['one'])
+            self.assertEqual(client.get('/a.conf', 1), None)
+            self.assertEqual(len(server.cache), 0)
+
+            client._retry = 0
+            client.put('/a.conf', 1, ['one'])
+            self.assertEqual(client.get('/a.conf', 1), ['one'])
+        finally:
+            client._disconnect()
+            server.shutdown()
+            server.server_close()
+
+    def test_session_read_cache (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        Person(pk=1, firstname='Homer')
+        Person(pk=2, firstname='Bart')
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(Person.get(1).firstname, 'Homer')
+
+        # Puts are not answered, wait for the server to handle it
+        for i in xrange(100):
+            if len(self.server.cache):
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(self.server.cache), 1)
+
+        # Another worker starts warm
+        Session(read_cache=self.address).be_default()
+        Session.default.bind(self.path)
+
+        self.assertEqual(Person.get(1).firstname, 'Homer')
+        self.assertEqual(Person.get(2).firstname, 'Bart')
+        self.assertEqual(self.server.cache.hits, 1)
+
+        # Rewritten files are never served stale
+        Person.get(1).firstname = 'Max'
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(Person.get(1).firstname, 'Max')
+        self.assertEqual(self.server.cache.hits, 1)
+
+    def test_session_read_cache_parallel (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            age = Field(Integer)
+
+        for i in xrange(100):
+            Person(pk=i, age=(i * 7) % 100)
+        Session.default.commit()
+        Session.default.expunge()
+
+        # The connection of this process is open before the workers fork
+        self.assertEqual(Person.get(0).age, 0)
+        Session.default.expunge()
+
+        q = Query(Person).filter_by(lambda x: x.age % 10 == 3).parallel(4)
+
+        for i in xrange(3):
+            self.assertEqual(list(q), [(Person, i) for i in xrange(100)
+                                       if (i * 7) % 100 % 10 == 3])
+        self.assertEqual(Person.get(1).age, 7)
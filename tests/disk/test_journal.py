@@ -0,0 +1,124 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.disk.journal import Journal
+
+from tesql.orm import *
+from tesql.types import *
+
+
+class TestJournal (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session(journal=True).be_default()
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+        Session().be_default()
+
+    def test_journal_replay (self):
+        location = os.path.join(self.path, 'journal')
+        j = Journal(location)
+
+        self.assertEqual(j.size, 0)
+        self.assertEqual(list(j.replay()), [])
+
+        j.append([(u'/a.conf', 'A\n'), (u'/b.conf', u'B\n')])
+        j.append([(u'/c.conf', ''), (u'/a.conf', None)])
+
+        self.assertEqual(list(j.replay()), [(u'/a.conf', 'A\n'),
+                                            (u'/b.conf', 'B\n'),
+                                            (u'/c.conf', ''),
+                                            (u'/a.conf', None)])
+
+        # A record torn by a crash is ignored with everything after it
+        size = j.size
+        j.append([(u'/d.conf', 'D\n')])
+        fileobj = open(location, 'r+b')
+        fileobj.truncate(size + 10)
+        fileobj.close()
+        j.append([(u'/e.conf', 'E\n')])
+
+        self.assertEqual([x for x, data in j.replay()],
+                         [u'/a.conf', u'/b.conf', u'/c.conf', u'/a.conf'])
+
+        j.truncate()
+        self.assertEqual(j.size, 0)
+        self.assertEqual(list(j.replay()), [])
+
+    def test_journaled_commit (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        p1 = Person(pk=1, firstname='Homer')
+        p2 = Person(pk=2, firstname='Bart')
+        Session.default.commit()
+
+        journal = Journal(os.path.join(self.path, '.journal'))
+        self.assertEqual(sorted(os.path.basename(x) for x, data
+                                in journal.replay()), ['1.conf', '2.conf'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path, 'Person'))),
+                         ['1.conf', '2.conf'])
+
+        Session.default.checkpoint()
+        self.assertEqual(journal.size, 0)
+
+        Session.default.expunge()
+        self.assertEqual(Person.get(2).firstname, 'Bart')
+
+    def test_journal_recovered_on_open (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        Person(pk=1, firstname='Homer')
+        Session.default.commit()
+        Session.default.checkpoint()
+
+        # A commit that crashed before writing its rows in place
+        Journal(os.path.join(self.path, '.journal')).append([
+                (os.path.join(self.path, 'Person', '1.conf'),
+                 '\n[Person]\n\npk: 1\nfirstname: Marge\n'),
+                (os.path.join(self.path, 'Person', '2.conf'),
+                 '\n[Person]\n\npk: 2\nfirstname: Bart\n')])
+
+        Session(journal=True).be_default()
+        Session.default.bind(self.path)
+
+        self.assertEqual(Journal(os.path.join(self.path, '.journal')).size, 0)
+        self.assertEqual(Person.get(1).firstname, 'Marge')
+        self.assertEqual(Person.get(2).firstname, 'Bart')
@@ -0,0 +1,123 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.disk.sequence import BLOCK, Sequence
+
+from tesql.orm import *
+from tesql.types import *
+
+
+class TestSequence (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+    def test_sequence (self):
+        location = os.path.join(self.path, 'Person.seq')
+
+        s = Sequence.load(location, 5)
+
+        self.assertEqual(s.next(), 5)
+        self.assertEqual(s.next(), 6)
+        self.assertEqual(list(s.reserve(3)), [7, 8, 9])
+
+        s.observe(3)
+        self.assertEqual(s.next(), 10)
+        s.observe(20)
+        self.assertEqual(s.next(), 21)
+
+        self.assertFalse(os.path.exists(location))
+        s.sync()
+        self.assertEqual(open(location).read(), '%d\n' % (22 + BLOCK))
+
+        # Nothing is written until the stored mark is reached
+        self.assertEqual(list(s.reserve(BLOCK)), range(22, 22 + BLOCK))
+        os.unlink(location)
+        s.sync()
+        self.assertFalse(os.path.exists(location))
+
+        self.assertEqual(s.next(), 22 + BLOCK)
+        s.sync(durable=False)
+        self.assertEqual(open(location).read(), '%d\n' % (23 + BLOCK * 2))
+
+        s = Sequence.load(location)
+        self.assertEqual(s.next(), 23 + BLOCK * 2)
+
+    def test_autoincrement_sequence (self):
+        class Person (Entity):
+            firstname = Field(String)
+
+        p0 = Person(firstname='Homer')
+        p1 = Person(firstname='Bart')
+
+        self.assertEqual((p0.pk, p1.pk), (0, 1))
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(open(os.path.join(self.path, 'Person.seq')).read(),
+                         '%d\n' % (2 + BLOCK))
+
+        os.unlink(os.path.join(self.path, 'Person', '1.conf'))
+
+        # Values past the stored mark may have been used before a crash
+        self.assertEqual(Person(firstname='Lisa').pk, 2 + BLOCK)
+        self.assertEqual(Person(pk=200, firstname='Maggie').pk, 200)
+        self.assertEqual(Person(firstname='Marge').pk, 201)
+
+    def test_autoincrement_existing_table (self):
+        class Person (Entity):
+            firstname = Field(String)
+
+        Person(pk=3, firstname='Homer')
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'Person.seq')))
+        self.assertEqual(Person(firstname='Bart').pk, 4)
+
+    def test_reserve_primary_keys (self):
+        class Person (Entity):
+            firstname = Field(String)
+
+        Person(firstname='Homer')
+
+        pks = Session.default.reserve_primary_keys(Person, 3)
+
+        self.assertEqual(list(pks), [1, 2, 3])
+        self.assertEqual(Person(firstname='Bart').pk, 4)
@@ -22,7 +22,10 @@ from unittest import TestCase
 from tesql.orm import *
 from tesql.types import *
 
-from tesql.orm.decorators import options, location
+from tesql.orm.decorators import options, location, strategy, file_format
+
+from tesql.disk.formats import binary, plain
+from tesql.disk.strategies import Independent, Packed, Related
 
 class TestEntityOptions (TestCase):
 
@@ -265,3 +268,51 @@ class TestEntityOptions (TestCase):
 
         self.assertEqual(Session.default._strategy.get_location(p),
                          '/etc/person.conf')
+
+    def test_entity_format_via_options (self):
+        # @options(format='binary')   # python >= 2.6
+        class Person (Entity):
+            firstname = Field(String)
+
+        Person = options(format='binary')(Person) # python < 2.6
+
+        self.assertTrue(Session.default._strategy.get_format(Person) is
+                        binary)
+
+    def test_entity_format_via_file_format (self):
+        # @file_format(binary)   # python >= 2.6
+        class Person (Entity):
+            firstname = Field(String)
+
+        self.assertTrue(Session.default._strategy.get_format(Person) is plain)
+
+        Person = file_format(binary)(Person) # python < 2.6
+
+        self.assertTrue(Session.default._strategy.get_format(Person) is
+                        binary)
+
+    def test_entity_unknown_format (self):
+        class Person (Entity):
+            firstname = Field(String)
+
+        self.assertRaises(ValueError, options(format='xml'), Person)
+
+    def test_entity_strategy_via_strategy (self):
+        # @strategy('independent')   # python >= 2.6
+        class Person (Entity):
+            firstname = Field(String)
+
+        Person = strategy('packed')(Person) # python < 2.6
+
+        self.assertTrue(isinstance(Session.default.strategy(Person), Packed))
+
+        Person = strategy(Independent)(Person)
+
+        self.assertTrue(Session.default.strategy(Person) is
+                        Session.default._strategy)
+        self.assertRaises(ValueError, strategy('nested'), Person)
+
+    def test_session_strategy_by_name (self):
+        Session(strategy='related').be_default()
+
+        self.assertTrue(isinstance(Session.default._strategy, Related))
@@ -0,0 +1,151 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+
+class TestSessionCache (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+    def _session (self, populate=True, **kw):
+        session = Session(**kw)
+        session.be_default()
+        session.bind(self.path)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        if populate:
+            for i, name in enumerate(['Homer', 'Bart', 'Lisa', 'Maggie']):
+                Person(pk=i, firstname=name)
+            session.commit()
+            session.expunge()
+
+        return session, Person
+
+    def test_cache_rows (self):
+        session, Person = self._session(cache_rows=2)
+        # Rows written past the limit are evicted once flushed
+        evictions = session.cache_stats['evictions']
+
+        self.assertEqual([Person.get(pk).firstname for pk in range(3)],
+                         ['Homer', 'Bart', 'Lisa'])
+        self.assertEqual(session.cache_stats['rows'], 2)
+        self.assertEqual(session.cache_stats['misses'], 3)
+        self.assertEqual(session.cache_stats['evictions'] - evictions, 1)
+        self.assertFalse(session.is_cached(Person, 0))
+
+        self.assertEqual(Person.get(2).firstname, 'Lisa')
+        self.assertEqual(session.cache_stats['hits'], 1)
+
+        self.assertEqual(Person.get(0).firstname, 'Homer')
+        self.assertFalse(session.is_cached(Person, 1))
+        self.assertEqual(session.cache_stats['misses'], 4)
+
+    def test_cache_pinned (self):
+        session, Person = self._session(cache_rows=2)
+
+        p = Person.get(1)
+        p.firstname = 'El Barto'
+        for pk in (0, 2, 3):
+            Person.get(pk)
+
+        self.assertTrue(session.is_cached(Person, 1))
+        self.assertTrue(Person.get(1) is p)
+        self.assertEqual(session.cache_stats['rows'], 2)
+
+        session.commit()
+        self.assertEqual(session.cache_stats['rows'], 2)
+        session.expunge()
+        self.assertEqual(Person.get(1).firstname, 'El Barto')
+
+    def test_cache_pinned_bulk_insert (self):
+        session, Person = self._session(False, cache_rows=10)
+
+        for i in xrange(50):
+            Person(pk=i, firstname='Homer')
+
+        # Rows waiting to be written are never evicted, nor rescanned
+        self.assertEqual(session.cache_stats['rows'], 50)
+        self.assertEqual(len(session._cache._pinned), 49)
+        self.assertEqual(session.cache_stats['evictions'], 0)
+
+        session.commit()
+
+        self.assertEqual(session.cache_stats['rows'], 10)
+        self.assertEqual(session.cache_stats['evictions'], 40)
+
+    def test_cache_unique_values (self):
+        session, Person = self._session(False, cache_rows=10)
+
+        class Account (Entity):
+            pk = Field(Integer, primary_key=True)
+            login = Field(String, unique=True)
+
+        for i in xrange(30):
+            Account(pk=i, login='u%d' % i)
+        session.commit()
+        session.expunge()
+        Account.query.all()
+
+        # The values of evicted rows are left to the index
+        self.assertEqual(session.cache_stats['rows'], 10)
+        self.assertEqual(len(session._values['Account', 'login']), 10)
+        self.assertRaises(ValueError, Account, pk=30, login='u3')
+        self.assertRaises(ValueError, Account, pk=30, login='u29')
+
+    def test_cache_bytes (self):
+        session, Person = self._session()
+        size = Person.get(0).entity_size()
+
+        session, Person = self._session(False, cache_bytes=size * 5 / 2)
+        Person.query.all()
+
+        self.assertEqual(session.cache_stats['rows'], 2)
+        self.assertTrue(0 < session.cache_stats['bytes'] <= size * 5 / 2)
+        self.assertEqual(session.cache_stats['evictions'], 2)
+
+    def test_cache_unbounded (self):
+        session, Person = self._session()
+        Person.query.all()
+
+        self.assertEqual(session.cache_stats['rows'], 4)
+        self.assertEqual(session.cache_stats['evictions'], 0)
@@ -0,0 +1,138 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+
+class TestSessionConstraints (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+    def test_unique_against_disk (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            login = Field(String, unique=True)
+
+        Person(pk=1, login='homer')
+        Person(pk=2, login='bart')
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertTrue(os.path.isfile(os.path.join(self.path,
+                                                    'Person.login.idx')))
+
+        self.assertRaises(ValueError, Person, pk=3, login='bart')
+        p3 = Person(pk=3, login='lisa')
+        self.assertEqual(Session.default._cache.keys(), [('Person', 3)])
+
+        # A value freed in this Session may be taken again
+        p1 = Person.get(1)
+        p1.login = 'homer.simpson'
+        p4 = Person(pk=4, login='homer')
+        self.assertRaises(ValueError, Person, pk=5, login='homer.simpson')
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertRaises(ValueError, Person, pk=5, login='lisa')
+        self.assertRaises(ValueError, Person, pk=5, login='homer')
+        p5 = Person(pk=5, login='marge')
+
+    def test_primary_key_against_disk (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        Person(pk=1, firstname='Homer')
+        Person(pk=2, firstname='Bart')
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertRaises(ValueError, Person, pk=2, firstname='Lisa')
+        p3 = Person(pk=3, firstname='Lisa')
+        self.assertEqual(Session.default._cache.keys(), [('Person', 3)])
+
+        Session.default.commit()
+
+        self.assertRaises(ValueError, Person, pk=3, firstname='Maggie')
+        self.assertEqual(Session.default._keys['Person'], set([1, 2, 3]))
+
+    def test_primary_key_changed_on_disk (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        Person(pk=1, firstname='Homer')
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertTrue(Session.default.has(Person, 1))
+        self.assertFalse(Session.default.has(Person, 2))
+
+        # Another writer adds a row behind the Session's back
+        f = open(os.path.join(self.path, 'Person', '2.conf'), 'w')
+        f.write('firstname = Bart\n')
+        f.close()
+        stamp = os.stat(os.path.join(self.path, 'Person')).st_mtime
+        os.utime(os.path.join(self.path, 'Person'), (stamp + 1, stamp + 1))
+
+        self.assertTrue(Session.default.has(Person, 2))
+
+    def test_unique_file_changed_on_disk (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            login = Field(String, unique=True)
+
+        Person(pk=1, login='homer')
+        Person(pk=2, login='bart')
+
+        Session.default.commit()
+        self.assertRaises(ValueError, Person, pk=3, login='homer')
+        Session.default.expunge()
+
+        # Another writer renames a login in place, the directory is unchanged
+        f = open(os.path.join(self.path, 'Person', '1.conf'), 'w')
+        f.write('[Person]\npk: 1\nlogin: marge\n')
+        f.close()
+
+        self.assertRaises(ValueError, Person, pk=3, login='marge')
+        p3 = Person(pk=3, login='homer')
+        self.assertRaises(ValueError, Person, pk=4, login='bart')
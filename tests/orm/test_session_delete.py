@@ -0,0 +1,213 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+from tesql.disk.strategies import Related
+from tesql.query import Query
+
+
+class TestSessionDelete (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+        Session().be_default()
+
+    def test_delete (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        for i, name in enumerate(['Homer', 'Bart', 'Lisa', 'Maggie']):
+            Person(pk=i, firstname=name)
+        Session.default.commit()
+
+        p1 = Person.get(1)
+        Session.default.delete(p1)
+        Session.default.delete(Person.get(2))
+
+        self.assertFalse(Session.default.has(Person, 1))
+        self.assertEqual(Person.get(1), None)
+        self.assertRaises(KeyError, Session.default.get, Person, 1)
+        self.assertEqual([x.pk for x in Query(Person).all()], [0, 3])
+        self.assertEqual(Query(Person).filter_by(Person.firstname == 'Bart'
+                                                 ).all(), [])
+        self.assertTrue(os.path.isfile(os.path.join(self.path, 'Person',
+                                                    '1.conf')))
+
+        Session.default.commit()
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path, 'Person'))),
+                         ['0.conf', '3.conf'])
+        self.assertEqual(Session.default._index(Person, Person.firstname
+                                                ).lookup('__eq__', 'Bart'),
+                         set())
+
+        Session.default.expunge()
+        self.assertEqual([x.pk for x in Query(Person).all()], [0, 3])
+        self.assertEqual(Query(Person).filter_by(Person.firstname == 'Lisa'
+                                                 ).all(), [])
+
+    def test_delete_rollback (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, unique=True)
+
+        p1 = Person(pk=1, firstname='Homer')
+        Session.default.commit()
+
+        Session.default.delete(p1)
+        p2 = Person(pk=2, firstname='Homer')
+        self.assertRaises(ValueError, Person, pk=2, firstname='Homer')
+
+        Session.default.rollback()
+
+        self.assertTrue(Person.get(1) is p1)
+        self.assertEqual(p1.firstname, 'Homer')
+        self.assertRaises(ValueError, Person, pk=3, firstname='Homer')
+
+        Session.default.commit()
+        self.assertTrue(os.path.isfile(os.path.join(self.path, 'Person',
+                                                    '1.conf')))
+
+    def test_delete_related (self):
+        Entity.entities = {}
+        Session(strategy=Related).be_default()
+        Session.default.bind(self.path)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        class Account (Entity):
+            homedir = Field(String)
+            person = Field(OneToOne, entity=Person, primary_key=True,
+                           virtual=True)
+
+        class Mailbox (Entity):
+            address = Field(String)
+            person = Field(OneToOne, entity=Person, primary_key=True,
+                           virtual=True)
+
+        p1 = Person(pk=1, firstname='Homer')
+        p2 = Person(pk=2, firstname='Bart')
+        a1 = Account(homedir='/home/hsimpson', person=p1)
+        m1 = Mailbox(address='homer@example.com', person=p1)
+        a2 = Account(homedir='/home/bsimpson', person=p2)
+        Session.default.commit()
+
+        writes = []
+        write_location = Session.default._strategy.write_location
+        def counting_write_location (location, data):
+            writes.append(location)
+            return write_location(location, data)
+        Session.default._strategy.write_location = counting_write_location
+
+        Session.default.delete(a1)
+        Session.default.delete(m1)
+        Session.default.delete(p2)
+        Session.default.commit()
+
+        self.assertEqual(writes, [os.path.join(self.path, 'Person', '1.conf')])
+        self.assertEqual(os.listdir(os.path.join(self.path, 'Person')),
+                         ['1.conf'])
+        self.assertEqual(open(os.path.join(self.path, 'Person', '1.conf'),
+                              'rU').read(),
+                         '\n[Person]\n\npk: 1\nfirstname: Homer\n')
+
+    def test_delete_referenced (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        class Home (Entity):
+            pk = Field(Integer, primary_key=True)
+            address = Field(String)
+            person = Field(ManyToMany, entity=Person)
+
+        class Car (Entity):
+            pk = Field(Integer, primary_key=True)
+            owner = Field(ManyToOne, entity=Person)
+
+        people = [Person(pk=i, firstname=name) for i, name in
+                  enumerate(['Homer', 'Marge', 'Bart'])]
+        Home(pk=1, address='742 Evergreen', person=people)
+        Car(pk=1, owner=people[1])
+        Session.default.commit()
+
+        h = Home.get(1)
+        c = Car.get(1)
+        Session.default.delete(Person.get(1))
+
+        # Before the deletion is committed
+        self.assertEqual([x.firstname for x in h.person], ['Homer', 'Bart'])
+        self.assertEqual(len(h.person), 2)
+        self.assertEqual(h.person[1].firstname, 'Bart')
+        self.assertEqual(c.owner, None)
+
+        Session.default.commit()
+
+        self.assertEqual([x.firstname for x in h.person], ['Homer', 'Bart'])
+        self.assertEqual(c.owner, None)
+
+        # A row removed by another writer, with the referencing row stale
+        Session.default.expunge()
+        os.unlink(os.path.join(self.path, 'Person', '2.conf'))
+
+        h = Home.get(1)
+        self.assertEqual([x.firstname for x in h.person], ['Homer'])
+        self.assertEqual(h.person[0].firstname, 'Homer')
+
+    def test_delete_many_listed (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+
+        for i in xrange(50):
+            Person(pk=i)
+        Session.default.commit()
+
+        self.assertEqual(len(Session.default.list_primary_keys(Person)), 50)
+
+        for i in xrange(0, 50, 2):
+            Session.default.delete(Person.get(i))
+        Session.default.commit()
+
+        self.assertEqual(Session.default.list_primary_keys(Person),
+                         range(1, 50, 2))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path, 'Person'))),
+                         sorted('%d.conf' % i for i in xrange(1, 50, 2)))
@@ -155,6 +155,28 @@ class TestSessionIndependentLoadStore (TestCase):
         self.assertEqual(np2.firstname, 'Bart')
         self.assertEqual(np2.surname, 'Simpson')
 
+    def test_session_list_unstored (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        Person(pk=2, firstname='Bart')
+        Session.default.commit()
+
+        p3 = Person(pk=3, firstname='Lisa')
+        p1 = Person(pk=1, firstname='Homer')
+        self.assertEqual(Session.default.list_primary_keys(Person), [2, 1, 3])
+
+        Session.default.expunge(p3)
+        self.assertEqual(Session.default.list_primary_keys(Person), [2, 1])
+
+        Session.default.commit()
+        self.assertEqual(Session.default.list_primary_keys(Person), [1, 2])
+
+        Person(pk=4, firstname='Maggie')
+        Session.default.rollback()
+        self.assertEqual(Session.default.list_primary_keys(Person), [1, 2])
+
     def test_session_get_from_cache (self):
         class Person (Entity):
             pk = Field(Integer, primary_key=True)
@@ -0,0 +1,103 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+
+class TestSessionRollback (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+    def test_rollback (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, unique=True)
+
+        p1 = Person(pk=1, firstname='Homer')
+        Session.default.commit()
+
+        p1.firstname = 'Marge'
+        p1.firstname = 'Lisa'
+        p2 = Person(pk=2, firstname='Bart')
+
+        Session.default.rollback()
+
+        self.assertEqual(p1.firstname, 'Homer')
+        self.assertFalse(Session.default.is_cached(Person, 2))
+        self.assertEqual(Session.default._stack.primary_keys(Person), set())
+
+        # The values given up by the rollback are free again
+        p3 = Person(pk=3, firstname='Marge')
+        self.assertRaises(ValueError, Person, pk=4, firstname='Homer')
+
+    def test_savepoints (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        p1 = Person(pk=1, firstname='Homer')
+        p2 = Person(pk=2, firstname='Bart')
+        Session.default.commit()
+
+        p1.firstname = 'Marge'
+
+        Session.default.savepoint('step1')
+        p2.firstname = 'Lisa'
+        p3 = Person(pk=3, firstname='Maggie')
+
+        Session.default.savepoint('step2')
+        p1.firstname = 'Abe'
+        p2.firstname = 'Milhouse'
+
+        Session.default.rollback('step2')
+        self.assertEqual((p1.firstname, p2.firstname), ('Marge', 'Lisa'))
+
+        p2.firstname = 'Nelson'
+        self.assertRaises(KeyError, Session.default.rollback, 'step2')
+
+        Session.default.rollback('step1')
+        self.assertEqual((p1.firstname, p2.firstname), ('Marge', 'Bart'))
+        self.assertFalse(Session.default.is_cached(Person, 3))
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(Person.get(1).firstname, 'Marge')
+        self.assertEqual(Person.get(2).firstname, 'Bart')
+        self.assertFalse(Session.default.has(Person, 3))
@@ -0,0 +1,151 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+from tesql.orm.decorators import options
+
+from tesql.disk.formats import binary
+from tesql.disk.journal import Journal
+from tesql.disk.strategies import Independent, Packed, Sharded
+
+
+class TestSessionStrategies (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+    def _entities (self):
+        class Settings (Entity):
+            pk = Field(Integer, primary_key=True, choices=[0])
+            theme = Field(String)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        class Tag (Entity):
+            pk = Field(Integer, primary_key=True)
+            name = Field(String)
+
+        Person = options(strategy='packed')(Person)
+        Tag = options(strategy=Sharded, location='tags', format='binary')(Tag)
+
+        return Settings, Person, Tag
+
+    def test_strategy_routing (self):
+        Settings, Person, Tag = self._entities()
+
+        self.assertTrue(isinstance(Session.default.strategy(Settings),
+                                   Independent))
+        self.assertTrue(isinstance(Session.default.strategy(Person), Packed))
+        self.assertTrue(isinstance(Session.default.strategy(Tag), Sharded))
+
+        Settings(pk=0, theme='dark')
+        for i, name in enumerate(['Homer', 'Bart', 'Lisa']):
+            Person(pk=i, firstname=name)
+            Tag(pk=i, name=name.lower())
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(open(os.path.join(self.path, 'Settings.conf')).read(),
+                         '\n[Settings]\n\npk: 0\ntheme: dark\n')
+        self.assertTrue(os.path.isfile(os.path.join(self.path,
+                                                    'Person.pack')))
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'Person')))
+        location = Session.default.strategy(Tag).get_location(Tag, 1)
+        self.assertEqual(os.path.dirname(os.path.dirname(location)),
+                         os.path.join(self.path, 'tags'))
+        self.assertTrue(open(location, 'rb').read().startswith(binary.MAGIC))
+
+        self.assertEqual(Session.default.get(Settings, 0).theme,
+                         'dark')
+        self.assertEqual(Session.default.list_primary_keys(Person), range(3))
+        self.assertEqual([x.name for x in Tag.query.all()],
+                         ['homer', 'bart', 'lisa'])
+        self.assertTrue(Session.default.has(Tag, 2))
+        self.assertFalse(Session.default.has(Person, 3))
+        self.assertEqual(Person.get_by(Person.firstname == 'Lisa').pk, 2)
+
+        Session.default.delete(Person.get(1))
+        Session.default.delete(Tag.get(1))
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(Session.default.list_primary_keys(Person), [0, 2])
+        self.assertEqual(Session.default.list_primary_keys(Tag), [0, 2])
+
+    def test_strategy_bindings_carry_over (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        Session.default.bind_entity(Person, 'people')
+        Session.default.bind_strategy(Person, 'packed')
+
+        self.assertEqual(Session.default.strategy(Person).get_location(Person),
+                         os.path.join(self.path, 'people.pack'))
+
+        Session.default.bind_strategy(Person, Independent)
+
+        self.assertTrue(Session.default.strategy(Person) is
+                        Session.default._strategy)
+
+    def test_strategy_journal_replay (self):
+        Session(journal=True).be_default()
+        Session.default.bind(self.path)
+
+        Settings, Person, Tag = self._entities()
+        Person(pk=1, firstname='Homer')
+        Session.default.commit()
+        Session.default.checkpoint()
+
+        # A commit that crashed before writing its rows in place
+        Journal(os.path.join(self.path, '.journal')).append([
+                (os.path.join(self.path, 'Person.pack', '1.conf'),
+                 '\n[Person]\n\npk: 1\nfirstname: Marge\n'),
+                (os.path.join(self.path, 'Settings.conf'),
+                 '\n[Settings]\n\npk: 0\ntheme: light\n')])
+
+        Session(journal=True).be_default()
+        Session.default.bind(self.path)
+        Session.default.bind_strategy(Person, Packed)
+
+        self.assertEqual(Person.get(1).firstname, 'Marge')
+        self.assertEqual(Session.default.get(Settings, 0).theme,
+                         'light')
@@ -0,0 +1,127 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+from tesql.query import Query
+from tesql.query import Filter, Condition, Relation, And, Or, Not
+
+
+class TestQueryFilters (TestCase):
+
+    def setUp (self):
+        Session.default.expunge()
+
+    def test_condition_structure (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+            age = Field(Integer)
+
+        f = Person.age > 10
+
+        self.assertTrue(isinstance(f, Condition))
+        self.assertTrue(f.field is Person.age)
+        self.assertEqual(f.operator, '__gt__')
+        self.assertEqual(f.value, 10)
+
+        f = Person.firstname.startswith('Ho')
+
+        self.assertTrue(isinstance(f, Condition))
+        self.assertTrue(f.field is Person.firstname)
+        self.assertEqual(f.operator, 'startswith')
+        self.assertEqual(f.value, 'Ho')
+
+        self.assertRaises(ValueError, Condition, Person.age, 'between', 1)
+
+    def test_compound_structure (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+            age = Field(Integer)
+
+        custom = Filter(lambda x: x.age % 2 == 0)
+        f = custom & (Person.age > 10) & (Person.firstname == 'Homer')
+
+        self.assertTrue(isinstance(f, And))
+        self.assertEqual(len(f.filters), 3)
+        self.assertEqual(f.filters[0].operator, '__eq__')
+        self.assertEqual(f.filters[1].operator, '__gt__')
+        self.assertTrue(f.filters[2] is custom)
+
+        f = (Person.age > 10) | (Person.age < 5) | (Person.age == 7)
+
+        self.assertTrue(isinstance(f, Or))
+        self.assertEqual(len(f.filters), 3)
+
+        f = ~(Person.age > 10)
+
+        self.assertTrue(isinstance(f, Not))
+        self.assertEqual(f.filter.operator, '__gt__')
+        self.assertTrue(isinstance(~f, Condition))
+
+    def test_relation_structure (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        class Account (Entity):
+            login = Field(String, primary_key=True)
+            person = Field(OneToOne, entity=Person)
+
+        f = Account.person.has(Person.firstname == 'Homer')
+
+        self.assertTrue(isinstance(f, Relation))
+        self.assertTrue(f.field is Account.person)
+        self.assertEqual(f.quantifier, 'has')
+        self.assertEqual(f.filter.filters[0].value, 'Homer')
+
+        self.assertTrue(((Account.login == 'h') & f).filters[0].field is
+                        Account.login)
+
+    def test_filters_are_callable (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+            age = Field(Integer)
+
+        p1 = Person(pk=1, firstname='Homer', age=36)
+
+        self.assertTrue((Person.age > 10)(p1))
+        self.assertFalse((Person.age < 10)(p1))
+        self.assertTrue(((Person.age > 10) & Person.firstname.contains('om'))(p1))
+        self.assertTrue(((Person.age < 10) | Person.firstname.endswith('er'))(p1))
+        self.assertFalse((~(Person.age > 10))(p1))
+
+    def test_filter_by_function (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        p1 = Person(pk=1, firstname='Homer')
+        p2 = Person(pk=2, firstname='Bart')
+
+        q = Query(Person)
+
+        self.assertEqual(q.filter_by(lambda x: x.firstname == 'Bart').all(),
+                         [p2])
+        self.assertEqual(q.filter_by(Person.pk == 1,
+                                     lambda x: x.firstname == 'Bart').all(),
+                         [])
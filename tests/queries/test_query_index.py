@@ -0,0 +1,274 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+from tesql.query import Index, Query
+
+
+class TestIndex (TestCase):
+
+    def test_index_lookup (self):
+        index = Index()
+        index.add(1, u'Homer')
+        index.add(2, u'Bart')
+        index.add(3, u'Barney')
+        index.add(4, u'Homer')
+
+        self.assertEqual(index.lookup('__eq__', u'Homer'), set([1, 4]))
+        self.assertEqual(index.lookup('__eq__', u'Marge'), set())
+        self.assertEqual(index.lookup('__lt__', u'Bart'), set([3]))
+        self.assertEqual(index.lookup('__le__', u'Bart'), set([2, 3]))
+        self.assertEqual(index.lookup('__gt__', u'Bart'), set([1, 4]))
+        self.assertEqual(index.lookup('__ge__', u'Bart'), set([1, 2, 4]))
+        self.assertEqual(index.lookup('startswith', u'Bar'), set([2, 3]))
+        self.assertEqual(index.lookup('contains', u'ar'), None)
+
+        index.add(1, u'Marge')
+        self.assertEqual(index.lookup('__eq__', u'Homer'), set([4]))
+        self.assertEqual(index.lookup('__gt__', u'Homer'), set([1]))
+
+        index.remove(4)
+        self.assertEqual(index.lookup('__eq__', u'Homer'), set())
+        self.assertEqual(len(index), 3)
+
+
+class TestQueryIndex (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+    def test_index_from_disk (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+            age = Field(Integer, index=True)
+
+        p1 = Person(pk=1, firstname='Homer', age=36)
+        p2 = Person(pk=2, firstname='Bart', age=10)
+        p3 = Person(pk=3, firstname='Barney', age=38)
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertTrue(os.path.isfile(os.path.join(self.path,
+                                                    'Person.firstname.idx')))
+        self.assertTrue(os.path.isfile(os.path.join(self.path,
+                                                    'Person.age.idx')))
+
+        q = Query(Person)
+
+        self.assertEqual(q.filter_by(Person.firstname == 'Bart').all(), [p2])
+        self.assertEqual(Session.default._cache.keys(), [('Person', 2)])
+
+        self.assertEqual(q.filter_by(Person.firstname.startswith('Bar')
+                                     ).sort_by(Person.pk.ascending).all(),
+                         [p2, p3])
+        self.assertEqual(q.filter_by(Person.age > 30, Person.age <= 36).all(),
+                         [p1])
+        self.assertEqual(q.filter_by((Person.age < 20) |
+                                     (Person.firstname == 'Barney')
+                                     ).sort_by(Person.pk.ascending).all(),
+                         [p2, p3])
+        self.assertEqual(q.filter_by(Person.firstname == 'Marge').one(), None)
+
+    def test_index_with_changed_instances (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        p1 = Person(pk=1, firstname='Homer')
+        p2 = Person(pk=2, firstname='Bart')
+
+        Session.default.commit()
+
+        p3 = Person(pk=3, firstname='Homer')
+        p2.firstname = 'Homer'
+
+        q = Query(Person)
+
+        self.assertEqual(q.filter_by(Person.firstname == 'Homer'
+                                     ).sort_by(Person.pk.ascending).all(),
+                         [p1, p2, p3])
+        self.assertEqual(q.filter_by(Person.firstname == 'Bart').all(), [])
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(q.filter_by(Person.firstname == 'Homer'
+                                     ).sort_by(Person.pk.ascending).all(),
+                         [p1, p2, p3])
+        self.assertEqual(q.filter_by(Person.firstname == 'Bart').all(), [])
+
+    def test_index_skips_listing (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        for i, name in enumerate(['Homer', 'Bart', 'Homer', 'Lisa']):
+            Person(pk=i, firstname=name)
+        Session.default.commit()
+
+        p0 = Person.get(0)
+        Session.default.delete(Person.get(2))
+        p4 = Person(pk=4, firstname='Homer')
+
+        def list_primary_keys (entity):  # pragma: no cover
+            raise AssertionError('all the rows listed')
+
+        Session.default.list_primary_keys = list_primary_keys
+        try:
+            self.assertEqual(Query(Person).filter_by(
+                                Person.firstname == 'Homer').all(),
+                             [p0, p4])
+        finally:
+            del Session.default.list_primary_keys
+
+    def test_index_rebuilt_when_stale (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        p1 = Person(pk=1, firstname='Homer')
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        fileobj = open(os.path.join(self.path, 'Person', '2.conf'), 'w')
+        fileobj.write('[Person]\npk: 2\nfirstname: Bart\n')
+        fileobj.close()
+        os.utime(os.path.join(self.path, 'Person'), (0, 0))
+
+        q = Query(Person)
+
+        self.assertEqual(q.filter_by(Person.firstname == 'Bart').one().pk, 2)
+        self.assertEqual(q.filter_by(Person.firstname == 'Homer').one(), p1)
+
+    def test_index_file_rewritten_in_place (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        Person(pk=1, firstname='Homer')
+        Person(pk=2, firstname='Bart')
+
+        Session.default.commit()
+        self.assertEqual(Person.get_by(Person.firstname == 'Homer').pk, 1)
+        Session.default.expunge()
+
+        # Rewriting a file in place leaves the directory as it was
+        fileobj = open(os.path.join(self.path, 'Person', '1.conf'), 'w')
+        fileobj.write('[Person]\npk: 1\nfirstname: Marge\n')
+        fileobj.close()
+
+        q = Query(Person)
+
+        self.assertEqual([x.pk for x in
+                          q.filter_by(Person.firstname == 'Marge').all()], [1])
+        self.assertEqual(q.filter_by(Person.firstname == 'Homer').all(), [])
+
+    def test_index_appended_on_commit (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        location = os.path.join(self.path, 'Person.firstname.idx')
+
+        for i in xrange(10):
+            Person(pk=i, firstname='Homer')
+        Session.default.commit()
+        self.assertEqual(len(Person.query.filter_by(
+                                Person.firstname == 'Homer').all()), 10)
+
+        before = open(location).read()
+        self.assertEqual(len(before.splitlines()), 11)
+
+        Person.get(3).firstname = 'Bart'
+        Session.default.commit()
+
+        after = open(location).read()
+        self.assertTrue(after.startswith(before))
+        self.assertEqual(len(after.splitlines()), 12)
+
+        Session.default.expunge()
+
+        self.assertEqual([x.pk for x in Person.query.filter_by(
+                                Person.firstname == 'Bart').all()], [3])
+        self.assertEqual(len(Person.query.filter_by(
+                                Person.firstname == 'Homer').all()), 9)
+
+    def test_index_not_writable (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String, index=True)
+
+        for i, name in enumerate(['Homer', 'Bart', 'Lisa']):
+            Person(pk=i, firstname=name)
+        Session.default.commit()
+        Session.default.expunge()
+        Session.default.bind(self.path)
+
+        # Writing the index fails, as on a database only readable here
+        location = os.path.join(self.path, 'Person.firstname.idx')
+        os.unlink(location)
+        os.mkdir(location)
+
+        self.assertEqual(Person.get_by(Person.firstname == 'Lisa').pk, 2)
+        self.assertEqual(Person.get_by(Person.firstname == 'Bart').pk, 1)
+
+        Person(pk=3, firstname='Maggie')
+        Session.default.commit()
+        self.assertEqual(Person.get_by(Person.firstname == 'Maggie').pk, 3)
+
+    def test_index_singleton_location (self):
+        class Settings (Entity):
+            pk = Field(Integer, primary_key=True, choices=[0])
+            theme = Field(String, index=True)
+
+        Session.default.bind_entity(Settings,
+                                    os.path.join(self.path, 'etc', 'app'))
+
+        Settings(pk=0, theme='dark')
+        Session.default.commit()
+
+        self.assertEqual(Settings.query.filter_by(
+                                Settings.theme == 'dark').one().pk, 0)
+        self.assertEqual(os.listdir(os.path.join(self.path, 'etc')),
+                         ['app.conf'])
+        self.assertFalse([x for x in os.listdir(self.path)
+                          if x.endswith('.idx') or x.endswith('.seq')])
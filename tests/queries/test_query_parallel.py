@@ -0,0 +1,97 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+from tesql.query import Query
+
+class TestQueryParallel (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session(threads=4).be_default()
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+        Session().be_default()
+
+    def test_parallel_scans (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            age = Field(Integer)
+
+        for i in xrange(200):
+            Person(pk=i, age=(i * 7) % 100)
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        self.assertEqual(Session.default.threads, 4)
+
+        q = Query(Person)
+        self.assertEqual([x.pk for x in q.all()], range(200))
+        self.assertTrue(Session.default._pool != None)
+
+        Session.default.expunge()
+        self.assertEqual([x.pk for x in q.filter_by(Person.age < 7).all()],
+                         [i for i in xrange(200) if (i * 7) % 100 < 7])
+
+        Session.default.expunge()
+        self.assertEqual([x.age for x in q.sort_by(Person.age.descending,
+                                                   Person.pk.ascending
+                                                   ).range(stop=3)],
+                         [99, 99, 98])
+
+    def test_parallel_filter_processes (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            age = Field(Integer)
+
+        for i in xrange(100):
+            Person(pk=i, age=(i * 7) % 100)
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        q = Query(Person).filter_by(lambda x: x.age % 10 == 3,
+                                    Person.age > 50).parallel(3)
+
+        self.assertEqual(list(q), [(Person, i) for i in xrange(100)
+                                   if (i * 7) % 100 in (53, 63, 73, 83, 93)])
+        self.assertEqual(Session.default._cache.keys(), [])
+        self.assertEqual([x.age for x in q.sort_by(Person.age.ascending
+                                                   ).all()],
+                         [53, 63, 73, 83, 93])
@@ -0,0 +1,118 @@
+# Copyright (C) 2010 - Yuri Vasilevski <yvasilev@gentoo.org>
+#
+#    This file is part of tesql.
+#
+#    tesql is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+
+from tesql.orm import *
+from tesql.types import *
+
+from tesql.query import Query
+
+
+class TestQueryPrefetch (TestCase):
+
+    def setUp (self):
+        self.path = '/tmp/test.tesqldb'
+        Session.default.bind(self.path)
+        Session.default.expunge()
+        if os.path.lexists(self.path):  # pragma: no cover
+            raise EnvironmentError("Unable to run tests because temporary "
+                                   "dir '%s' exists" % self.path)
+
+    def tearDown (self):
+        if os.path.lexists(self.path):
+            for dirpath, dirnames, filenames in os.walk(self.path, topdown=False):
+                for name in filenames:
+                    os.unlink(os.path.join(dirpath, name))
+
+                for name in dirnames:
+                    os.rmdir(os.path.join(dirpath, name))
+
+            os.rmdir(self.path)
+
+
+    def test_get_many (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+
+        Person(pk=1, firstname='Homer')
+        Person(pk=2, firstname='Bart')
+        Person(pk=3, firstname='Lisa')
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        p2 = Person.get(2)
+        res = Session.default.get_many(Person, [3, 2, 1, 3])
+
+        self.assertEqual([x.firstname for x in res],
+                         ['Lisa', 'Bart', 'Homer', 'Lisa'])
+        self.assertTrue(res[1] is p2)
+        self.assertTrue(res[0] is res[3])
+        self.assertTrue(Session.default.is_cached(Person, 1))
+        self.assertRaises(IOError, Session.default.get_many, Person, [4])
+
+    def test_prefetch_references (self):
+        class Account (Entity):
+            pk = Field(Integer, primary_key=True)
+            login = Field(String)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+            accounts = Field(ManyToMany, entity=Account)
+
+        a = [Account(pk=i, login='login%d' % i) for i in xrange(6)]
+        Person(pk=1, firstname='Homer', accounts=a[:3])
+        Person(pk=2, firstname='Bart', accounts=a[2:5])
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        res = Query(Person).sort_by(Person.pk.ascending
+                                    ).prefetch(Person.accounts).all()
+
+        self.assertEqual([x.pk for x in res], [1, 2])
+        self.assertEqual(sorted(k for k in Session.default._cache.keys()
+                                if k[0] == 'Account'),
+                         [('Account', i) for i in xrange(5)])
+        self.assertEqual([x.login for x in res[1].accounts],
+                         ['login2', 'login3', 'login4'])
+
+    def test_iterate_references_in_batch (self):
+        class Account (Entity):
+            pk = Field(Integer, primary_key=True)
+            login = Field(String)
+
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            accounts = Field(ManyToMany, entity=Account)
+
+        Person(pk=1, accounts=[Account(pk=i, login='login%d' % i)
+                               for i in xrange(10)])
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        p1 = Person.get(1)
+        self.assertEqual(p1.accounts[9].login, 'login9')
+        self.assertEqual(len([k for k in Session.default._cache.keys()
+                              if k[0] == 'Account']), 10)
+        self.assertEqual([x.pk for x in p1.accounts], range(10))
@@ -195,3 +195,48 @@ class TestQueryRange (TestCase):
                          stop=3, step=2), [p2])
         self.assertEqual(q.sort_by(Person.pk.descending).range(start=1,
                          stop=2, step=2), [p2])
+
+    def test_limit_offset (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+            surname = Field(String)
+
+        p1 = Person(pk=1, firstname='Homer', surname='Simpson')
+        p2 = Person(pk=2, firstname='Bart', surname='Simpson')
+        p3 = Person(pk=3, firstname='Carl', surname='Carlson')
+
+        q = Query(Person).sort_by(Person.pk.ascending)
+
+        self.assertEqual(q.limit(2).all(), [p1, p2])
+        self.assertEqual(q.offset(1).all(), [p2, p3])
+        self.assertEqual(q.offset(1).limit(1).all(), [p2])
+        self.assertEqual(q.limit(2).offset(1).all(), [p2])
+        self.assertEqual(q.offset(3).one(), None)
+        self.assertEqual(q.limit(0).all(), [])
+
+        self.assertEqual(q.range(start=-2), [p2, p3])
+        self.assertEqual(q.range(start=-1, step=-2), [p3, p1])
+
+    def test_range_loads_only_selected_rows (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+            surname = Field(String)
+
+        for i in xrange(10):
+            Person(pk=i, firstname='Homer', surname='Simpson')
+
+        Session.default.commit()
+        Session.default.expunge()
+
+        rows = Query(Person).range(start=1, stop=7, step=3)
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(sorted(Session.default._cache.keys()),
+                         sorted(('Person', x.pk) for x in rows))
+
+        Session.default.expunge()
+
+        self.assertEqual(len(Query(Person).limit(3).all()), 3)
+        self.assertEqual(len(Session.default._cache.keys()), 3)
@@ -132,3 +132,48 @@ class TestQuerySortBy (TestCase):
                                    Person.firstname.ascending).all(), [p2, p1, p3])
         self.assertEqual(q.sort_by(Person.surname.descending,
                                    Person.firstname.descending).all(), [p1, p2, p3])
+
+    def test_sorted_by_top_rows (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+            surname = Field(String)
+
+        p1 = Person(pk=1, firstname='Homer', surname='Simpson')
+        p2 = Person(pk=2, firstname='Bart', surname='Simpson')
+        p3 = Person(pk=3, firstname='Carl', surname='Carlson')
+        p4 = Person(pk=4, firstname='Lisa', surname='Simpson')
+
+        q = Query(Person)
+
+        self.assertEqual(q.sort_by(Person.surname.descending).one(), p1)
+        self.assertEqual(q.sort_by(Person.surname.ascending).one(), p3)
+        self.assertEqual(q.sort_by(Person.surname.descending).limit(2).all(),
+                         [p1, p2])
+        self.assertEqual(q.sort_by(Person.surname.descending,
+                                   Person.firstname.ascending).range(start=1,
+                                   stop=3), [p1, p4])
+        self.assertEqual(q.sort_by(Person.surname.ascending,
+                                   Person.firstname.descending).limit(3).all(),
+                         [p3, p4, p1])
+
+    def test_sorted_by_function (self):
+        class Person (Entity):
+            pk = Field(Integer, primary_key=True)
+            firstname = Field(String)
+            surname = Field(String)
+
+        p1 = Person(pk=1, firstname='Homer', surname='Simpson')
+        p2 = Person(pk=2, firstname='Bart', surname='Simpson')
+        p3 = Person(pk=3, firstname='Carl', surname='Carlson')
+
+        by_length = lambda x, y: cmp(len(x.firstname), len(y.firstname))
+
+        q = Query(Person)
+
+        self.assertEqual(q.sort_by(by_length, Person.pk.ascending).all(),
+                         [p2, p3, p1])
+        self.assertEqual(q.sort_by(by_length, Person.pk.descending).all(),
+                         [p3, p2, p1])
+        self.assertEqual(q.sort_by(Person.surname.descending, by_length).one(),
+                         p2)